@@ -0,0 +1,57 @@
+import os
+import random
+
+# Synthetic news-like corpus: each document is drawn mostly from one topic's
+# vocabulary plus common words, so clustering, keyword and vector search have
+# structure to find. Generation is seeded, so a size always yields the same
+# corpus.
+COMMON_WORDS = (
+    "the market report said on monday that analysts expect growth in the coming quarter while "
+    "investors remain cautious about rates inflation and the broader economy according to sources"
+).split()
+
+TOPICS = {
+    "energy": "oil gas crude opec barrel refinery pipeline drilling brent output shale solar wind grid".split(),
+    "tech": "chip semiconductor nvidia cloud software ai model datacenter gpu startup platform apple".split(),
+    "finance": "bank loan credit bond yield fed treasury deposit lender mortgage capital dividend".split(),
+    "auto": "tesla ev battery vehicle factory deliveries charging autonomous model sedan recall".split(),
+    "health": "drug vaccine trial fda patients hospital pharma biotech approval dose clinical".split(),
+    "retail": "consumer sales store ecommerce holiday shoppers inventory walmart amazon prices".split(),
+}
+
+QUERIES = [
+    "What did OPEC decide about oil output?",
+    "How are chip makers doing with AI datacenter demand?",
+    "What is the Fed doing with treasury yields?",
+    "How many deliveries did Tesla report?",
+    "Which drug trials got FDA approval?",
+    "How were holiday retail sales?",
+]
+
+
+def make_documents(count, words_per_document=400, seed=0):
+    """Returns count synthetic document texts."""
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    documents = []
+    for i in range(count):
+        vocabulary = TOPICS[topics[i % len(topics)]]
+        words = [
+            rng.choice(vocabulary) if rng.random() < 0.4 else rng.choice(COMMON_WORDS)
+            for _ in range(words_per_document)
+        ]
+        sentences = [" ".join(words[j:j + 15]).capitalize() + "." for j in range(0, len(words), 15)]
+        documents.append(f"Article {i} ({topics[i % len(topics)]}). " + " ".join(sentences))
+    return documents
+
+
+def write_documents(directory, documents):
+    """Writes documents as .txt files and returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, text in enumerate(documents):
+        path = os.path.join(directory, f"article_{i:06d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        paths.append(path)
+    return paths
@@ -0,0 +1,179 @@
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Deterministic stand-in for llama-server, serving the three endpoints the
+# backend calls, so benchmarks measure our code rather than the models:
+#
+#   POST /embeddings         bag-of-words hashing embeddings (texts sharing
+#                            words get similar vectors)
+#   POST /rerank             word-overlap relevance scores
+#   POST /chat/completions   a fixed answer, optionally streamed per word
+#
+# Each request sleeps latency seconds plus per_item_latency for every text
+# embedded or reranked (or every token streamed).
+_WORD_RE = re.compile(r"\w+")
+ANSWER = "This is a benchmark answer generated by the fake llama-server."
+
+
+def _words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+class FakeLlamaServer:
+    """Threaded HTTP server imitating llama-server; use as a context manager."""
+
+    def __init__(self, host="127.0.0.1", port=0, dimension=384, latency=0.0, per_item_latency=0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.requests = 0
+        self._word_vectors = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llama-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def embed(self, text):
+        """Returns the unit-length embedding of a text."""
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in _words(text):
+            vector += self._word_vector(word)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            vector[0] = norm = 1.0
+        return (vector / norm).tolist()
+
+    def _word_vector(self, word):
+        with self._lock:
+            vector = self._word_vectors.get(word)
+            if vector is None:
+                seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:8], "little")
+                vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+                self._word_vectors[word] = vector
+            return vector
+
+    @staticmethod
+    def relevance(query, document):
+        """Returns the share of the query's words found in the document."""
+        query_words = set(_words(query))
+        if not query_words:
+            return 0.0
+        return len(query_words & set(_words(document))) / len(query_words)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; avoid delayed-ACK stalls
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                with server._lock:
+                    server.requests += 1
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                path = self.path.rstrip("/")
+                if path.endswith("/embeddings"):
+                    self._embeddings(body)
+                elif path.endswith("/rerank"):
+                    self._rerank(body)
+                elif path.endswith("/chat/completions"):
+                    self._chat(body)
+                else:
+                    self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+            def _embeddings(self, body):
+                texts = body.get("input", [])
+                if isinstance(texts, str):
+                    texts = [texts]
+                time.sleep(server.latency + server.per_item_latency * len(texts))
+                self._send_json(200, {
+                    "data": [{"index": i, "embedding": server.embed(text)} for i, text in enumerate(texts)]
+                })
+
+            def _rerank(self, body):
+                documents = body.get("documents", [])
+                time.sleep(server.latency + server.per_item_latency * len(documents))
+                self._send_json(200, {"results": [
+                    {"index": i, "relevance_score": server.relevance(body.get("query", ""), document)}
+                    for i, document in enumerate(documents)
+                ]})
+
+            def _chat(self, body):
+                time.sleep(server.latency)
+                if not body.get("stream"):
+                    self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": ANSWER}}]})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for word in ANSWER.split(" "):
+                    time.sleep(server.per_item_latency)
+                    chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fake llama-server used by the benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--per-item-latency", type=float, default=0.0,
+                        help="seconds added per text embedded or reranked, or per token streamed")
+    args = parser.parse_args()
+    server = FakeLlamaServer(args.host, args.port, args.dimension, args.latency, args.per_item_latency)
+    print(f"Fake llama-server listening on {server.url} "
+          f"(EMBEDDING_URL={server.url}/embeddings, RERANKING_URL={server.url}/rerank, "
+          f"LLM_URL={server.url}/chat/completions)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
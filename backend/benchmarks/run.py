@@ -0,0 +1,279 @@
+import os
+import sys
+import random
+import json
+import time
+import logging
+import platform
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timezone
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from backend.app import create_app
+from backend.config import Config
+from backend.models import db, User, ClusterState
+from backend.services.answer_cache import answer_cache
+from backend.services.rerank_cache import rerank_cache
+from backend.services.index_cache import index_cache
+from backend.services.index_factory import build_index, configure_search
+from backend.services.embedding import LlamaServerEmbeddings
+from backend.services.custom_cross_encoder import LlamaServerCrossEncoder
+from backend.services.vector_store import build_segment, publish_segment, load_user_vector_store
+from backend.services.knowledge_base import add_document_to_kb, compact_user_index, DuplicateDocumentError
+from backend.services.search import perform_search, generate_keyword_report
+from backend.services.clustering import generate_cluster_report
+from backend.services.dedup import find_near_duplicate, record_fingerprint
+from benchmarks.corpus import QUERIES, make_documents, write_documents
+from benchmarks.fake_llama_server import FakeLlamaServer
+
+# Component benchmarks of ingestion, search and reports against the fake
+# llama-server, run from the backend directory:
+#
+#   PYTHONPATH=src python -m benchmarks.run --sizes 100,1000 --output results.json
+#   PYTHONPATH=src python -m benchmarks.run --baseline baseline.json
+#
+# Each result is keyed "<benchmark>[n=<documents>]" and records the median
+# wall time over --repeat runs and the resulting throughput. With --baseline,
+# medians more than --tolerance slower than the baseline's are reported and
+# the exit status is 1.
+SEARCH_QUERIES = 20
+RERANK_CANDIDATES = 10
+# Near-duplicate lookups run against this many stored fingerprints per
+# document of the corpus size, as feeds accumulate far more articles
+DEDUP_FINGERPRINTS_PER_DOCUMENT = 100
+DEDUP_PROBES = 100
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Serves embeddings computed earlier, to time index work on its own."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def measure(fn, items=1, repeat=3, setup=None):
+    """Times fn() repeat times and returns the median and throughput."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        "seconds": median,
+        "min_seconds": min(times),
+        "repeat": repeat,
+        "items": items,
+        "items_per_second": items / median if median else None,
+    }
+
+
+def bench_components(size, workdir, repeat):
+    """Benchmarks chunking, embedding, indexing and reranking on their own."""
+    results = {}
+    texts = make_documents(size)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    documents = [Document(page_content=text) for text in texts]
+    chunks = splitter.split_documents(documents)
+    chunk_texts = [chunk.page_content for chunk in chunks]
+    results["chunking"] = measure(lambda: splitter.split_documents(documents), len(chunks), repeat)
+
+    embeddings = LlamaServerEmbeddings()
+    results["embedding"] = measure(lambda: embeddings.embed_documents(chunk_texts), len(chunks), repeat)
+
+    vectors = np.array(embeddings.embed_documents(chunk_texts), dtype=np.float32)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), SEARCH_QUERIES)]
+    for index_type in ("flat", "hnsw", "ivfpq"):
+        results[f"index_build_{index_type}"] = measure(lambda: build_index(vectors, index_type), len(chunks), repeat)
+        index = configure_search(build_index(vectors, index_type))
+        results[f"faiss_search_{index_type}"] = measure(
+            lambda: [index.search(query[None, :], 10) for query in queries], SEARCH_QUERIES, repeat
+        )
+
+    precomputed = PrecomputedEmbeddings(dict(zip(chunk_texts, vectors.tolist())))
+    ids = [f"chunk_{i}" for i in range(len(chunks))]
+    segment = build_segment(chunks, ids, precomputed)
+    # Each run publishes into a new directory, so every index holds the
+    # chunks once, in a single segment
+    index_paths = []
+
+    def new_index_path():
+        index_paths.append(os.path.join(workdir, f"segments_{size}_{len(index_paths)}"))
+    results["index_save"] = measure(
+        lambda: publish_segment(index_paths[-1], segment), len(chunks), repeat, setup=new_index_path
+    )
+    index_path = index_paths[-1]
+    results["index_load"] = measure(
+        lambda: load_user_vector_store(index_path, precomputed), len(chunks), repeat, setup=index_cache.clear
+    )
+
+    reranker = LlamaServerCrossEncoder()
+    store = load_user_vector_store(index_path, precomputed)
+    candidates = [
+        [store.get_chunk(segment, position) for _, segment, position in store.search_ids(query.tolist(), RERANK_CANDIDATES)]
+        for query in queries[:len(QUERIES)]
+    ]
+    results["rerank"] = measure(
+        lambda: [reranker.compress_documents(docs, query) for docs, query in zip(candidates, QUERIES)],
+        len(candidates), repeat, setup=rerank_cache.clear
+    )
+    return results
+
+
+def bench_pipeline(size, workdir, repeat):
+    """Benchmarks ingestion, search and reports through the services."""
+    results = {}
+    user = User(username=f"benchmark_{size}", password_hash="-")
+    db.session.add(user)
+    db.session.commit()
+    paths = write_documents(os.path.join(workdir, f"documents_{size}"), make_documents(size))
+
+    def ingest():
+        for path in paths:
+            try:
+                add_document_to_kb(user.id, path, "txt", source="benchmark")
+            except DuplicateDocumentError:
+                pass
+    # Documents can only be added once, so ingestion runs a single time
+    results["add_document_to_kb"] = measure(ingest, len(paths), repeat=1)
+    results["compaction"] = measure(lambda: compact_user_index(user.id), len(paths), repeat=1)
+
+    queries = [QUERIES[i % len(QUERIES)] + f" ({i})" for i in range(SEARCH_QUERIES)]
+    results["perform_search"] = measure(
+        lambda: [perform_search(user.id, query) for query in queries], len(queries), repeat,
+        setup=lambda: (answer_cache.clear(), rerank_cache.clear(), index_cache.clear())
+    )
+    results["keyword_report"] = measure(lambda: generate_keyword_report(user.id), len(paths), repeat)
+
+    def reset_clusters():
+        ClusterState.query.filter_by(user_id=user.id).delete()
+        db.session.commit()
+    results["cluster_report"] = measure(
+        lambda: generate_cluster_report(user.id), len(paths), repeat, setup=reset_clusters
+    )
+    return results
+
+
+def bench_dedup(size, repeat):
+    """Benchmarks near-duplicate lookups among many stored fingerprints."""
+    rng = random.Random(0)
+    user = User(username=f"benchmark_dedup_{size}", password_hash="-")
+    db.session.add(user)
+    db.session.commit()
+    # Document ids are unique across users; keep clear of the ingested ones
+    first_id = size * 10 ** 9
+    for document_id in range(first_id, first_id + size * DEDUP_FINGERPRINTS_PER_DOCUMENT):
+        record_fingerprint(user.id, document_id, rng.getrandbits(64))
+    db.session.commit()
+    probes = [rng.getrandbits(64) for _ in range(DEDUP_PROBES)]
+    return {"dedup_lookup": measure(
+        lambda: [find_near_duplicate(user.id, probe) for probe in probes], len(probes), repeat
+    )}
+
+
+def compare(results, baseline, tolerance):
+    """Prints results against a baseline and returns the keys that regressed."""
+    regressions = []
+    for key, previous in sorted(baseline["results"].items()):
+        current = results.get(key)
+        if current is None:
+            continue
+        ratio = current["seconds"] / previous["seconds"] if previous["seconds"] else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:40} {previous['seconds']:10.4f}s {current['seconds']:10.4f}s {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def _configure(workdir, server):
+    Config.LLM_URL = f"{server.url}/chat/completions"
+    Config.EMBEDDING_URL = f"{server.url}/embeddings"
+    Config.RERANKING_URL = f"{server.url}/rerank"
+    Config.BING_API_KEY = None
+    Config.FAISS_INDEX_PATH = os.path.join(workdir, "faiss_index")
+    # Measure the embedding path itself rather than cache hits
+    Config.EMBEDDING_CACHE_PATH = ""
+    Config.INGESTION_WORKERS = 0
+    Config.SCHEDULER_ENABLED = False
+    Config.METRICS_DIR = ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the backend component benchmarks.")
+    parser.add_argument("--sizes", default="100,1000", help="comma-separated corpus sizes, in documents")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake llama-server latency per request")
+    parser.add_argument("--per-item-latency", type=float, default=0.0,
+                        help="fake llama-server latency per text embedded or reranked")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown over the baseline reported as a regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, \
+            FakeLlamaServer(dimension=args.dimension, latency=args.latency,
+                            per_item_latency=args.per_item_latency) as server:
+        _configure(workdir, server)
+        config = Config()
+        config.TESTING = True
+        app = create_app(config)
+        logging.getLogger().setLevel(logging.WARNING)
+        with app.app_context():
+            for size in sizes:
+                print(f"Benchmarking {size} documents...", file=sys.stderr)
+                for name, result in bench_components(size, workdir, args.repeat).items():
+                    results[f"{name}[n={size}]"] = result
+                for name, result in bench_pipeline(size, workdir, args.repeat).items():
+                    results[f"{name}[n={size}]"] = result
+                for name, result in bench_dedup(size, args.repeat).items():
+                    results[f"{name}[n={size}]"] = result
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "faiss": faiss.__version__,
+            "sizes": sizes,
+            "repeat": args.repeat,
+            "latency": args.latency,
+            "per_item_latency": args.per_item_latency,
+            "dimension": args.dimension,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
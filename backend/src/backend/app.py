@@ -2,10 +2,9 @@ import os
 import logging
 from flask import Flask
 from flask_mail import Mail
-from apscheduler.schedulers.background import BackgroundScheduler
 from flask_cors import CORS
 
-from backend.models import db
+from backend.models import db, upgrade_schema
 from backend.config import Config
 # Defer blueprint imports until they are needed
 # from backend.auth.routes import auth_bp
@@ -15,6 +14,11 @@ from backend.config import Config
 mail = Mail()
 cors = CORS()
 
+def configure_logging():
+    """Configures the root logger of the web app and the worker process."""
+    logging.basicConfig(level=logging.DEBUG,
+                        format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+
 def create_app(config_class=Config):
     """
     Creates and configures the Flask application.
@@ -22,9 +26,7 @@ def create_app(config_class=Config):
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(config_class)
 
-    # Configure logging
-    logging.basicConfig(level=logging.DEBUG,
-                        format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    configure_logging()
 
     if app.config.get("TESTING"):
         app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
@@ -44,8 +46,10 @@ def create_app(config_class=Config):
     cors.init_app(app, resources={r"/api/*": {"origins": "*"}}) # Example CORS config
 
     with app.app_context():
-        # Create database tables if they don't exist
+        # Create database tables if they don't exist, and add the columns
+        # newer versions need to existing ones
         db.create_all()
+        upgrade_schema()
 
         # Import and register blueprints
         from backend.auth.routes import auth_bp
@@ -53,11 +57,19 @@ def create_app(config_class=Config):
         app.register_blueprint(auth_bp, url_prefix='/api/auth')
         app.register_blueprint(main_bp, url_prefix='/api')
 
-        # Start the scheduler for background tasks
-        from backend.services.aggregation import run_aggregation_for_all_users
-        scheduler = BackgroundScheduler(daemon=True)
-        # Run job every 6 hours
-        scheduler.add_job(run_aggregation_for_all_users, 'interval', hours=6, args=[app])
-        scheduler.start()
+        # Opt-in profiling of single requests and of the whole process
+        from backend.services.profiling import init_request_profiling, start_continuous_profiling
+        init_request_profiling(app)
+        if app.config['PROFILING_CONTINUOUS']:
+            start_continuous_profiling()
+
+        # Start the scheduler for background tasks in one process only
+        if app.config['SCHEDULER_ENABLED']:
+            from backend.services.scheduler import start_scheduler
+            start_scheduler(app)
+
+        # Start the workers that process queued uploads
+        from backend.services.ingestion import start_ingestion_workers
+        start_ingestion_workers(app)
 
     return app
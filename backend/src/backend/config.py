@@ -16,6 +16,24 @@ class Config:
     EMBEDDING_URL = os.environ.get('EMBEDDING_URL')
     RERANKING_URL = os.environ.get('RERANKING_URL')
 
+    # Connection pool shared by the model server clients
+    HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS') or 4)
+    HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE') or 16)
+    # Retries of idempotent model server calls (backoff doubles per attempt)
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES') or 2)
+    HTTP_RETRY_BACKOFF = float(os.environ.get('HTTP_RETRY_BACKOFF') or 0.2)
+    # A backend failing this many calls in a row is skipped for CIRCUIT_RESET_SECONDS
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD') or 5)
+    CIRCUIT_RESET_SECONDS = float(os.environ.get('CIRCUIT_RESET_SECONDS') or 30)
+    # Overall time budget of a search, shared by all the calls it makes
+    SEARCH_DEADLINE_SECONDS = float(os.environ.get('SEARCH_DEADLINE_SECONDS') or 60)
+    LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT') or 120)
+
+    # Embedding requests are split into batches sent concurrently
+    EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE') or 32)
+    EMBEDDING_MAX_CONCURRENCY = int(os.environ.get('EMBEDDING_MAX_CONCURRENCY') or 4)
+    EMBEDDING_TIMEOUT = float(os.environ.get('EMBEDDING_TIMEOUT') or 60)
+
     # Email configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
@@ -24,10 +42,131 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
     ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL')
+    # Notifications are sent by a background thread; queued messages are
+    # sent over one SMTP connection per batch
+    NOTIFICATION_QUEUE_SIZE = int(os.environ.get('NOTIFICATION_QUEUE_SIZE') or 1000)
+    NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE') or 100)
+    # Articles listed in an aggregation digest before it is truncated
+    NOTIFICATION_DIGEST_MAX_ITEMS = int(os.environ.get('NOTIFICATION_DIGEST_MAX_ITEMS') or 200)
 
     # Bing Search API
     BING_SEARCH_URL = os.environ.get('BING_SEARCH_URL')
     BING_API_KEY = os.environ.get('BING_API_KEY')
+    BING_TIMEOUT = float(os.environ.get('BING_TIMEOUT') or 10)
 
     # FAISS Index path
     FAISS_INDEX_PATH = "faiss_index"
+
+    # RSS aggregation: fetch concurrency, per-host politeness, the size of
+    # the queue feeding fetched articles to the ingestion stage and the
+    # timeout of each feed and article request
+    AGGREGATION_MAX_WORKERS = int(os.environ.get('AGGREGATION_MAX_WORKERS') or 16)
+    AGGREGATION_PER_HOST_CONCURRENCY = int(os.environ.get('AGGREGATION_PER_HOST_CONCURRENCY') or 2)
+    AGGREGATION_PER_HOST_DELAY = float(os.environ.get('AGGREGATION_PER_HOST_DELAY') or 0.5)
+    AGGREGATION_QUEUE_SIZE = int(os.environ.get('AGGREGATION_QUEUE_SIZE') or 100)
+    AGGREGATION_FETCH_TIMEOUT = float(os.environ.get('AGGREGATION_FETCH_TIMEOUT') or 10)
+
+    # Near-duplicate detection: documents whose SimHash fingerprints differ
+    # by at most DEDUP_MAX_DISTANCE bits (0-3) are not ingested again
+    DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', 'True').lower() not in ('0', 'false', 'no')
+    DEDUP_MAX_DISTANCE = int(os.environ.get('DEDUP_MAX_DISTANCE') or 3)
+
+    # Background workers processing queued uploads (0 processes them inline)
+    INGESTION_WORKERS = int(os.environ.get('INGESTION_WORKERS') or 2)
+    INGESTION_POLL_SECONDS = float(os.environ.get('INGESTION_POLL_SECONDS') or 2)
+    INGESTION_JOB_TIMEOUT_SECONDS = int(os.environ.get('INGESTION_JOB_TIMEOUT_SECONDS') or 1800)
+    INGESTION_MAX_ATTEMPTS = int(os.environ.get('INGESTION_MAX_ATTEMPTS') or 3)
+
+    # How often vectors of deleted documents are compacted out of the indexes
+    # and small index segments are merged
+    KB_COMPACTION_INTERVAL_MINUTES = int(os.environ.get('KB_COMPACTION_INTERVAL_MINUTES') or 30)
+    # Segments with fewer vectors than this are merged once there are
+    # KB_SEGMENT_MERGE_MIN_SEGMENTS of them
+    KB_SEGMENT_MERGE_THRESHOLD = int(os.environ.get('KB_SEGMENT_MERGE_THRESHOLD') or 10000)
+    KB_SEGMENT_MERGE_MIN_SEGMENTS = int(os.environ.get('KB_SEGMENT_MERGE_MIN_SEGMENTS') or 8)
+    # HNSW segments can't remove vectors in place, so their deleted chunks
+    # are filtered out at query time until this fraction of a segment is
+    # deleted, and only then is it rebuilt
+    KB_HNSW_REBUILD_DELETED_RATIO = float(os.environ.get('KB_HNSW_REBUILD_DELETED_RATIO') or 0.2)
+
+    # Scheduled jobs (aggregation, compaction) run in the one process holding
+    # SCHEDULER_LOCK_FILE (default: scheduler.lock in the instance folder);
+    # the others retry every SCHEDULER_LEADER_RETRY_SECONDS. Disable it on the
+    # web servers when the jobs run in `python -m backend.worker` instead
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'True').lower() not in ('0', 'false', 'no')
+    SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE', '')
+    SCHEDULER_LEADER_RETRY_SECONDS = float(os.environ.get('SCHEDULER_LEADER_RETRY_SECONDS') or 30)
+
+    # FAISS index type by knowledge base size: flat (exact) below
+    # INDEX_HNSW_THRESHOLD vectors, HNSW below INDEX_IVFPQ_THRESHOLD and
+    # IVF-PQ above. Raising INDEX_HNSW_EF_SEARCH or INDEX_IVF_NPROBE improves
+    # recall at the cost of query latency
+    INDEX_HNSW_THRESHOLD = int(os.environ.get('INDEX_HNSW_THRESHOLD') or 100000)
+    INDEX_IVFPQ_THRESHOLD = int(os.environ.get('INDEX_IVFPQ_THRESHOLD') or 1000000)
+    INDEX_HNSW_M = int(os.environ.get('INDEX_HNSW_M') or 32)
+    INDEX_HNSW_EF_CONSTRUCTION = int(os.environ.get('INDEX_HNSW_EF_CONSTRUCTION') or 200)
+    INDEX_HNSW_EF_SEARCH = int(os.environ.get('INDEX_HNSW_EF_SEARCH') or 64)
+    INDEX_IVF_NLIST = int(os.environ.get('INDEX_IVF_NLIST') or 0)  # 0 picks 4 * sqrt(vectors)
+    INDEX_IVF_NPROBE = int(os.environ.get('INDEX_IVF_NPROBE') or 16)
+    INDEX_PQ_M = int(os.environ.get('INDEX_PQ_M') or 32)
+
+    # In-process cache of loaded FAISS index segments (per worker), so the
+    # entry limit counts segments, not users. Segments are memory-mapped, so
+    # workers share their pages through the page cache
+    INDEX_MMAP_ENABLED = os.environ.get('INDEX_MMAP_ENABLED', 'True').lower() not in ('0', 'false', 'no')
+    INDEX_CACHE_MAX_ENTRIES = int(os.environ.get('INDEX_CACHE_MAX_ENTRIES') or 512)
+    INDEX_CACHE_MAX_BYTES = int(os.environ.get('INDEX_CACHE_MAX_BYTES') or 512 * 1024 * 1024)
+
+    # Hybrid retrieval: vector hits are fused with SEARCH_LEXICAL_K BM25
+    # keyword hits and the best SEARCH_RERANK_CANDIDATES go to the reranker
+    HYBRID_SEARCH_ENABLED = os.environ.get('HYBRID_SEARCH_ENABLED', 'True').lower() not in ('0', 'false', 'no')
+    SEARCH_LEXICAL_K = int(os.environ.get('SEARCH_LEXICAL_K') or 10)
+    SEARCH_RERANK_CANDIDATES = int(os.environ.get('SEARCH_RERANK_CANDIDATES') or 10)
+
+    # Reranking: candidates are cut to RERANK_MAX_TOKENS (estimated), scores
+    # are cached per (query, chunk), and only the best RERANK_TOP_N reach the
+    # LLM prompt (0 keeps all)
+    RERANKING_TIMEOUT = float(os.environ.get('RERANKING_TIMEOUT') or 30)
+    RERANK_MAX_TOKENS = int(os.environ.get('RERANK_MAX_TOKENS') or 512)
+    RERANK_TOP_N = int(os.environ.get('RERANK_TOP_N') or 0)
+    RERANK_CACHE_MAX_ENTRIES = int(os.environ.get('RERANK_CACHE_MAX_ENTRIES') or 50000)
+
+    # Cluster report: MiniBatchKMeans over per-document mean embeddings. New
+    # documents are added to the cached model with partial_fit until they
+    # exceed CLUSTER_REFIT_RATIO of the documents it was fitted on
+    CLUSTER_BATCH_SIZE = int(os.environ.get('CLUSTER_BATCH_SIZE') or 1024)
+    CLUSTER_REFIT_RATIO = float(os.environ.get('CLUSTER_REFIT_RATIO') or 0.5)
+
+    # In-process cache of search answers (per worker), keyed by user, query
+    # and knowledge base version. With ANSWER_CACHE_SEMANTIC, a query whose
+    # embedding has at least ANSWER_CACHE_SIMILARITY_THRESHOLD cosine
+    # similarity to a cached one reuses its answer
+    ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES') or 1000)
+    ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('ANSWER_CACHE_TTL_SECONDS') or 3600)
+    ANSWER_CACHE_SEMANTIC = os.environ.get('ANSWER_CACHE_SEMANTIC', 'False').lower() not in ('0', 'false', 'no')
+    ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get('ANSWER_CACHE_SIMILARITY_THRESHOLD') or 0.95)
+
+    # Disk-backed embedding cache; set EMBEDDING_CACHE_PATH to '' to disable
+    EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', 'embedding_cache.db')
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES') or 500000)
+
+    # Prometheus metrics at /api/metrics. Each worker writes its metrics to
+    # METRICS_DIR every METRICS_FLUSH_SECONDS and a scrape adds them up; set
+    # METRICS_DIR to '' to report only the worker that serves the scrape.
+    # If METRICS_TOKEN is set, scrapes must send it as a bearer token
+    METRICS_DIR = os.environ.get('METRICS_DIR', 'metrics')
+    METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS') or 5)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Debug profiling, saved to PROFILE_DIR. With PROFILING_ENABLED, users
+    # listed in PROFILING_ADMINS (comma-separated usernames) can profile a
+    # request by sending "X-Profile: sample" or "X-Profile: cprofile".
+    # PROFILING_CONTINUOUS samples every thread at a low rate and writes the
+    # aggregated stacks every PROFILING_FLUSH_MINUTES
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False').lower() not in ('0', 'false', 'no')
+    PROFILING_ADMINS = os.environ.get('PROFILING_ADMINS', '')
+    PROFILING_SAMPLE_INTERVAL = float(os.environ.get('PROFILING_SAMPLE_INTERVAL') or 0.005)
+    PROFILING_CONTINUOUS = os.environ.get('PROFILING_CONTINUOUS', 'False').lower() not in ('0', 'false', 'no')
+    PROFILING_CONTINUOUS_INTERVAL = float(os.environ.get('PROFILING_CONTINUOUS_INTERVAL') or 0.1)
+    PROFILING_FLUSH_MINUTES = float(os.environ.get('PROFILING_FLUSH_MINUTES') or 10)
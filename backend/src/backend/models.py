@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, inspect, text
 from werkzeug.security import generate_password_hash, check_password_hash
 import datetime
 
@@ -8,6 +9,13 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
+    # Bumped whenever the user's knowledge base changes, so results derived
+    # from it (e.g. cached answers) can tell they are stale
+    kb_version = db.Column(db.Integer, nullable=False, default=0)
+    # Whether every vector in the user's index has a DocumentChunk row. Off
+    # for users whose index was written before the rows were kept, until
+    # record_legacy_chunks() has added them
+    chunks_recorded = db.Column(db.Boolean, nullable=False, default=True)
     documents = db.relationship('Document', backref='owner', lazy=True, cascade="all, delete-orphan")
     rss_feeds = db.relationship('RssFeed', backref='owner', lazy=True, cascade="all, delete-orphan")
 
@@ -21,6 +29,8 @@ class User(db.Model):
         return f'<User {self.username}>'
 
 class Document(db.Model):
+    # Never reuse ids: chunk tombstones refer to deleted documents by id
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     file_path = db.Column(db.String(256), nullable=False)
@@ -28,14 +38,217 @@ class Document(db.Model):
     source = db.Column(db.String(256), nullable=True)
     tags = db.Column(db.String(256), nullable=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Set once the document's term counts are recorded, which are none for a
+    # document without text, so the keyword report never reads it again
+    terms_indexed = db.Column(db.Boolean, nullable=False, default=False)
 
     def __repr__(self):
         return f'<Document {self.file_path}>'
 
+class DocumentText(db.Model):
+    """
+    Normalized text extracted from a document at ingest time, stored
+    zlib-compressed so reports don't have to re-read and re-parse the
+    original files.
+    """
+    document_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f'<DocumentText {self.document_id}>'
+
+class DocumentTerm(db.Model):
+    """How often a term occurs in a document, for the keyword report."""
+    document_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    term = db.Column(db.String(64), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<DocumentTerm {self.document_id} {self.term}>'
+
+class UserTerm(db.Model):
+    """A term's total count over a user's documents, kept in step with DocumentTerm."""
+    __table_args__ = (db.Index('ix_user_term_user_count', 'user_id', 'count', 'term'),)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, autoincrement=False)
+    term = db.Column(db.String(64), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<UserTerm {self.user_id} {self.term}>'
+
+class ClusterState(db.Model):
+    """
+    A user's last clustering of document embeddings for the cluster report:
+    the pickled MiniBatchKMeans model, each document's label, and the report
+    built from them, valid for kb_version.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, autoincrement=False)
+    kb_version = db.Column(db.Integer, nullable=False)
+    n_clusters = db.Column(db.Integer, nullable=False)
+    model = db.Column(db.LargeBinary, nullable=False)
+    labels = db.Column(db.Text, nullable=False)
+    # Number of documents the model was last fully fitted on
+    fitted_count = db.Column(db.Integer, nullable=False)
+    report = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ClusterState {self.user_id} v{self.kb_version}>'
+
+# document_id of chunks indexed before DocumentChunk rows were kept whose
+# document could not be identified; they stay searchable
+LEGACY_DOCUMENT_ID = 0
+
+class DocumentChunk(db.Model):
+    """
+    Maps a document to the ids of its chunks in the user's FAISS docstore.
+    Rows outlive their document as tombstones until the index is compacted.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    document_id = db.Column(db.Integer, nullable=False, index=True)
+    docstore_id = db.Column(db.String(64), nullable=False, unique=True)
+    deleted = db.Column(db.Boolean, nullable=False, default=False, index=True)
+
+    def __repr__(self):
+        return f'<DocumentChunk {self.docstore_id}>'
+
+# Full-text index of chunk text for keyword (BM25) retrieval. SQLAlchemy
+# can't declare FTS5 virtual tables, so it is created and dropped alongside
+# the other tables. The rowid is the DocumentChunk id and user_key holds
+# "u<user_id>", so a user's chunks are selected by the full-text match.
+CHUNK_FTS_TABLE = "document_chunk_fts"
+event.listen(db.metadata, "after_create", DDL(
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {CHUNK_FTS_TABLE} "
+    "USING fts5(content, user_key, metadata UNINDEXED)"
+).execute_if(dialect="sqlite"))
+event.listen(db.metadata, "before_drop", DDL(
+    f"DROP TABLE IF EXISTS {CHUNK_FTS_TABLE}"
+).execute_if(dialect="sqlite"))
+
+class DocumentFingerprint(db.Model):
+    """
+    SimHash fingerprint of a document's text, split into four 16-bit bands
+    so near-duplicates can be looked up through the band indexes.
+    """
+    __table_args__ = tuple(
+        db.Index(f'ix_document_fingerprint_user_band{i}', 'user_id', f'band{i}') for i in range(4)
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    document_id = db.Column(db.Integer, nullable=False, unique=True)
+    fingerprint = db.Column(db.BigInteger, nullable=False)
+    band0 = db.Column(db.Integer, nullable=False)
+    band1 = db.Column(db.Integer, nullable=False)
+    band2 = db.Column(db.Integer, nullable=False)
+    band3 = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<DocumentFingerprint {self.document_id}>'
+
 class RssFeed(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     url = db.Column(db.String(512), nullable=False)
+    # HTTP validators from the last poll, sent back as a conditional GET
+    etag = db.Column(db.String(256), nullable=True)
+    modified = db.Column(db.String(64), nullable=True)
 
     def __repr__(self):
         return f'<RssFeed {self.url}>'
+
+class SeenEntry(db.Model):
+    """A feed entry (by GUID or link) already ingested for a user."""
+    __table_args__ = (db.UniqueConstraint('user_id', 'entry_key'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entry_key = db.Column(db.String(512), nullable=False)
+    document_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SeenEntry {self.entry_key}>'
+
+class IngestionJob(db.Model):
+    """A queued upload waiting to be added to the knowledge base."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    file_path = db.Column(db.String(256), nullable=False)
+    document_type = db.Column(db.String(50), nullable=False)
+    source = db.Column(db.String(256), nullable=True)
+    tags = db.Column(db.String(256), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    chunks_total = db.Column(db.Integer, nullable=True)
+    chunks_embedded = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    document_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f'<IngestionJob {self.id} {self.status}>'
+
+# Columns added to tables that earlier versions had already created, which
+# db.create_all() leaves alone: (model, column, SQL default for existing rows)
+ADDED_COLUMNS = [
+    (User, 'kb_version', 0),
+    (User, 'chunks_recorded', 0),
+    (RssFeed, 'etag', None),
+    (RssFeed, 'modified', None),
+    (Document, 'terms_indexed', 0),
+]
+
+def upgrade_schema():
+    """
+    Adds the ADDED_COLUMNS missing from a database created by an earlier
+    version. Safe to run on every start, after db.create_all().
+    """
+    dialect = db.engine.dialect
+    quote = dialect.identifier_preparer.quote
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for model, name, default in ADDED_COLUMNS:
+            table = model.__table__
+            if name in {column['name'] for column in inspector.get_columns(table.name)}:
+                continue
+            column = table.c[name]
+            ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(name)} {column.type.compile(dialect)}"
+            if default is not None:
+                ddl += f" NOT NULL DEFAULT {default}"
+            connection.execute(text(ddl))
+        _add_document_autoincrement(connection)
+
+def _add_document_autoincrement(connection):
+    """
+    Rebuilds a document table created without AUTOINCREMENT, which hands
+    out the ids of deleted documents again, and makes sure no id of a
+    document whose chunks are still tombstoned is reused.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    table = Document.__table__
+    sql = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+    ).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+    quote = connection.dialect.identifier_preparer.quote
+    old_name = f"{table.name}_before_upgrade"
+    columns = ", ".join(quote(column.name) for column in table.columns)
+    connection.execute(text(f"ALTER TABLE {quote(table.name)} RENAME TO {quote(old_name)}"))
+    table.create(connection)
+    connection.execute(text(
+        f"INSERT INTO {quote(table.name)} ({columns}) SELECT {columns} FROM {quote(old_name)}"
+    ))
+    connection.execute(text(f"DROP TABLE {quote(old_name)}"))
+    last_id = connection.execute(text(
+        f"SELECT MAX((SELECT IFNULL(MAX(id), 0) FROM {quote(table.name)}), "
+        "(SELECT IFNULL(MAX(document_id), 0) FROM document_chunk))"
+    )).scalar()
+    connection.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {"name": table.name})
+    connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                       {"name": table.name, "seq": last_id})
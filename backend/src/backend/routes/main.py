@@ -1,17 +1,21 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 import os
+import json
+import uuid
+import logging
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from backend.auth.routes import token_required, get_current_user_id
 from backend.services.knowledge_base import (
-    add_document_to_kb,
     delete_document_from_kb,
     update_document_metadata
 )
 from backend.models import Document
-from backend.services.search import perform_search, generate_keyword_report
+from backend.services.search import perform_search, stream_search, generate_keyword_report
 from backend.services.clustering import generate_cluster_report
 from backend.services.feeds import add_rss_feed, get_user_feeds, delete_rss_feed
+from backend.services.ingestion import enqueue_ingestion, run_queued_job, get_job
+from backend.services.metrics import render_metrics
 from backend.config import Config
 
 main_bp = Blueprint('main', __name__)
@@ -35,18 +39,45 @@ def upload_document(current_user):
         return jsonify({"msg": "No selected file"}), 400
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
+        # Queued jobs read their file later, so a later upload of the same
+        # name must not overwrite it
+        file_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{filename}")
         file.save(file_path)
         
         document_type = filename.rsplit('.', 1)[1].lower()
         source = request.form.get('source')
         tags = request.form.get('tags')
 
-        add_document_to_kb(current_user.id, file_path, document_type, source, tags)
-        
-        return jsonify({"msg": "File uploaded and processed successfully"}), 201
+        job = enqueue_ingestion(current_user.id, file_path, document_type, source, tags)
+        if not current_app.config['INGESTION_WORKERS']:
+            # No background workers configured: process the upload inline
+            run_queued_job(job.id)
+            return jsonify(dict(_job_payload(job), msg="File uploaded and processed", job_id=job.id)), 200
+
+        return jsonify({"msg": "File uploaded and queued for processing", "job_id": job.id}), 202
     return jsonify({"msg": "File type not allowed"}), 400
 
+def _job_payload(job):
+    # The server-side file path is left out
+    return {
+        "id": job.id,
+        "status": job.status,
+        "chunks_embedded": job.chunks_embedded,
+        "chunks_total": job.chunks_total,
+        "error": job.error,
+        "document_id": job.document_id,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat()
+    }
+
+@main_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@token_required
+def get_ingestion_job(current_user, job_id):
+    job = get_job(current_user.id, job_id)
+    if not job:
+        return jsonify({"msg": "Job not found"}), 404
+    return jsonify(_job_payload(job)), 200
+
 from datetime import datetime
 
 # ... (imports remain the same)
@@ -138,10 +169,66 @@ def search(current_user):
     result = perform_search(current_user.id, query)
     return jsonify(result)
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@main_bp.route('/search/stream', methods=['POST'])
+@token_required
+def search_stream(current_user):
+    """
+    Like /search, but streams the answer as server-sent events: "sources"
+    (sent before generation starts), then "token" events, "degraded" if
+    the answer may be incomplete, then "done", or "error" if the search
+    fails part way.
+    """
+    query = request.json.get('query')
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+
+    user_id = current_user.id
+
+    def generate():
+        try:
+            for event, data in stream_search(user_id, query):
+                yield _sse(event, data)
+        except Exception:
+            # The exception may name backend URLs, so it is only logged
+            logging.exception("Error during streaming search")
+            yield _sse("error", {"error": "The search failed"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        # Ask proxies such as nginx not to buffer the stream
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @main_bp.route('/report/keywords', methods=['GET'])
 @token_required
 def keywords_report(current_user):
-    report = generate_keyword_report(current_user.id)
+    start_date = end_date = None
+    start_date_str = request.args.get('start_date')
+    end_date_str = request.args.get('end_date')
+
+    if start_date_str:
+        try:
+            start_date = datetime.fromisoformat(start_date_str)
+        except ValueError:
+            return jsonify({"msg": "Invalid start_date format. Use ISO format."}), 400
+
+    if end_date_str:
+        try:
+            end_date = datetime.fromisoformat(end_date_str)
+        except ValueError:
+            return jsonify({"msg": "Invalid end_date format. Use ISO format."}), 400
+
+    report = generate_keyword_report(
+        current_user.id,
+        start_date=start_date,
+        end_date=end_date,
+        source=request.args.get('source') or None,
+        document_type=request.args.get('type') or None
+    )
     return jsonify(report)
 
 @main_bp.route('/report/clustering', methods=['GET'])
@@ -173,4 +260,11 @@ def get_feeds(current_user):
 def delete_feed(current_user, feed_id):
     if delete_rss_feed(current_user.id, feed_id):
         return jsonify({"message": "Feed deleted"}), 200
-    return jsonify({"error": "Feed not found or permission denied"}), 404
\ No newline at end of file
+    return jsonify({"error": "Feed not found or permission denied"}), 404
+
+@main_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics of all workers."""
+    if Config.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {Config.METRICS_TOKEN}":
+        return jsonify({"msg": "Invalid metrics token"}), 401
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -1,17 +1,63 @@
 import feedparser
 import requests
 from bs4 import BeautifulSoup
-from backend.models import db, User, RssFeed
-from backend.services.knowledge_base import add_document_to_kb
-from backend.services.notification import send_notification
+from backend.models import db, User, RssFeed, SeenEntry
+from backend.services.knowledge_base import add_document_to_kb, DuplicateDocumentError
+from backend.services.notification import queue_notification
+from backend.services.metrics import stage_timer, track_request
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urlparse
 from werkzeug.utils import secure_filename
 import logging
 
-def get_article_content(url):
+# Aggregation runs in two stages: a thread pool fetches feeds and article
+# bodies concurrently, and a single ingestion thread embeds the articles it
+# receives through a bounded queue. Fetching therefore never waits on the
+# embedding server, and the queue bound keeps memory in check when it does.
+_run_lock = threading.Lock()
+
+# Article bodies are saved here and ingested as text documents
+TEMP_DIR = "temp_articles"
+
+
+class HostLimiter:
+    """Caps concurrent requests per host and spaces consecutive ones out."""
+
+    def __init__(self, max_per_host, min_interval):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+
+    @contextmanager
+    def limit(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_per_host)
+                self._semaphores[host] = semaphore
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot.get(host, now))
+                self._next_slot[host] = slot + self.min_interval
+            if slot > now:
+                time.sleep(slot - now)
+            yield
+
+
+@stage_timer("article_fetch")
+def get_article_content(url, timeout=10):
     """Fetches and extracts the main content of an article."""
     try:
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, timeout=timeout)
         response.raise_for_status()
         soup = BeautifulSoup(response.content, 'html.parser')
         # A simple approach to get text; can be improved with more advanced extraction
@@ -21,50 +67,272 @@ def get_article_content(url):
         logging.error(f"Error fetching article content from {url}: {e}")
         return None
 
-def run_aggregation_for_all_users(app):
+def get_entry_key(entry):
+    """Identifies a feed entry by its GUID, falling back to its link."""
+    return entry.get('id') or entry.get('link')
+
+def _download_feed(url, etag=None, modified=None, timeout=10):
+    """
+    Downloads a feed with a conditional GET bounded by timeout, which
+    feedparser.parse() has no way to set, and parses the body.
+    """
+    if urlparse(url).scheme not in ('http', 'https'):
+        # Local files can't stall
+        return feedparser.parse(url)
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if modified:
+        headers['If-Modified-Since'] = modified
+    response = requests.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        return feedparser.FeedParserDict(status=304, bozo=0, entries=[])
+    response.raise_for_status()
+    d = feedparser.parse(response.content, response_headers={
+        name.lower(): value for name, value in response.headers.items()
+    })
+    d['status'] = response.status_code
+    d['etag'] = response.headers.get('ETag')
+    d['modified'] = response.headers.get('Last-Modified')
+    return d
+
+@stage_timer("feed_fetch")
+def _fetch_feed(limiter, url, etag=None, modified=None, timeout=10):
+    """
+    Downloads and parses a feed with a conditional GET. A result with
+    status 304 means the feed has not changed since etag/modified.
+    """
+    logging.info(f"Processing feed: {url}")
+    with limiter.limit(url):
+        d = _download_feed(url, etag, modified, timeout)
+    if d.bozo:
+        logging.warning(f"Feed {url} may be ill-formed: {d.bozo_exception}")
+    return d
+
+def _get_seen_keys(user_id, keys):
+    """Returns which of the given entry keys were already ingested for a user."""
+    seen = set()
+    keys = list(keys)
+    for start in range(0, len(keys), 500):
+        rows = db.session.query(SeenEntry.entry_key).filter(
+            SeenEntry.user_id == user_id, SeenEntry.entry_key.in_(keys[start:start + 500])
+        ).all()
+        seen.update(row[0] for row in rows)
+    return seen
+
+def _fetch_article(app, limiter, articles, failed, user_id, username, entry_key, entry):
+    """
+    Downloads an article body and hands it to the ingestion stage, adding
+    (user_id, entry_key) to failed if it could not be downloaded. Articles
+    without text are passed on too, to be recorded as seen.
+    """
+    with limiter.limit(entry.link):
+        content = get_article_content(entry.link, timeout=app.config['AGGREGATION_FETCH_TIMEOUT'])
+    if content is None:
+        failed.add((user_id, entry_key))
+    else:
+        tags = ','.join(tag.term for tag in entry.tags) if hasattr(entry, 'tags') else None
+        articles.put((user_id, username, entry_key, entry.link, tags, content))
+
+def _ingest_articles(app, articles, stats, ingested, failed):
     """
-    Fetches and processes articles from all RSS feeds for all users.
+    Consumes fetched articles and adds them to the knowledge base, appending
+    (username, link) to ingested for each new document and (user_id,
+    entry_key) to failed for each article that could not be added. Articles
+    without text are recorded as seen without a document, so they are not
+    fetched again.
     """
     with app.app_context():
-        logging.info("Starting aggregation for all users.")
-        users = User.query.all()
-        for user in users:
-            logging.info(f"Running aggregation for user {user.username}")
-            feeds = RssFeed.query.filter_by(user_id=user.id).all()
-            for feed in feeds:
-                logging.info(f"Processing feed: {feed.url}")
+        while True:
+            item = articles.get()
+            if item is None:
+                break
+            user_id, username, entry_key, link, tags, content = item
+            try:
+                if not content:
+                    db.session.add(SeenEntry(user_id=user_id, entry_key=entry_key, document_id=None))
+                    db.session.commit()
+                    stats["entries_empty"] += 1
+                    logging.info(f"Skipped {link} for user {username}: no text extracted")
+                    continue
+
+                # Save content to a temporary file
+                os.makedirs(TEMP_DIR, exist_ok=True)
+                file_path = os.path.join(TEMP_DIR, f"{user_id}_{secure_filename(link)}.txt")
+
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(content)
+
+                # Add the document to the knowledge base
                 try:
-                    d = feedparser.parse(feed.url)
-                    if d.bozo:
-                        logging.warning(f"Feed {feed.url} may be ill-formed: {d.bozo_exception}")
-                    
-                    for entry in d.entries:
-                        content = get_article_content(entry.link)
-                        if content:
-                            # Save content to a temporary file
-                            temp_dir = "temp_articles"
-                            os.makedirs(temp_dir, exist_ok=True)
-                            file_path = os.path.join(temp_dir, f"{user.id}_{secure_filename(entry.link)}.txt")
-                            
-                            with open(file_path, "w", encoding="utf-8") as f:
-                                f.write(content)
-                            
-                            # Add the document to the knowledge base
-                            add_document_to_kb(
-                                user.id,
-                                file_path=file_path,
-                                document_type='txt',
-                                source=entry.link,
-                                tags=','.join(tag.term for tag in entry.tags) if hasattr(entry, 'tags') else None
-                            )
-                            logging.info(f"Added document from {entry.link} for user {user.username}")
-                            
-                            # Send notification
-                            send_notification(
-                                subject="New Document Added to Knowledge Base",
-                                recipients=[app.config['ADMIN_EMAIL']],
-                                body=f"A new document from {entry.link} has been added for user {user.username}."
+                    doc = add_document_to_kb(
+                        user_id,
+                        file_path=file_path,
+                        document_type='txt',
+                        source=link,
+                        tags=tags
+                    )
+                except DuplicateDocumentError as e:
+                    db.session.rollback()
+                    db.session.add(SeenEntry(user_id=user_id, entry_key=entry_key, document_id=e.document_id))
+                    db.session.commit()
+                    stats["entries_duplicate"] += 1
+                    logging.info(f"Skipped {link} for user {username}: {e}")
+                    continue
+                db.session.add(SeenEntry(user_id=user_id, entry_key=entry_key, document_id=doc.id))
+                db.session.commit()
+                stats["entries_ingested"] += 1
+                ingested.append((username, link))
+                logging.info(f"Added document from {link} for user {username}")
+            except Exception as e:
+                db.session.rollback()
+                failed.add((user_id, entry_key))
+                logging.error(f"Error ingesting article {link}: {e}")
+
+def _save_validators(validators, failed):
+    """
+    Stores the ETag/Last-Modified of feeds whose entries were all ingested.
+    A feed with a failed entry keeps its old validators, so the next poll
+    gets the entries again instead of a 304.
+    """
+    for feed_id, (etag, modified, entry_keys) in validators.items():
+        if entry_keys & failed:
+            continue
+        RssFeed.query.filter_by(id=feed_id).update({"etag": etag, "modified": modified})
+    db.session.commit()
+
+def build_digest(ingested, max_items):
+    """Builds the subject and body of a digest of (username, link) pairs."""
+    by_user = {}
+    for username, link in ingested:
+        by_user.setdefault(username, []).append(link)
+
+    lines = []
+    listed = 0
+    for username, links in by_user.items():
+        lines.append(f"{username} ({len(links)}):")
+        for link in links:
+            if listed >= max_items:
+                break
+            lines.append(f"  {link}")
+            listed += 1
+        lines.append("")
+    if listed < len(ingested):
+        lines.append(f"...and {len(ingested) - listed} more.")
+
+    count = len(ingested)
+    subject = f"{count} New Document{'s' if count != 1 else ''} Added to Knowledge Base"
+    return subject, "\n".join(lines).rstrip() + "\n"
+
+def _send_digest(app, ingested):
+    if not ingested:
+        return
+    if not app.config['ADMIN_EMAIL']:
+        logging.info("ADMIN_EMAIL is not set; not sending the aggregation digest.")
+        return
+    subject, body = build_digest(ingested, app.config['NOTIFICATION_DIGEST_MAX_ITEMS'])
+    queue_notification(app, subject, [app.config['ADMIN_EMAIL']], body)
+
+@track_request("aggregation")
+def run_aggregation_for_all_users(app):
+    """
+    Fetches and processes new articles from all RSS feeds for all users.
+    Returns per-run counts of feeds that were not modified (HTTP 304),
+    entries skipped as already ingested, near-duplicate entries, and
+    entries ingested. New documents are reported in a single digest email
+    to ADMIN_EMAIL, sent in the background once the run finishes.
+    """
+    stats = {"feeds": 0, "feeds_not_modified": 0, "entries_skipped": 0,
+             "entries_duplicate": 0, "entries_empty": 0, "entries_ingested": 0}
+    if not _run_lock.acquire(blocking=False):
+        logging.warning("Aggregation is already running in this process; skipping.")
+        return stats
+    try:
+        with app.app_context():
+            logging.info("Starting aggregation for all users.")
+            feeds = []
+            for user in User.query.all():
+                logging.info(f"Running aggregation for user {user.username}")
+                for feed in RssFeed.query.filter_by(user_id=user.id).all():
+                    feeds.append((user.id, user.username, feed.id, feed.url, feed.etag, feed.modified))
+            stats["feeds"] = len(feeds)
+
+            limiter = HostLimiter(
+                app.config['AGGREGATION_PER_HOST_CONCURRENCY'],
+                app.config['AGGREGATION_PER_HOST_DELAY']
+            )
+            articles = queue.Queue(maxsize=app.config['AGGREGATION_QUEUE_SIZE'])
+            ingested = []
+            # Entries that could not be fetched or ingested, and the new HTTP
+            # validators of each changed feed with the entries it listed
+            failed = set()
+            validators = {}
+            ingester = threading.Thread(
+                target=_ingest_articles, args=(app, articles, stats, ingested, failed),
+                name="aggregation-ingest", daemon=True
+            )
+            ingester.start()
+            try:
+                with ThreadPoolExecutor(max_workers=app.config['AGGREGATION_MAX_WORKERS'],
+                                        thread_name_prefix="aggregation-fetch") as executor:
+                    feed_futures = {
+                        executor.submit(
+                            _fetch_feed, limiter, url, etag, modified, app.config['AGGREGATION_FETCH_TIMEOUT']
+                        ): (user_id, username, feed_id, url)
+                        for user_id, username, feed_id, url, etag, modified in feeds
+                    }
+                    article_futures = {}
+                    queued_keys = set()
+                    for future in as_completed(feed_futures):
+                        user_id, username, feed_id, url = feed_futures[future]
+                        try:
+                            d = future.result()
+                            if d.get('status') == 304:
+                                stats["feeds_not_modified"] += 1
+                                continue
+
+                            entries = {}
+                            for entry in d.entries:
+                                key = get_entry_key(entry)
+                                if key and entry.get('link'):
+                                    entries.setdefault(key, entry)
+                            seen = _get_seen_keys(user_id, entries)
+                            validators[feed_id] = (d.get('etag'), d.get('modified'),
+                                                   {(user_id, key) for key in entries})
+                        except Exception as e:
+                            db.session.rollback()
+                            logging.error(f"Error processing feed {url}: {e}")
+                            continue
+
+                        for key, entry in entries.items():
+                            # Skip entries ingested in earlier runs or already
+                            # queued from another of the user's feeds
+                            if key in seen or (user_id, key) in queued_keys:
+                                stats["entries_skipped"] += 1
+                                continue
+                            queued_keys.add((user_id, key))
+                            article_future = executor.submit(
+                                _fetch_article, app, limiter, articles, failed, user_id, username, key, entry
                             )
-                except Exception as e:
-                    logging.error(f"Error processing feed {feed.url}: {e}")
-        logging.info("Aggregation for all users finished.")
+                            article_futures[article_future] = (user_id, key, entry.link)
+                    for future in as_completed(article_futures):
+                        user_id, key, link = article_futures[future]
+                        try:
+                            future.result()
+                        except Exception as e:
+                            failed.add((user_id, key))
+                            logging.error(f"Error fetching article {link}: {e}")
+            finally:
+                articles.put(None)
+                ingester.join()
+            _save_validators(validators, failed)
+            _send_digest(app, ingested)
+        logging.info(
+            f"Aggregation for all users finished: {stats['feeds']} feeds, "
+            f"{stats['feeds_not_modified']} not modified, {stats['entries_skipped']} entries skipped, "
+            f"{stats['entries_duplicate']} near-duplicates, {stats['entries_empty']} without text, "
+            f"{stats['entries_ingested']} entries ingested."
+        )
+        return stats
+    finally:
+        _run_lock.release()
@@ -0,0 +1,129 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from backend.config import Config
+from backend.services.metrics import record_cache
+
+
+def normalize_query(query):
+    """Lowercases a query and collapses whitespace and trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip(" ?!.")
+
+
+class AnswerCache:
+    """
+    Process-wide LRU cache of search results.
+
+    Entries are keyed by (user_id, kb_version, normalized query), so bumping
+    a user's knowledge base version makes their older answers unreachable;
+    these age out through the TTL and the LRU bound. An entry stored with
+    the query embedding can also be found by get_similar().
+    """
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at, result, unit-length embedding or None)
+        self._entries = OrderedDict()
+        # (user_id, kb_version) -> keys of entries with an embedding
+        self._embedded_keys = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id, kb_version, query):
+        """Returns the cached result for a query, or None."""
+        key = (user_id, kb_version, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("answer", 1, 0)
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+        record_cache("answer", 0, 1)
+        return None
+
+    def get_similar(self, user_id, kb_version, embedding, threshold):
+        """
+        Returns the cached result whose query embedding is most similar to
+        embedding, if its cosine similarity is at least threshold.
+        """
+        vector = _unit_vector(embedding)
+        if vector is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            keys = [key for key in self._embedded_keys.get((user_id, kb_version), ())
+                    if self._entries[key][0] > now]
+            if not keys:
+                return None
+            candidates = np.stack([self._entries[key][2] for key in keys])
+            if candidates.shape[1] != vector.shape[0]:
+                return None
+            similarities = candidates @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < threshold:
+                return None
+            self._entries.move_to_end(keys[best])
+            self.semantic_hits += 1
+            record_cache("answer_semantic", 1, 0)
+            return self._entries[keys[best]][1]
+
+    def put(self, user_id, kb_version, query, result, embedding=None):
+        """Caches a result, optionally with the query embedding."""
+        if self.max_entries <= 0:
+            return
+        key = (user_id, kb_version, normalize_query(query))
+        vector = _unit_vector(embedding) if embedding is not None else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, result, vector)
+            if vector is not None:
+                self._embedded_keys.setdefault(key[:2], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Drops all cached results."""
+        with self._lock:
+            self._entries.clear()
+            self._embedded_keys.clear()
+
+    def stats(self):
+        """Returns the cache counters and current occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[2] is not None:
+            keys = self._embedded_keys[key[:2]]
+            keys.discard(key)
+            if not keys:
+                del self._embedded_keys[key[:2]]
+
+
+def _unit_vector(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if vector.ndim != 1 or not norm:
+        return None
+    return vector / norm
+
+
+answer_cache = AnswerCache(Config.ANSWER_CACHE_MAX_ENTRIES, Config.ANSWER_CACHE_TTL_SECONDS)
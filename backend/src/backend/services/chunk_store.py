@@ -0,0 +1,114 @@
+import os
+import mmap
+import json
+import zlib
+from collections.abc import Mapping
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+# On-disk docstore of a segment, read through memory maps so that every
+# gunicorn worker shares the same page cache instead of unpickling a private
+# copy of all chunk texts:
+#
+#   chunks.dat          zlib-compressed JSON records, one per chunk
+#   chunk_offsets.npy   start offset of each record (plus the end offset)
+#   chunk_ids.npy       docstore id of each chunk, in index order
+#   chunk_id_order.npy  positions sorted by docstore id, for lookups by id
+#
+# Records are in the order of the vectors in the segment's FAISS index, so
+# position i of the index is record i.
+CHUNKS_FILE = "chunks.dat"
+OFFSETS_FILE = "chunk_offsets.npy"
+IDS_FILE = "chunk_ids.npy"
+ID_ORDER_FILE = "chunk_id_order.npy"
+CHUNK_STORE_FILES = (CHUNKS_FILE, OFFSETS_FILE, IDS_FILE, ID_ORDER_FILE)
+
+
+def write_chunk_store(path, ids, docs):
+    """Writes docs, in index order, as the chunk store of a segment directory."""
+    offsets = [0]
+    with open(os.path.join(path, CHUNKS_FILE), "wb") as f:
+        for doc in docs:
+            record = zlib.compress(json.dumps(
+                {"page_content": doc.page_content, "metadata": doc.metadata}, default=str
+            ).encode("utf-8"))
+            f.write(record)
+            offsets.append(offsets[-1] + len(record))
+    encoded_ids = np.array([docstore_id.encode("utf-8") for docstore_id in ids], dtype=bytes)
+    np.save(os.path.join(path, OFFSETS_FILE), np.array(offsets, dtype=np.uint64))
+    np.save(os.path.join(path, IDS_FILE), encoded_ids)
+    np.save(os.path.join(path, ID_ORDER_FILE), np.argsort(encoded_ids, kind="stable").astype(np.int64))
+
+
+def has_chunk_store(path):
+    """Returns whether a segment directory holds a chunk store."""
+    return os.path.exists(os.path.join(path, CHUNKS_FILE))
+
+
+class ChunkIds(Mapping):
+    """Read-only index position -> docstore id mapping over chunk_ids.npy."""
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self._ids):
+            raise KeyError(position)
+        return self._ids[position].decode("utf-8")
+
+    def __iter__(self):
+        return iter(range(len(self._ids)))
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class ChunkStore(Docstore):
+    """Read-only, memory-mapped docstore of a segment."""
+
+    def __init__(self, path):
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self._ids = np.load(os.path.join(path, IDS_FILE), mmap_mode="r")
+        self._order = np.load(os.path.join(path, ID_ORDER_FILE), mmap_mode="r")
+        self.index_to_docstore_id = ChunkIds(self._ids)
+        with open(os.path.join(path, CHUNKS_FILE), "rb") as f:
+            # mmap can't map an empty file
+            size = os.fstat(f.fileno()).st_size
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self._ids)
+
+    def position(self, docstore_id):
+        """Returns the index position of a docstore id, or None."""
+        key = docstore_id.encode("utf-8")
+        lo, hi = 0, len(self._order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ids[self._order[mid]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._order) and self._ids[self._order[lo]] == key:
+            return int(self._order[lo])
+        return None
+
+    def get(self, position):
+        """Returns the chunk at an index position."""
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(zlib.decompress(self._data[start:end]))
+        return Document(
+            id=self._ids[position].decode("utf-8"),
+            page_content=record["page_content"],
+            metadata=record["metadata"]
+        )
+
+    def search(self, search):
+        position = self.position(search)
+        if position is None:
+            return f"ID {search} not found."
+        return self.get(position)
+
+    def delete(self, ids):
+        raise NotImplementedError("Segments are immutable; deletes go through compaction.")
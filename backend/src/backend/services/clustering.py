@@ -1,46 +1,160 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-from backend.models import Document
+import json
+import heapq
+import math
+import pickle
+from sklearn.cluster import MiniBatchKMeans
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from backend.models import db, DocumentChunk, ClusterState, LEGACY_DOCUMENT_ID
+from backend.config import Config
+from backend.services.embedding import LlamaServerEmbeddings
+from backend.services.index_factory import reconstruct_vectors
+from backend.services.metrics import track_request
+from backend.services.knowledge_base import get_user_faiss_index_path, get_kb_version, record_legacy_chunks
+from backend.services.term_stats import index_missing_documents
+from backend.services.vector_store import load_user_vector_store
 import numpy as np
 
-def generate_cluster_report(user_id, n_clusters=5):
+TOP_TERMS = 10
+
+
+def get_document_embeddings(user_id):
     """
-    Generates a cluster report for a user's documents using TF-IDF and K-Means.
+    Returns (document_ids, vectors): the mean embedding of each of a user's
+    documents, computed from the chunk vectors in their FAISS index.
     """
-    docs = Document.query.filter_by(user_id=user_id).all()
-    if not docs or len(docs) < n_clusters:
-        return {"error": "Not enough documents to generate a cluster report."}
+    record_legacy_chunks(user_id)
+    # Chunks of deleted documents that are still in the index, and of
+    # ingests still in flight, are tombstoned and skipped
+    chunk_documents = dict(db.session.query(DocumentChunk.docstore_id, DocumentChunk.document_id).filter(
+        DocumentChunk.user_id == user_id, DocumentChunk.deleted.is_(False),
+        DocumentChunk.document_id != LEGACY_DOCUMENT_ID
+    ))
+    vector_store = load_user_vector_store(get_user_faiss_index_path(user_id), LlamaServerEmbeddings())
+    if vector_store is None or not chunk_documents:
+        return [], None
 
-    # For simplicity, we'll read the content from the files.
-    # A more optimized approach would be to store content in the database or a cache.
-    doc_contents = []
-    for doc in docs:
-        try:
-            with open(doc.file_path, 'r', encoding='utf-8') as f:
-                doc_contents.append(f.read())
-        except Exception as e:
-            print(f"Could not read file {doc.file_path}: {e}")
-            # Skip files that can't be read
+    # Rows of the per-document sums, in document id order
+    document_ids = sorted(set(chunk_documents.values()))
+    rows_by_document = {document_id: row for row, document_id in enumerate(document_ids)}
+    sums = None
+    counts = np.zeros(len(document_ids), dtype=np.int64)
+    for segment in vector_store.segments:
+        # Segments written without embeddings have no vectors to average
+        if not segment.index.ntotal or not segment.index.d:
+            continue
+        positions, rows = [], []
+        for position, docstore_id in segment.index_to_docstore_id.items():
+            document_id = chunk_documents.get(docstore_id)
+            if document_id is not None:
+                positions.append(position)
+                rows.append(rows_by_document[document_id])
+        if not rows:
             continue
+        # One segment's vectors are reconstructed at a time
+        vectors = reconstruct_vectors(segment.index)[positions]
+        if sums is None:
+            sums = np.zeros((len(document_ids), vectors.shape[1]), dtype=np.float64)
+        np.add.at(sums, rows, vectors)
+        counts += np.bincount(rows, minlength=len(document_ids))
+
+    found = np.flatnonzero(counts)
+    if not len(found):
+        return [], None
+    return [document_ids[row] for row in found], sums[found] / counts[found, None]
 
-    if not doc_contents or len(doc_contents) < n_clusters:
-        return {"error": "Not enough readable documents to generate a cluster report."}
 
-    # Vectorize the documents
-    vectorizer = TfidfVectorizer(stop_words='english')
-    X = vectorizer.fit_transform(doc_contents)
+# Term counts per cluster, with each cluster's total and each term's total
+# over all clusters. The labels are passed as one JSON object of
+# document id -> cluster, however many documents there are.
+_CLUSTER_TERMS_SQL = text(
+    "SELECT label, term, count,"
+    " SUM(count) OVER (PARTITION BY label) AS size,"
+    " SUM(count) OVER (PARTITION BY term) AS total"
+    " FROM (SELECT CAST(labels.value AS INTEGER) AS label, dt.term, SUM(dt.count) AS count"
+    "  FROM json_each(:labels) AS labels"
+    "  JOIN document_term dt ON dt.document_id = CAST(labels.key AS INTEGER)"
+    "  GROUP BY label, dt.term)"
+)
 
-    # Perform clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    kmeans.fit(X)
 
-    # Get top terms per cluster
-    order_centroids = kmeans.cluster_centers_.argsort()[:, ::-1]
-    terms = vectorizer.get_feature_names_out()
-    
+def _describe_clusters(user_id, labels, n_clusters):
+    """
+    Names each cluster by its most distinctive terms (class-based TF-IDF
+    over the documents' term counts).
+    """
+    index_missing_documents(user_id)
+    rows = db.session.execute(_CLUSTER_TERMS_SQL, {"labels": json.dumps(labels)}).all()
+    average = sum(row.count for row in rows) / n_clusters
+
+    cluster_rows = [[] for _ in range(n_clusters)]
+    for row in rows:
+        cluster_rows[row.label].append(row)
     report = {}
-    for i in range(n_clusters):
-        top_terms = [terms[ind] for ind in order_centroids[i, :10]]
-        report[f"Cluster {i+1}"] = top_terms
-        
+    for i, terms in enumerate(cluster_rows):
+        ranked = heapq.nlargest(
+            TOP_TERMS, terms,
+            key=lambda row: (row.count / row.size * math.log(1 + average / row.total), row.term)
+        )
+        report[f"Cluster {i+1}"] = [row.term for row in ranked]
+    return report
+
+
+@track_request("cluster_report")
+def generate_cluster_report(user_id, n_clusters=5):
+    """
+    Generates a cluster report for a user's documents using MiniBatchKMeans
+    over their embeddings. The result is cached for the current knowledge
+    base version; documents added since the last fit are folded into the
+    cached model with partial_fit instead of re-clustering from scratch.
+    """
+    kb_version = get_kb_version(user_id)
+    state = db.session.get(ClusterState, user_id)
+    if state is not None and state.kb_version == kb_version and state.n_clusters == n_clusters:
+        return json.loads(state.report)
+
+    document_ids, vectors = get_document_embeddings(user_id)
+    if len(document_ids) < n_clusters:
+        return {"error": "Not enough documents to generate a cluster report."}
+
+    model = None
+    labels = {}
+    if state is not None and state.n_clusters == n_clusters:
+        model = pickle.loads(state.model)
+        previous = {int(document_id): label for document_id, label in json.loads(state.labels).items()}
+        labels = {d: previous[d] for d in document_ids if d in previous}
+        new = [i for i, d in enumerate(document_ids) if d not in previous]
+        if (model.cluster_centers_.shape[1] != vectors.shape[1]
+                or len(new) > Config.CLUSTER_REFIT_RATIO * state.fitted_count):
+            model = None
+        elif new:
+            model.partial_fit(vectors[new])
+            for i, label in zip(new, model.predict(vectors[new])):
+                labels[document_ids[i]] = int(label)
+
+    if model is None:
+        model = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=42, batch_size=Config.CLUSTER_BATCH_SIZE, n_init=3
+        )
+        labels = dict(zip(document_ids, map(int, model.fit_predict(vectors))))
+        fitted_count = len(document_ids)
+    else:
+        fitted_count = state.fitted_count
+
+    report = _describe_clusters(user_id, labels, n_clusters)
+
+    if state is None:
+        state = ClusterState(user_id=user_id)
+        db.session.add(state)
+    state.kb_version = kb_version
+    state.n_clusters = n_clusters
+    state.model = pickle.dumps(model)
+    state.labels = json.dumps(labels)
+    state.fitted_count = fitted_count
+    state.report = json.dumps(report)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request saved this user's clustering first
+        db.session.rollback()
     return report
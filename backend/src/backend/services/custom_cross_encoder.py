@@ -3,6 +3,25 @@ from langchain_core.documents import Document
 from typing import List, Sequence
 import requests
 from backend.config import Config
+from backend.services.http_client import request, mark_degraded
+from backend.services.metrics import stage_timer
+from backend.services.rerank_cache import rerank_cache, make_score_key
+
+RERANKING_MODEL = "gpustack/bge-reranker-v2-m3-GGUF"
+# Rough characters per token, used to apply the token budget without
+# calling the tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens tokens, at a word boundary if possible."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if max_tokens <= 0 or len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    boundary = cut.rfind(" ")
+    return cut[:boundary] if boundary > max_chars // 2 else cut
+
 
 class LlamaServerCrossEncoder(BaseDocumentCompressor):
     """Custom LangChain cross-encoder to rerank documents using a remote Llama server."""
@@ -15,33 +34,59 @@ class LlamaServerCrossEncoder(BaseDocumentCompressor):
     ) -> Sequence[Document]:
         """
         Rerank documents based on the query using the Llama reranking endpoint.
+        Each document is truncated to RERANK_MAX_TOKENS, and only documents
+        without a cached score for the query are sent. At most RERANK_TOP_N
+        documents are returned if it is set.
         """
         url = Config.RERANKING_URL
         if not url:
             raise ValueError("RERANKING_URL is not set in the configuration.")
 
-        doc_contents = [doc.page_content for doc in documents]
+        doc_contents = [truncate_to_tokens(doc.page_content, Config.RERANK_MAX_TOKENS) for doc in documents]
+        keys = [make_score_key(RERANKING_MODEL, query, content) for content in doc_contents]
+        scores = rerank_cache.get_many(keys)
+        # Score each distinct uncached text once
+        missing = []
+        for i, key in enumerate(keys):
+            if key not in scores and all(keys[j] != key for j in missing):
+                missing.append(i)
 
-        payload = {
-            "model": "gpustack/bge-reranker-v2-m3-GGUF",
-            "query": query,
-            "documents": doc_contents
-        }
+        if missing:
+            payload = {
+                "model": RERANKING_MODEL,
+                "query": query,
+                "documents": [doc_contents[i] for i in missing]
+            }
 
-        try:
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            results = response.json().get('results', [])
+            try:
+                with stage_timer("rerank"):
+                    response = request(
+                        "reranker", "POST", url, json=payload, timeout=Config.RERANKING_TIMEOUT, idempotent=True
+                    )
+                response.raise_for_status()
+                results = response.json().get('results', [])
+            except requests.exceptions.RequestException as e:
+                print(f"Error calling reranking service: {e}")
+                mark_degraded()
+                # Fallback to returning original documents if reranking fails
+                return self._top_n(list(documents))
 
-            # Sort documents based on the 'relevance_score' from the reranking API
-            # The API returns a list of dicts with 'index' and 'relevance_score'
-            sorted_indices = [result['index'] for result in sorted(results, key=lambda x: x['relevance_score'], reverse=True)]
+            # The API returns a list of dicts with 'index' (into the documents
+            # sent) and 'relevance_score'
+            new_scores = {keys[missing[result['index']]]: result['relevance_score'] for result in results}
+            rerank_cache.put_many(new_scores)
+            scores.update(new_scores)
 
-            # Create a new list of documents in the reranked order
-            reranked_docs = [documents[i] for i in sorted_indices]
-            return reranked_docs
+        # Sort documents based on their relevance score, dropping any the
+        # reranker returned no score for
+        ranked = sorted(
+            (i for i, key in enumerate(keys) if key in scores),
+            key=lambda i: scores[keys[i]],
+            reverse=True
+        )
+        return self._top_n([documents[i] for i in ranked])
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error calling reranking service: {e}")
-            # Fallback to returning original documents if reranking fails
-            return list(documents)
+    def _top_n(self, documents: List[Document]) -> List[Document]:
+        if Config.RERANK_TOP_N > 0:
+            return documents[:Config.RERANK_TOP_N]
+        return documents
@@ -1,8 +1,70 @@
 import re
+import json
+import logging
+from langchain_core.callbacks import CallbackManagerForLLMRun
 from langchain_core.language_models.llms import LLM
-from typing import Any, List, Mapping, Optional
+from langchain_core.outputs import GenerationChunk
+from typing import Any, Iterator, List, Mapping, Optional
 import requests
 from backend.config import Config
+from backend.services.http_client import request, mark_degraded, current_deadline
+from backend.services.metrics import stage_timer
+
+
+class ThinkFilter:
+    """
+    Removes <think>...</think> spans from text that arrives in pieces, such as
+    a streamed completion. A tag split across pieces is held back until it
+    can be recognized. Leading whitespace of the answer is dropped, as in
+    LlamaServerLLM._call.
+    """
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_think = False
+        self._started = False
+
+    def feed(self, text: str) -> str:
+        """Adds a piece of text and returns the part that can be shown."""
+        self._buffer += text
+        visible = []
+        while True:
+            tag = self.CLOSE_TAG if self._in_think else self.OPEN_TAG
+            i = self._buffer.find(tag)
+            if i >= 0:
+                if not self._in_think:
+                    visible.append(self._buffer[:i])
+                self._buffer = self._buffer[i + len(tag):]
+                self._in_think = not self._in_think
+                continue
+            keep = _partial_tag_length(self._buffer, tag)
+            if not self._in_think:
+                visible.append(self._buffer[:len(self._buffer) - keep])
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            return self._emit("".join(visible))
+
+    def flush(self) -> str:
+        """Returns any text still held back once the stream has ended."""
+        text = "" if self._in_think else self._buffer
+        self._buffer = ""
+        return self._emit(text)
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+
+def _partial_tag_length(text, tag):
+    """Returns the length of the longest prefix of tag that text ends with."""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
 
 class LlamaServerLLM(LLM):
     """Custom LangChain LLM class to interact with a remote Llama server."""
@@ -24,24 +86,82 @@ class LlamaServerLLM(LLM):
         if not url:
             raise ValueError("LLM_URL is not set in the configuration.")
 
-        payload = {
-            "model": "ggml-org/Qwen3-1.7B-GGUF",
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7,
-        }
+        payload = self._payload(prompt)
 
         try:
-            response = requests.post(url, json=payload)
+            # Completions are expensive and not retried
+            with stage_timer("llm_generation"):
+                response = request("llm", "POST", url, json=payload, timeout=Config.LLM_TIMEOUT)
             response.raise_for_status()
             content = response.json()['choices'][0]['message']['content']
             # Strip <think> tags
             content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL).strip()
             return content
         except requests.exceptions.RequestException as e:
+            # The error text is answered, but must not be cached
+            mark_degraded()
             return f"Error calling Llama server: {e}"
 
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        """
+        Streams the completion from the Llama server's chat completions
+        endpoint as it is generated, with <think> spans filtered out.
+        """
+        url = Config.LLM_URL
+        if not url:
+            raise ValueError("LLM_URL is not set in the configuration.")
+
+        payload = self._payload(prompt)
+        payload["stream"] = True
+        think_filter = ThinkFilter()
+        deadline = current_deadline()
+
+        # The timeout bounds the wait for each streamed line, so the whole
+        # answer is bounded by the request deadline below
+        with stage_timer("llm_generation"), \
+                request("llm", "POST", url, json=payload, stream=True, timeout=Config.LLM_TIMEOUT) as response:
+            response.raise_for_status()
+            # The server sends one "data: {...}" line per token and ends
+            # the stream with "data: [DONE]".
+            for line in response.iter_lines():
+                if deadline is not None and deadline.remaining() <= 0:
+                    logging.warning("Request deadline exceeded while streaming the answer; stopping")
+                    mark_degraded()
+                    break
+                line = line.decode("utf-8")
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield from self._chunk(think_filter.feed(content), run_manager)
+        yield from self._chunk(think_filter.flush(), run_manager)
+
+    def _chunk(self, text, run_manager):
+        if text:
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    def _payload(self, prompt):
+        return {
+            "model": "ggml-org/Qwen3-1.7B-GGUF",
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+        }
+
     @property
     def _identifying_params(self) -> Mapping[str, Any]:
         """Get the identifying parameters."""
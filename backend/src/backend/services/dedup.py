@@ -0,0 +1,105 @@
+import re
+import hashlib
+import numpy as np
+from sqlalchemy import select, union
+from backend.models import db, DocumentFingerprint
+
+# 64-bit SimHash over word 3-shingles. The fingerprint is split into four
+# 16-bit bands: two fingerprints within Hamming distance 3 must agree on at
+# least one band (pigeonhole), so candidates are found with four indexed
+# equality lookups (a UNION, so SQLite uses each band index) instead of a scan.
+FINGERPRINT_BITS = 64
+BANDS = 4
+BAND_BITS = FINGERPRINT_BITS // BANDS
+MAX_DISTANCE = BANDS - 1
+SHINGLE_SIZE = 3
+# Texts shorter than this don't carry enough signal to fingerprint reliably.
+MIN_WORDS = 8
+
+_WORD_RE = re.compile(r"\w+")
+_BIT_SHIFTS = np.arange(FINGERPRINT_BITS, dtype=np.uint64)
+
+
+def simhash(text):
+    """Returns the 64-bit SimHash of a text, or None if it is too short."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    shingles = {
+        " ".join(words[i:i + SHINGLE_SIZE])
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+         for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    bits = (hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+    # Each bit is set when more shingles have it set than not.
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(hashes)
+    fingerprint = 0
+    for i in np.flatnonzero(votes > 0):
+        fingerprint |= 1 << int(i)
+    return fingerprint
+
+
+def get_bands(fingerprint):
+    """Splits a fingerprint into its BANDS band values."""
+    mask = (1 << BAND_BITS) - 1
+    return [(fingerprint >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+def _to_signed(fingerprint):
+    # SQLite integers are signed 64-bit.
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def find_near_duplicate(user_id, fingerprint, max_distance=MAX_DISTANCE):
+    """
+    Returns the id of the user's document closest to fingerprint if it is
+    within max_distance bits (at most MAX_DISTANCE), otherwise None.
+    """
+    max_distance = min(max_distance, MAX_DISTANCE)
+    bands = get_bands(fingerprint)
+    rows = db.session.execute(union(*(
+        select(DocumentFingerprint.document_id, DocumentFingerprint.fingerprint).where(
+            DocumentFingerprint.user_id == user_id,
+            getattr(DocumentFingerprint, f"band{i}") == band
+        )
+        for i, band in enumerate(bands)
+    ))).all()
+
+    best = None
+    for document_id, stored in rows:
+        distance = hamming_distance(fingerprint, _to_unsigned(stored))
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = (distance, document_id)
+    return best[1] if best else None
+
+
+def record_fingerprint(user_id, document_id, fingerprint):
+    """Adds a document's fingerprint to the session (the caller commits)."""
+    bands = get_bands(fingerprint)
+    db.session.add(DocumentFingerprint(
+        user_id=user_id,
+        document_id=document_id,
+        fingerprint=_to_signed(fingerprint),
+        band0=bands[0],
+        band1=bands[1],
+        band2=bands[2],
+        band3=bands[3]
+    ))
+
+
+def delete_fingerprint(document_id):
+    """Removes a document's fingerprint (the caller commits)."""
+    DocumentFingerprint.query.filter_by(document_id=document_id).delete()
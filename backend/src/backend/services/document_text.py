@@ -0,0 +1,66 @@
+import re
+import zlib
+import hashlib
+import logging
+import unicodedata
+from backend.models import db, Document, DocumentText
+
+_TRAILING_SPACE_RE = re.compile(r"[ \t]+\n")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def normalize_text(text):
+    """
+    Normalizes extracted text: NFC Unicode, \\n line endings, no trailing
+    spaces and at most one blank line in a row.
+    """
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = _TRAILING_SPACE_RE.sub("\n", text)
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def store_document_text(user_id, document_id, text):
+    """Stores the normalized text of a document. The caller commits."""
+    raw = normalize_text(text).encode("utf-8")
+    db.session.add(DocumentText(
+        document_id=document_id,
+        user_id=user_id,
+        sha256=hashlib.sha256(raw).hexdigest(),
+        size=len(raw),
+        data=zlib.compress(raw, 6)
+    ))
+
+
+def get_document_text(document_id):
+    """Returns the stored text of a document, or None."""
+    data = db.session.query(DocumentText.data).filter_by(document_id=document_id).scalar()
+    return zlib.decompress(data).decode("utf-8") if data is not None else None
+
+
+def delete_document_text(document_id):
+    """Removes the stored text of a document. The caller commits."""
+    DocumentText.query.filter_by(document_id=document_id).delete()
+
+
+def iter_document_texts(user_id, document_ids=None, batch_size=100):
+    """
+    Yields (document_id, text) for each of a user's documents, or those in
+    document_ids, fetching batch_size rows at a time so the corpus is never
+    held in memory. Documents ingested before texts were stored are read
+    from their file if it is plain text, and skipped otherwise.
+    """
+    query = db.session.query(Document.id, Document.file_path, DocumentText.data).outerjoin(
+        DocumentText, DocumentText.document_id == Document.id
+    ).filter(Document.user_id == user_id)
+    if document_ids is not None:
+        query = query.filter(Document.id.in_(document_ids))
+    rows = query.order_by(Document.id).yield_per(batch_size)
+    for document_id, file_path, data in rows:
+        if data is not None:
+            yield document_id, zlib.decompress(data).decode("utf-8")
+            continue
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                yield document_id, f.read()
+        except Exception as e:
+            logging.warning(f"Could not read file {file_path}: {e}")
@@ -1,34 +1,111 @@
 from langchain_core.embeddings import Embeddings
 from typing import List
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from backend.config import Config
+from backend.services.embedding_cache import get_embedding_cache
+from backend.services.http_client import request
+from backend.services.metrics import inc, stage_timer
+
+EMBEDDING_MODEL = "ggml-org/embeddinggemma-300M-GGUF"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Shared pool bounding the number of in-flight embedding batches."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=Config.EMBEDDING_MAX_CONCURRENCY,
+                thread_name_prefix="embedding"
+            )
+        return _executor
+
 
 class LlamaServerEmbeddings(Embeddings):
     """
     Custom LangChain Embeddings class to interact with a remote Llama server
     for generating text embeddings.
+
+    Texts that could not be embedded come back as empty vectors, so search
+    can degrade without the server. With raise_errors, embed_documents
+    raises instead, as storing empty vectors would corrupt an index.
     """
 
+    def __init__(self, raise_errors: bool = False):
+        self.raise_errors = raise_errors
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """
-        Embed a list of documents.
+        Embed a list of documents, only sending texts that are not already
+        in the embedding cache to the server.
+        """
+        cache = get_embedding_cache()
+        if cache is None:
+            return self._embed_texts(texts)
+
+        cached = cache.get_many(EMBEDDING_MODEL, texts)
+        misses = [text for text in dict.fromkeys(texts) if text not in cached]
+        if misses:
+            embeddings = self._embed_texts(misses)
+            # Failed batches come back empty; don't cache those
+            cache.put_many(EMBEDDING_MODEL, [
+                (text, embedding) for text, embedding in zip(misses, embeddings) if embedding
+            ])
+            cached.update(zip(misses, embeddings))
+        return [cached[text] for text in texts]
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Send texts to the embedding server in batches of EMBEDDING_BATCH_SIZE,
+        with up to EMBEDDING_MAX_CONCURRENCY batches in flight. Results are
+        returned in input order.
         """
         url = Config.EMBEDDING_URL
         if not url:
             raise ValueError("EMBEDDING_URL is not set in the configuration.")
 
+        batch_size = max(1, Config.EMBEDDING_BATCH_SIZE)
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        if len(batches) <= 1:
+            return self._embed_batch(url, texts)
+
+        # Run each batch in a copy of this context so the request deadline applies
+        contexts = [contextvars.copy_context() for _ in batches]
+        results = _get_executor().map(
+            lambda context, batch: context.run(self._embed_batch, url, batch), contexts, batches
+        )
+        return [embedding for batch in results for embedding in batch]
+
+    def _embed_batch(self, url: str, texts: List[str]) -> List[List[float]]:
+        """
+        Send a single batch of texts to the embedding server.
+        """
         try:
-            response = requests.post(
+            response = request(
+                "embedding",
+                "POST",
                 url,
                 json={
                     "input": texts,
-                    "model": "ggml-org/embeddinggemma-300M-GGUF"
-                }
+                    "model": EMBEDDING_MODEL
+                },
+                timeout=Config.EMBEDDING_TIMEOUT,
+                idempotent=True
             )
             response.raise_for_status()
-            embeddings = [item['embedding'] for item in response.json()['data']]
+            data = sorted(response.json()['data'], key=lambda item: item.get('index', 0))
+            embeddings = [item['embedding'] for item in data]
+            inc("rag_chunks_embedded_total", len(embeddings))
             return embeddings
         except requests.exceptions.RequestException as e:
+            if self.raise_errors:
+                raise
             print(f"Error calling embedding service: {e}")
             return [[] for _ in texts]
 
@@ -41,15 +118,62 @@ class LlamaServerEmbeddings(Embeddings):
             raise ValueError("EMBEDDING_URL is not set in the configuration.")
 
         try:
-            response = requests.post(
-                url,
-                json={
-                    "input": text,
-                    "model": "ggml-org/embeddinggemma-300M-GGUF"
-                }
-            )
+            with stage_timer("query_embedding"):
+                response = request(
+                    "embedding",
+                    "POST",
+                    url,
+                    json={
+                        "input": text,
+                        "model": EMBEDDING_MODEL
+                    },
+                    timeout=Config.EMBEDDING_TIMEOUT,
+                    idempotent=True
+                )
             response.raise_for_status()
             return response.json()['data'][0]['embedding']
         except requests.exceptions.RequestException as e:
             print(f"Error calling embedding service: {e}")
             return []
+
+
+class ProgressReportingEmbeddings(Embeddings):
+    """
+    Wraps another Embeddings instance and calls callback(embedded_count)
+    after each group of texts has been embedded.
+    """
+
+    def __init__(self, embeddings: Embeddings, callback, step: int):
+        self.embeddings = embeddings
+        self.callback = callback
+        self.step = max(1, step)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        results = []
+        for start in range(0, len(texts), self.step):
+            results.extend(self.embeddings.embed_documents(texts[start:start + self.step]))
+            self.callback(min(start + self.step, len(texts)))
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+class KnownQueryEmbeddings(Embeddings):
+    """
+    Wraps another Embeddings instance, answering embed_query from known,
+    a dict of query embeddings computed earlier, so they aren't requested
+    from the server twice.
+    """
+
+    def __init__(self, embeddings: Embeddings, known: dict):
+        self.embeddings = embeddings
+        self.known = known
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        if text in self.known:
+            return self.known[text]
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,154 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import closing
+from backend.config import Config
+from backend.services.metrics import record_cache
+
+
+def make_cache_key(model, text):
+    """Content-addressed key for an embedding: a hash of (model name, text)."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding cache stored in a SQLite table.
+
+    Vectors are stored as packed float32 blobs keyed by make_cache_key().
+    Once the table grows past max_entries, the least recently used rows are
+    evicted. The number of rows is kept by triggers in embeddings_count, so
+    checking it doesn't scan the table.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with closing(self._connect()) as conn:
+            # Counted in the same transaction as the triggers are created,
+            # so rows written by other processes meanwhile are not missed
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_embeddings_last_access"
+                " ON embeddings (last_access)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings_count (n INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_count_insert AFTER INSERT ON embeddings"
+                " BEGIN UPDATE embeddings_count SET n = n + 1; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_count_delete AFTER DELETE ON embeddings"
+                " BEGIN UPDATE embeddings_count SET n = n - 1; END"
+            )
+            if conn.execute("SELECT 1 FROM embeddings_count").fetchone() is None:
+                conn.execute("INSERT INTO embeddings_count (n) SELECT COUNT(*) FROM embeddings")
+            conn.commit()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, model, texts):
+        """Returns a dict mapping each cached text to its embedding."""
+        keys = {make_cache_key(model, text): text for text in texts}
+        found = {}
+        if keys:
+            with closing(self._connect()) as conn:
+                key_list = list(keys)
+                # Stay well under SQLite's bound parameter limit.
+                for start in range(0, len(key_list), 500):
+                    chunk = key_list[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[keys[key]] = array("f", blob).tolist()
+                if found:
+                    now = time.time()
+                    conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                        [(now, make_cache_key(model, text)) for text in found]
+                    )
+                    conn.commit()
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        record_cache("embedding", len(found), len(keys) - len(found))
+        return found
+
+    def put_many(self, model, items):
+        """Stores (text, embedding) pairs and evicts old entries if needed."""
+        now = time.time()
+        rows = [
+            (make_cache_key(model, text), model, array("f", vector).tobytes(), now)
+            for text, vector in items if vector
+        ]
+        if not rows:
+            return
+        with closing(self._connect()) as conn:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete
+            # would not fire the count trigger
+            conn.executemany(
+                "INSERT INTO embeddings (key, model, vector, last_access)"
+                " VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET"
+                " vector = excluded.vector, last_access = excluded.last_access",
+                rows
+            )
+            count = conn.execute("SELECT n FROM embeddings_count").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters for this process and the cache size."""
+        with closing(self._connect()) as conn:
+            entries = conn.execute("SELECT n FROM embeddings_count").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """
+    Returns the shared EmbeddingCache for the configured path, or None if
+    the cache is disabled.
+    """
+    path = Config.EMBEDDING_CACHE_PATH
+    if not path:
+        return None
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = EmbeddingCache(path, Config.EMBEDDING_CACHE_MAX_ENTRIES)
+            _caches[path] = cache
+        return cache
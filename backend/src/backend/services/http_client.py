@@ -0,0 +1,233 @@
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from backend.config import Config
+from backend.services.metrics import inc
+
+# Every call to the model servers and to Bing goes through request() below:
+#
+# - connections come from one pooled requests.Session;
+# - the timeout of each call is capped by the deadline of the request being
+#   served (see request_deadline()), so a stalled backend can't hold a
+#   worker past it;
+# - idempotent calls are retried on connection errors, timeouts and 5xx
+#   responses, with exponential backoff and full jitter;
+# - each backend has a circuit breaker: after CIRCUIT_FAILURE_THRESHOLD
+#   consecutive failures, calls fail immediately with CircuitOpenError for
+#   CIRCUIT_RESET_SECONDS, after which a single probe call is let through.
+#
+# CircuitOpenError and DeadlineExceeded are RequestExceptions, so callers'
+# existing error handling turns them into a degraded response.
+RETRY_STATUSES = {500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised instead of calling a backend once the request deadline has passed."""
+
+
+def get_session():
+    """
+    Returns the process-wide requests.Session used for calls to the model
+    servers, so connections are kept alive and reused between requests.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=Config.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=Config.HTTP_POOL_MAXSIZE
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one backend."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Returns whether a call may be made now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let one probe call through; its outcome closes or reopens the circuit
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logging.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(backend):
+    """Returns the circuit breaker of a backend."""
+    with _breakers_lock:
+        breaker = _breakers.get(backend)
+        if breaker is None:
+            breaker = CircuitBreaker(backend, Config.CIRCUIT_FAILURE_THRESHOLD, Config.CIRCUIT_RESET_SECONDS)
+            _breakers[backend] = breaker
+        return breaker
+
+
+def reset_breakers():
+    """Forgets the state of all circuit breakers."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+class Deadline:
+    """The time by which the request being served must be answered."""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+        # Set when a backend call failed, so the result is degraded
+        self.degraded = False
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds):
+    """
+    Sets the deadline for backend calls made in this context, unless an
+    enclosing one is already set. Yields the Deadline in effect.
+    """
+    deadline = _deadline.get()
+    if deadline is not None:
+        yield deadline
+        return
+    deadline = Deadline(seconds)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline():
+    """Returns the Deadline of the request being served, or None."""
+    return _deadline.get()
+
+
+def get_timeout(timeout):
+    """Caps timeout by the remaining time of the current deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(timeout, remaining)
+
+
+def mark_degraded():
+    """
+    Marks the result of the request being served as degraded, so it isn't
+    cached. Called for failed backend calls, including ones whose error
+    response request() returned to the caller.
+    """
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.degraded = True
+
+
+def request(backend, method, url, *, timeout, idempotent=False, **kwargs):
+    """
+    Sends a request to a backend through the shared session and returns
+    the response. Only idempotent requests are retried.
+    """
+    breaker = get_breaker(backend)
+    retries = Config.HTTP_MAX_RETRIES if idempotent else 0
+    send = getattr(get_session(), method.lower())
+
+    for attempt in range(retries + 1):
+        # Checked before allow(), which may take the half-open breaker's
+        # only probe
+        try:
+            call_timeout = get_timeout(timeout)
+        except DeadlineExceeded:
+            mark_degraded()
+            raise
+        if not breaker.allow():
+            inc("rag_backend_errors_total", backend=backend)
+            mark_degraded()
+            raise CircuitOpenError(f"{backend} is unavailable (circuit open)")
+
+        error = None
+        try:
+            response = send(url, timeout=call_timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+        except BaseException:
+            # Any other failure still settles a half-open breaker
+            breaker.record_failure()
+            inc("rag_backend_errors_total", backend=backend)
+            mark_degraded()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+        breaker.record_failure()
+        inc("rag_backend_errors_total", backend=backend)
+
+        if attempt == retries:
+            mark_degraded()
+            if error is not None:
+                raise error
+            return response
+
+        # Exponential backoff with full jitter, within the deadline
+        delay = random.uniform(0, Config.HTTP_RETRY_BACKOFF * 2 ** attempt)
+        deadline = _deadline.get()
+        if deadline is not None:
+            delay = min(delay, max(0.0, deadline.remaining()))
+        logging.info(f"Retrying {backend} request in {delay:.2f}s after {error or response.status_code}")
+        time.sleep(delay)
@@ -0,0 +1,67 @@
+from typing import Any, List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from backend.services.lexical_index import get_chunks, search_chunk_ids
+from backend.services.metrics import stage_timer
+
+# Constant from the original reciprocal rank fusion paper; it damps the
+# weight of the very top ranks so neither list dominates.
+RRF_K = 60
+
+
+def fuse_ranked_keys(key_lists, k=RRF_K):
+    """
+    Merges ranked lists of keys, scoring each key by the sum of
+    1 / (k + rank) over the lists it appears in.
+    """
+    scores = {}
+    for keys in key_lists:
+        for rank, key in enumerate(keys, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _doc_key(doc):
+    return doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K):
+    """
+    Merges ranked lists of documents with reciprocal rank fusion. Documents
+    are identified by their docstore id.
+    """
+    docs = {}
+    for results in result_lists:
+        for doc in results:
+            docs.setdefault(_doc_key(doc), doc)
+    return [docs[key] for key in fuse_ranked_keys([[_doc_key(doc) for doc in results] for results in result_lists], k)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Combines a vector retriever with BM25 keyword search over the user's
+    chunks, which catches exact names and tickers that embeddings miss.
+    Returns the top k documents after reciprocal rank fusion; keyword hits
+    are ranked by id and only the ones among the top k are loaded.
+    """
+    vector_retriever: Any
+    user_id: int
+    lexical_k: int = 10
+    k: int = 10
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector_docs = self.vector_retriever.invoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+        docs = {}
+        for doc in vector_docs:
+            docs.setdefault(_doc_key(doc), doc)
+        with stage_timer("keyword_search"):
+            lexical_ids = search_chunk_ids(self.user_id, query, self.lexical_k)
+            keys = fuse_ranked_keys([[_doc_key(doc) for doc in vector_docs], lexical_ids])[:self.k]
+            for doc in get_chunks([key for key in keys if key not in docs]):
+                docs[doc.id] = doc
+        return [docs[key] for key in keys if key in docs]
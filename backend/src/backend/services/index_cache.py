@@ -0,0 +1,145 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from backend.config import Config
+from backend.services.metrics import record_cache
+
+INDEX_FILE = "index.faiss"
+# Segments keep their chunks either in a pickle or in a chunk store
+DOCSTORE_FILES = ("index.pkl", "chunks.dat")
+
+
+def _docstore_file(index_path):
+    for name in DOCSTORE_FILES:
+        if os.path.exists(os.path.join(index_path, name)):
+            return name
+    return None
+
+
+def get_index_version(index_path):
+    """
+    Returns a token identifying the on-disk version of a saved FAISS index,
+    or None if the index files are missing.
+    """
+    docstore_file = _docstore_file(index_path)
+    if docstore_file is None:
+        return None
+    version = []
+    for name in (INDEX_FILE, docstore_file):
+        try:
+            st = os.stat(os.path.join(index_path, name))
+        except OSError:
+            return None
+        version.append((st.st_mtime_ns, st.st_size))
+    return tuple(version)
+
+
+def get_index_size(index_path):
+    """
+    Approximates the memory footprint of an index by its size on disk.
+    Memory-mapped segments share these pages with the other workers.
+    """
+    size = 0
+    try:
+        names = os.listdir(index_path)
+    except OSError:
+        return 0
+    for name in names:
+        try:
+            size += os.path.getsize(os.path.join(index_path, name))
+        except OSError:
+            pass
+    return size
+
+
+class IndexCache:
+    """
+    Process-wide LRU cache of loaded vector stores, keyed by index path
+    (one entry per segment of a user's index).
+
+    Entries are bounded both by count and by total (approximate) bytes. Each
+    entry remembers the on-disk version it was loaded from, so an index
+    rewritten by another worker is reloaded on the next lookup.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, index_path, loader):
+        """
+        Returns the cached vector store for key, calling loader() to load
+        it from index_path on a miss or when the on-disk version changed.
+        """
+        version = get_index_version(index_path)
+        if version is None:
+            # Nothing stable on disk to key the entry on; don't cache.
+            return loader()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("index", 1, 0)
+                return entry[1]
+            self.misses += 1
+        record_cache("index", 0, 1)
+
+        vector_store = loader()
+        size = get_index_size(index_path)
+
+        with self._lock:
+            self._remove(key)
+            if size <= self.max_bytes and self.max_entries > 0:
+                self._entries[key] = (version, vector_store, size)
+                self._total_bytes += size
+                self._evict()
+        return vector_store
+
+    def invalidate(self, key):
+        """Drops the cached vector store for key."""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """Drops all cached vector stores."""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """Returns the cache counters and current occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._total_bytes > self.max_bytes):
+            key, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry[2]
+            self.evictions += 1
+            logging.debug(f"Evicted FAISS index {key} from cache")
+
+
+index_cache = IndexCache(Config.INDEX_CACHE_MAX_ENTRIES, Config.INDEX_CACHE_MAX_BYTES)
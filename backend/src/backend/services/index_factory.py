@@ -0,0 +1,160 @@
+import math
+import faiss
+import numpy as np
+from backend.config import Config
+
+# Index types, from exact to most compact:
+#
+# - flat: exact search, a linear scan over full float32 vectors;
+# - hnsw: HNSW graph over full vectors, sublinear search at some memory
+#   overhead; recall is traded for speed with INDEX_HNSW_EF_SEARCH;
+# - ivfpq: inverted lists of product-quantized vectors, a fraction of the
+#   memory of flat; only INDEX_IVF_NPROBE of the lists are scanned per query.
+#
+# A user's knowledge base has the type chosen for its total size, so its
+# index changes type as it grows (see compact_segments()). Further types can
+# be added with register_index_type().
+FLAT = "flat"
+HNSW = "hnsw"
+IVFPQ = "ivfpq"
+
+# Fewest training points per IVF list and per PQ centroid that faiss accepts
+# without degrading the clustering
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _build_flat(vectors):
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+
+def _build_hnsw(vectors):
+    index = faiss.IndexHNSWFlat(vectors.shape[1], Config.INDEX_HNSW_M)
+    index.hnsw.efConstruction = Config.INDEX_HNSW_EF_CONSTRUCTION
+    index.add(vectors)
+    return index
+
+
+def _pq_subquantizers(dimension):
+    """Returns the largest divisor of dimension not above INDEX_PQ_M."""
+    m = max(1, min(Config.INDEX_PQ_M, dimension))
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def _build_ivfpq(vectors):
+    n, dimension = vectors.shape
+    nlist = Config.INDEX_IVF_NLIST or int(4 * math.sqrt(n))
+    nlist = max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+    nbits = 8 if n >= MIN_POINTS_PER_CENTROID * 256 else 4
+    index = faiss.IndexIVFPQ(
+        faiss.IndexFlatL2(dimension), dimension, nlist, _pq_subquantizers(dimension), nbits
+    )
+    sample_size = min(n, max(nlist, 2 ** nbits) * 256)
+    if sample_size < n:
+        sample = vectors[np.random.default_rng(0).choice(n, sample_size, replace=False)]
+    else:
+        sample = vectors
+    index.train(sample)
+    index.add(vectors)
+    return index
+
+
+_builders = {
+    FLAT: _build_flat,
+    HNSW: _build_hnsw,
+    IVFPQ: _build_ivfpq,
+}
+
+
+def register_index_type(name, builder):
+    """Registers builder(vectors) -> faiss index under an index type name."""
+    _builders[name] = builder
+
+
+def choose_index_type(vector_count):
+    """Returns the index type for a knowledge base of vector_count chunks."""
+    if vector_count >= Config.INDEX_IVFPQ_THRESHOLD:
+        return IVFPQ
+    if vector_count >= Config.INDEX_HNSW_THRESHOLD:
+        return HNSW
+    return FLAT
+
+
+def build_index(vectors, index_type=None):
+    """
+    Builds a faiss index holding vectors (in order), of index_type or of
+    the type chosen for their number.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if index_type is None:
+        index_type = choose_index_type(len(vectors))
+    return _builders[index_type](vectors)
+
+
+def get_index_type(index):
+    """Returns the type name of a faiss index."""
+    if isinstance(index, faiss.IndexHNSW):
+        return HNSW
+    if isinstance(index, faiss.IndexIVFPQ):
+        return IVFPQ
+    if isinstance(index, faiss.IndexFlat):
+        return FLAT
+    return type(index).__name__
+
+
+def configure_search(index):
+    """Applies the configured recall/latency parameters to a loaded index."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = Config.INDEX_HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = Config.INDEX_IVF_NPROBE
+    return index
+
+
+def reconstruct_vectors(index):
+    """
+    Returns the vectors stored in an index. Product-quantized vectors come
+    back decoded, so they only approximate the original embeddings.
+    """
+    if not index.ntotal:
+        return np.empty((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def is_lossy(index):
+    """Returns whether reconstruct_vectors() only approximates an index's vectors."""
+    return isinstance(index, faiss.IndexIVFPQ)
+
+
+def supports_removal(index):
+    """Returns whether remove_vectors() can remove vectors from an index."""
+    return isinstance(index, faiss.IndexIVF)
+
+
+def remove_vectors(index, positions):
+    """
+    Removes the vectors at positions from a writable IVF index (not a
+    memory-mapped one) without retraining or re-encoding the others. Those
+    are renumbered to keep positions 0..ntotal-1 in their order.
+    """
+    removed = np.unique(np.asarray(positions, dtype=np.int64))
+    if not len(removed):
+        return index
+    # A direct map would be left pointing at the old positions
+    index.make_direct_map(False)
+    index.remove_ids(removed)
+    invlists = index.invlists
+    for list_no in range(index.nlist):
+        size = invlists.list_size(list_no)
+        if not size:
+            continue
+        ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy()
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+        ids -= np.searchsorted(removed, ids)
+        invlists.update_entries(list_no, 0, size, faiss.swig_ptr(ids), faiss.swig_ptr(codes))
+    return index
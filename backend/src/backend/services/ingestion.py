@@ -0,0 +1,175 @@
+import datetime
+import logging
+import threading
+from backend.models import db, IngestionJob
+from backend.services.knowledge_base import add_document_to_kb, DuplicateDocumentError
+
+# Jobs move from queued -> running -> done / duplicate / failed. A running job whose
+# updated_at is older than INGESTION_JOB_TIMEOUT_SECONDS is assumed to belong
+# to a crashed worker and is queued again (up to INGESTION_MAX_ATTEMPTS).
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_DUPLICATE = 'duplicate'
+JOB_FAILED = 'failed'
+
+_wakeup = threading.Event()
+
+
+def enqueue_ingestion(user_id, file_path, document_type, source=None, tags=None):
+    """Adds an uploaded file to the ingestion queue and returns the job."""
+    job = IngestionJob(
+        user_id=user_id,
+        file_path=file_path,
+        document_type=document_type,
+        source=source,
+        tags=tags,
+        status=JOB_QUEUED
+    )
+    db.session.add(job)
+    db.session.commit()
+    _wakeup.set()
+    return job
+
+
+def get_job(user_id, job_id):
+    """Returns one of a user's ingestion jobs, or None."""
+    return IngestionJob.query.filter_by(id=job_id, user_id=user_id).first()
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
+
+
+def _requeue_stale_jobs(app):
+    cutoff = _utcnow() - datetime.timedelta(seconds=app.config['INGESTION_JOB_TIMEOUT_SECONDS'])
+    stale = IngestionJob.query.filter(
+        IngestionJob.status == JOB_RUNNING, IngestionJob.updated_at < cutoff
+    ).all()
+    for job in stale:
+        if job.attempts >= app.config['INGESTION_MAX_ATTEMPTS']:
+            job.status = JOB_FAILED
+            job.error = "Job timed out"
+        else:
+            job.status = JOB_QUEUED
+        job.updated_at = _utcnow()
+    if stale:
+        db.session.commit()
+
+
+def _claim(job_id):
+    """
+    Atomically moves a queued job to running. The conditional UPDATE makes
+    sure only one worker wins a given job, even across processes.
+    """
+    claimed = IngestionJob.query.filter_by(id=job_id, status=JOB_QUEUED).update({
+        "status": JOB_RUNNING,
+        "attempts": IngestionJob.attempts + 1,
+        "updated_at": _utcnow()
+    })
+    db.session.commit()
+    return bool(claimed)
+
+
+def _claim_next_job(app):
+    """Claims the oldest queued job and returns its id, or None."""
+    _requeue_stale_jobs(app)
+    while True:
+        job = IngestionJob.query.filter_by(status=JOB_QUEUED).order_by(IngestionJob.id).first()
+        if job is None:
+            return None
+        if _claim(job.id):
+            return job.id
+
+
+def run_job(job_id):
+    """Processes a single ingestion job, recording progress and errors."""
+    job = db.session.get(IngestionJob, job_id)
+
+    def progress(embedded, total):
+        IngestionJob.query.filter_by(id=job_id).update({
+            "chunks_embedded": embedded,
+            "chunks_total": total,
+            "updated_at": _utcnow()
+        })
+        db.session.commit()
+
+    try:
+        doc = add_document_to_kb(
+            job.user_id,
+            job.file_path,
+            job.document_type,
+            job.source,
+            job.tags,
+            progress=progress,
+            job_id=job_id
+        )
+    except DuplicateDocumentError as e:
+        db.session.rollback()
+        logging.info(f"Ingestion job {job_id} skipped: {e}")
+        IngestionJob.query.filter_by(id=job_id).update({
+            "status": JOB_DUPLICATE,
+            "document_id": e.document_id,
+            "error": str(e),
+            "updated_at": _utcnow()
+        })
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Ingestion job {job_id} failed: {e}")
+        IngestionJob.query.filter_by(id=job_id).update({
+            "status": JOB_FAILED,
+            "error": str(e),
+            "updated_at": _utcnow()
+        })
+        db.session.commit()
+        return False
+
+    IngestionJob.query.filter_by(id=job_id).update({
+        "status": JOB_DONE,
+        "document_id": doc.id,
+        "updated_at": _utcnow()
+    })
+    db.session.commit()
+    return True
+
+
+def run_queued_job(job_id):
+    """Runs a specific queued job in the calling thread, if no worker took it."""
+    if _claim(job_id):
+        return run_job(job_id)
+    return False
+
+
+def process_next_job(app):
+    """Claims and runs the next queued job. Returns False if the queue was empty."""
+    with app.app_context():
+        job_id = _claim_next_job(app)
+        if job_id is None:
+            return False
+        run_job(job_id)
+        return True
+
+
+def _worker_loop(app):
+    while True:
+        try:
+            if process_next_job(app):
+                continue
+        except Exception as e:
+            logging.error(f"Ingestion worker error: {e}")
+        _wakeup.wait(app.config['INGESTION_POLL_SECONDS'])
+        _wakeup.clear()
+
+
+def start_ingestion_workers(app):
+    """Starts the configured number of daemon threads that drain the queue."""
+    threads = []
+    for i in range(app.config['INGESTION_WORKERS']):
+        thread = threading.Thread(
+            target=_worker_loop, args=(app,), name=f"ingestion-{i}", daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
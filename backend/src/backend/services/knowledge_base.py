@@ -1,21 +1,48 @@
 import os
-from langchain_community.vectorstores import FAISS
+import uuid
+import logging
+import datetime
 from langchain_community.document_loaders import TextLoader, PyPDFLoader, UnstructuredExcelLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from backend.services.embedding import LlamaServerEmbeddings
-from backend.models import db, Document
+from langchain_core.documents import Document as LangchainDocument
+from backend.services.embedding import LlamaServerEmbeddings, ProgressReportingEmbeddings
+from backend.services.vector_store import (
+    build_segment, publish_segment, merge_segments, compact_segments, find_ids, load_user_vector_store
+)
+from backend.services.dedup import simhash, find_near_duplicate, record_fingerprint, delete_fingerprint
+from backend.services.lexical_index import index_chunks, remove_document_chunks
+from backend.services.document_text import store_document_text, delete_document_text
+from backend.services.term_stats import index_document_terms, remove_document_terms
+from backend.services.metrics import stage_timer, track_request
+from sqlalchemy.orm import aliased
+from backend.models import db, User, Document, DocumentChunk, IngestionJob, LEGACY_DOCUMENT_ID
 from backend.config import Config
 
 
+class DuplicateDocumentError(ValueError):
+    """Raised when a document is a near-duplicate of one already in the knowledge base."""
+
+    def __init__(self, document_id):
+        super().__init__(f"Near-duplicate of document {document_id}")
+        self.document_id = document_id
+
+
 def get_user_faiss_index_path(user_id):
     """Constructs the path for a user's FAISS index."""
     return os.path.join(Config.FAISS_INDEX_PATH, f"user_{user_id}")
 
 
-def add_document_to_kb(user_id, file_path, document_type, source=None, tags=None):
+@track_request("ingest", expected=(DuplicateDocumentError,))
+def add_document_to_kb(user_id, file_path, document_type, source=None, tags=None, progress=None,
+                       job_id=None):
     """
     Adds a document to the knowledge base: loads, chunks, embeds,
     and stores it in a user-specific FAISS vector store.
+    If given, progress(chunks_embedded, chunks_total) is called as
+    embedding proceeds. Raises DuplicateDocumentError, before anything is
+    embedded, if the text is a near-duplicate of an existing document; the
+    file is deleted then, unless a document or another ingestion job than
+    job_id (the one running this ingest, if any) refers to it.
     """
     if not user_id:
         raise ValueError("User ID must be provided.")
@@ -29,30 +56,44 @@ def add_document_to_kb(user_id, file_path, document_type, source=None, tags=None
         loader = UnstructuredExcelLoader(file_path)
     else:
         raise ValueError(f"Unsupported document type: {document_type}")
-    
-    documents = loader.load()
+
+    with stage_timer("document_load"):
+        documents = loader.load()
+    text = "\n".join(d.page_content for d in documents)
+
+    # Skip near-duplicates (e.g. the same wire story from several feeds)
+    fingerprint = None
+    if Config.DEDUP_ENABLED:
+        fingerprint = simhash(text)
+        if fingerprint is not None:
+            duplicate_id = find_near_duplicate(user_id, fingerprint, Config.DEDUP_MAX_DISTANCE)
+            if duplicate_id is not None:
+                _remove_unreferenced_file(file_path, job_id)
+                raise DuplicateDocumentError(duplicate_id)
 
     # 2. Chunk the document
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    docs = text_splitter.split_documents(documents)
-    
-    # 3. Create vector embeddings
-    embeddings = LlamaServerEmbeddings()
+    with stage_timer("chunking"):
+        docs = text_splitter.split_documents(documents)
 
-    # 4. Store in FAISS vector store
-    index_path = get_user_faiss_index_path(user_id)
-    
-    if os.path.exists(index_path):
-        # Load existing vector store and add new documents
-        vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-        vector_store.add_documents(docs)
-    else:
-        # Create a new vector store
-        vector_store = FAISS.from_documents(docs, embeddings)
+    chunk_ids = [uuid.uuid4().hex for _ in docs]
 
-    vector_store.save_local(index_path)
+    # 3. Create vector embeddings
+    embeddings = LlamaServerEmbeddings(raise_errors=True)
+    if progress:
+        progress(0, len(docs))
+        embeddings = ProgressReportingEmbeddings(
+            embeddings,
+            lambda embedded: progress(embedded, len(docs)),
+            Config.EMBEDDING_BATCH_SIZE * Config.EMBEDDING_MAX_CONCURRENCY
+        )
+    with stage_timer("embedding"):
+        segment = build_segment(docs, chunk_ids, embeddings) if docs else None
 
-    # 5. Save metadata to database
+    # 4. Save the document and its chunks before the vectors are published.
+    # The chunks start out tombstoned, so vectors of an ingest that fails or
+    # crashes before they are made live are skipped by search and removed by
+    # compaction, and the document id is never handed out again
     new_doc = Document(
         user_id=user_id,
         file_path=file_path,
@@ -61,39 +102,265 @@ def add_document_to_kb(user_id, file_path, document_type, source=None, tags=None
         tags=tags
     )
     db.session.add(new_doc)
+    db.session.flush()
+    chunks = [
+        DocumentChunk(user_id=user_id, document_id=new_doc.id, docstore_id=chunk_id, deleted=True)
+        for chunk_id in chunk_ids
+    ]
+    db.session.add_all(chunks)
     db.session.commit()
-    
+
+    try:
+        # 5. Store the chunks as a new segment of the user's FAISS index
+        if segment is not None:
+            for chunk_id in chunk_ids:
+                segment.docstore.search(chunk_id).metadata["document_id"] = new_doc.id
+            with stage_timer("index_write"):
+                publish_segment(get_user_faiss_index_path(user_id), segment)
+
+        # 6. Make the chunks live and index their text for keyword search
+        for chunk in chunks:
+            chunk.deleted = False
+        index_chunks(user_id, [
+            (chunk.id, doc.page_content, dict(doc.metadata, document_id=new_doc.id))
+            for chunk, doc in zip(chunks, docs)
+        ])
+        if fingerprint is not None:
+            record_fingerprint(user_id, new_doc.id, fingerprint)
+        # Keep the extracted text so reports needn't parse the file again
+        store_document_text(user_id, new_doc.id, text)
+        index_document_terms(user_id, new_doc.id, text)
+        bump_kb_version(user_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _discard_document(new_doc.id)
+        raise
+
+    # 7. Merge the small segments once there are enough of them, as each
+    # ingest publishes one and searches go through them all
+    if segment is not None:
+        try:
+            with stage_timer("segment_merge"):
+                merge_segments(
+                    get_user_faiss_index_path(user_id),
+                    LlamaServerEmbeddings(raise_errors=True),
+                    Config.KB_SEGMENT_MERGE_THRESHOLD,
+                    Config.KB_SEGMENT_MERGE_MIN_SEGMENTS,
+                )
+        except Exception as e:
+            # Compaction merges them later
+            logging.error(f"Error merging FAISS index segments for user {user_id}: {e}")
+
     return new_doc
 
 def delete_document_from_kb(doc_id):
     """
     Deletes a document from the knowledge base.
-    Note: This only deletes the metadata. The vectors in FAISS are not removed
-    to avoid complexity. A full implementation would require rebuilding the index.
+    The document's chunks leave the keyword index and are tombstoned so
+    they are excluded from search right away; their vectors are removed by
+    the next index compaction.
     """
     doc = Document.query.get(doc_id)
     if not doc:
         return False
-    
-    # For simplicity, we only delete the metadata and the file.
-    # A robust implementation would also remove the corresponding vectors from FAISS.
+
+    # Chunks indexed by earlier versions can only be tombstoned once recorded
+    record_legacy_chunks(doc.user_id)
     if os.path.exists(doc.file_path):
         os.remove(doc.file_path)
-        
+
+    remove_document_chunks(doc.id)
+    DocumentChunk.query.filter_by(document_id=doc.id).update({"deleted": True})
+    delete_fingerprint(doc.id)
+    delete_document_text(doc.id)
+    remove_document_terms(doc.user_id, doc.id)
+    bump_kb_version(doc.user_id)
     db.session.delete(doc)
     db.session.commit()
     return True
 
+def _remove_unreferenced_file(file_path, job_id=None):
+    """
+    Deletes a file that was not added to the knowledge base, unless a
+    document uses it or a queued or running ingestion job other than
+    job_id is yet to read it.
+    """
+    if db.session.query(Document.id).filter_by(file_path=file_path).first() is not None:
+        return
+    pending = db.session.query(IngestionJob.id).filter(
+        IngestionJob.file_path == file_path,
+        IngestionJob.status.in_(('queued', 'running'))
+    )
+    if job_id is not None:
+        pending = pending.filter(IngestionJob.id != job_id)
+    if pending.first() is None and os.path.exists(file_path):
+        os.remove(file_path)
+
+def _discard_document(doc_id):
+    """
+    Deletes the row of a document whose ingest failed. Its chunks stay
+    tombstoned, so compaction removes any vectors that were published.
+    """
+    Document.query.filter_by(id=doc_id).delete()
+    DocumentChunk.query.filter_by(document_id=doc_id).update({"deleted": True})
+    db.session.commit()
+
+def _legacy_chunk_document(metadata, document_ids, documents_by_path):
+    """Returns the id of the document a chunk indexed by an earlier version belongs to."""
+    document_id = metadata.get("document_id")
+    if document_id in document_ids:
+        return document_id
+    # Loaders record the file a chunk came from as its source. Documents
+    # uploaded more than once under the same path can't be told apart
+    matches = documents_by_path.get(metadata.get("source") or metadata.get("file_path"), [])
+    return matches[0] if len(matches) == 1 else LEGACY_DOCUMENT_ID
+
+def record_legacy_chunks(user_id):
+    """
+    Adds the DocumentChunk rows, and the keyword index entries, of the
+    vectors in a user's index that have none, i.e. were indexed before the
+    rows were kept. Runs once per user, before compaction can take such
+    vectors for orphans. A chunk is mapped to its document by its
+    document_id or source metadata; chunks that can't be mapped are
+    recorded under LEGACY_DOCUMENT_ID and kept.
+    """
+    if db.session.query(User.chunks_recorded).filter_by(id=user_id).scalar() is not False:
+        return
+    # Ingests record their chunks before publishing them, so reading the
+    # index first means every id recorded for it is seen below
+    vector_store = load_user_vector_store(get_user_faiss_index_path(user_id), LlamaServerEmbeddings())
+    count = 0
+    if vector_store is not None:
+        recorded = {row[0] for row in db.session.query(DocumentChunk.docstore_id).filter_by(user_id=user_id)}
+        document_ids = set()
+        documents_by_path = {}
+        for document_id, file_path in db.session.query(Document.id, Document.file_path).filter_by(user_id=user_id):
+            document_ids.add(document_id)
+            documents_by_path.setdefault(file_path, []).append(document_id)
+        for segment in vector_store.segments:
+            chunks = []
+            for docstore_id in segment.index_to_docstore_id.values():
+                if docstore_id in recorded:
+                    continue
+                recorded.add(docstore_id)
+                doc = segment.docstore.search(docstore_id)
+                if not isinstance(doc, LangchainDocument):
+                    doc = LangchainDocument(page_content="")
+                document_id = _legacy_chunk_document(doc.metadata, document_ids, documents_by_path)
+                chunk = DocumentChunk(user_id=user_id, document_id=document_id, docstore_id=docstore_id)
+                metadata = doc.metadata if document_id == LEGACY_DOCUMENT_ID else dict(
+                    doc.metadata, document_id=document_id
+                )
+                chunks.append((chunk, doc.page_content, metadata))
+            db.session.add_all(chunk for chunk, _, _ in chunks)
+            db.session.flush()
+            index_chunks(user_id, [(chunk.id, content, metadata) for chunk, content, metadata in chunks])
+            count += len(chunks)
+    User.query.filter_by(id=user_id).update({"chunks_recorded": True})
+    db.session.commit()
+    if count:
+        logging.info(f"Recorded {count} chunks indexed by an earlier version for user {user_id}")
+
+def get_kb_version(user_id):
+    """Returns the version number of a user's knowledge base."""
+    return db.session.query(User.kb_version).filter_by(id=user_id).scalar() or 0
+
+def bump_kb_version(user_id):
+    """Marks a user's knowledge base as changed (the caller commits)."""
+    User.query.filter_by(id=user_id).update({"kb_version": User.kb_version + 1})
+
+def get_tombstoned_chunks(user_id):
+    """
+    Returns (document_id, docstore_id) pairs for a user's deleted chunks
+    whose vectors are still in the index.
+    """
+    return db.session.query(DocumentChunk.document_id, DocumentChunk.docstore_id).filter_by(
+        user_id=user_id, deleted=True
+    ).all()
+
+def _discard_crashed_ingests(user_id):
+    """
+    Deletes documents whose ingest crashed before their chunks were made
+    live, once INGESTION_JOB_TIMEOUT_SECONDS have passed since the upload.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=Config.INGESTION_JOB_TIMEOUT_SECONDS)
+    live = aliased(DocumentChunk)
+    doc_ids = [row[0] for row in db.session.query(Document.id).join(
+        DocumentChunk, DocumentChunk.document_id == Document.id
+    ).filter(
+        Document.user_id == user_id, Document.uploaded_at < cutoff, DocumentChunk.deleted.is_(True),
+        ~db.session.query(live.id).filter(live.document_id == Document.id, live.deleted.is_(False)).exists()
+    ).distinct()]
+    for doc_id in doc_ids:
+        logging.warning(f"Discarding document {doc_id} of an interrupted ingest")
+        _discard_document(doc_id)
+
+def compact_user_index(user_id):
+    """
+    Removes tombstoned chunks of deleted documents, and vectors without any
+    DocumentChunk row, from a user's FAISS index and merges its small
+    segments. Returns the number of vectors removed.
+    """
+    index_path = get_user_faiss_index_path(user_id)
+    if not os.path.exists(index_path):
+        return 0
+
+    # Vectors of earlier versions have no rows yet and would be taken for orphans
+    record_legacy_chunks(user_id)
+    _discard_crashed_ingests(user_id)
+    # Chunks of documents still being ingested are tombstoned too; skip them
+    tombstones = DocumentChunk.query.filter(
+        DocumentChunk.user_id == user_id,
+        DocumentChunk.deleted.is_(True),
+        ~db.session.query(Document.id).filter(Document.id == DocumentChunk.document_id).exists()
+    ).all()
+    deleted_ids = {t.docstore_id for t in tombstones}
+    embeddings = LlamaServerEmbeddings(raise_errors=True)
+    removed = compact_segments(
+        index_path,
+        embeddings,
+        deleted_ids,
+        Config.KB_SEGMENT_MERGE_THRESHOLD,
+        Config.KB_SEGMENT_MERGE_MIN_SEGMENTS,
+        known_ids=lambda: {
+            row[0] for row in db.session.query(DocumentChunk.docstore_id).filter_by(user_id=user_id)
+        },
+        hnsw_rebuild_ratio=Config.KB_HNSW_REBUILD_DELETED_RATIO
+    )
+
+    # Keep tombstones whose vectors are still indexed, e.g. in a segment
+    # published after compaction read the manifest
+    remaining = find_ids(index_path, embeddings, deleted_ids)
+    for tombstone in tombstones:
+        if tombstone.docstore_id not in remaining:
+            db.session.delete(tombstone)
+    db.session.commit()
+    return removed
+
+def compact_all_indexes(app):
+    """Compacts and merges the FAISS index segments of every user."""
+    with app.app_context():
+        user_ids = [row[0] for row in db.session.query(User.id).all()]
+        for user_id in user_ids:
+            try:
+                removed = compact_user_index(user_id)
+                if removed:
+                    logging.info(f"Compacted FAISS index for user {user_id}: removed {removed} vectors")
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error compacting FAISS index for user {user_id}: {e}")
+
 def update_document_metadata(doc_id, source=None, tags=None):
     """Updates the metadata of a document."""
     doc = Document.query.get(doc_id)
     if not doc:
         return None
-    
+
     if source is not None:
         doc.source = source
     if tags is not None:
         doc.tags = tags
-        
+
     db.session.commit()
     return doc
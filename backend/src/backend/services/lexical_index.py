@@ -0,0 +1,93 @@
+import re
+import json
+from sqlalchemy import text, bindparam
+from langchain_core.documents import Document
+from backend.models import db, CHUNK_FTS_TABLE
+
+# Keyword index of chunk text in the SQLite FTS5 table CHUNK_FTS_TABLE. It is
+# maintained in the same transaction as the DocumentChunk rows, so it always
+# matches the documents in the database.
+_TERM_RE = re.compile(r"\w+")
+
+
+def _user_key(user_id):
+    return f"u{user_id}"
+
+
+def build_match_query(query):
+    """
+    Turns free text into an FTS5 query matching any of its terms, or returns
+    None if it has none. Terms are quoted so FTS5 operators in user input
+    are taken literally.
+    """
+    terms = dict.fromkeys(_TERM_RE.findall(query.lower()))
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def index_chunks(user_id, chunks):
+    """
+    Adds (chunk_id, text, metadata) tuples to the keyword index, where
+    chunk_id is the DocumentChunk id. The caller commits.
+    """
+    if not chunks:
+        return
+    db.session.execute(
+        text(f"INSERT INTO {CHUNK_FTS_TABLE} (rowid, content, user_key, metadata) "
+             "VALUES (:rowid, :content, :user_key, :metadata)"),
+        [
+            {
+                "rowid": chunk_id,
+                "content": content,
+                "user_key": _user_key(user_id),
+                "metadata": json.dumps(metadata, default=str)
+            }
+            for chunk_id, content, metadata in chunks
+        ]
+    )
+
+
+def remove_document_chunks(document_id):
+    """Removes a document's chunks from the keyword index. The caller commits."""
+    db.session.execute(
+        text(f"DELETE FROM {CHUNK_FTS_TABLE} WHERE rowid IN "
+             "(SELECT id FROM document_chunk WHERE document_id = :document_id)"),
+        {"document_id": document_id}
+    )
+
+
+def search_chunk_ids(user_id, query, k):
+    """Returns the docstore ids of a user's k best chunks for a query by BM25 score."""
+    match = build_match_query(query)
+    if match is None:
+        return []
+    rows = db.session.execute(
+        text(f"SELECT c.docstore_id FROM {CHUNK_FTS_TABLE} f "
+             "JOIN document_chunk c ON c.id = f.rowid "
+             f"WHERE {CHUNK_FTS_TABLE} MATCH :match ORDER BY f.rank LIMIT :k"),
+        {"match": f'user_key:"{_user_key(user_id)}" AND ({match})', "k": k}
+    ).all()
+    return [docstore_id for docstore_id, in rows]
+
+
+def get_chunks(docstore_ids):
+    """Returns the chunks with the given docstore ids, in the same order."""
+    if not docstore_ids:
+        return []
+    rows = db.session.execute(
+        text(f"SELECT c.docstore_id, f.content, f.metadata FROM document_chunk c "
+             f"JOIN {CHUNK_FTS_TABLE} f ON f.rowid = c.id "
+             "WHERE c.docstore_id IN :docstore_ids").bindparams(bindparam("docstore_ids", expanding=True)),
+        {"docstore_ids": list(docstore_ids)}
+    ).all()
+    docs = {
+        docstore_id: Document(id=docstore_id, page_content=content, metadata=json.loads(metadata))
+        for docstore_id, content, metadata in rows
+    }
+    return [docs[docstore_id] for docstore_id in docstore_ids if docstore_id in docs]
+
+
+def search_chunks(user_id, query, k):
+    """Returns a user's k best chunks for a query by BM25 score."""
+    return get_chunks(search_chunk_ids(user_id, query, k))
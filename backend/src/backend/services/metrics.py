@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from backend.config import Config
+
+# Prometheus metrics of the RAG pipelines, shared across gunicorn workers.
+#
+# Each process records into its own in-memory registry. When METRICS_DIR is
+# set, a daemon thread writes a snapshot of that registry to
+# METRICS_DIR/metrics_<pid>_<token>.json every METRICS_FLUSH_SECONDS (and at
+# exit), and a scrape adds up the snapshots of all processes, with the live
+# registry in place of the serving process's own file. Snapshots of exited
+# workers are kept, so counters never go backwards when a worker restarts;
+# clear METRICS_DIR when deploying.
+METRICS = {
+    "rag_requests_total": ("counter", "Requests handled, by pipeline."),
+    "rag_errors_total": ("counter", "Requests that failed with an exception, by pipeline."),
+    "rag_backend_errors_total": ("counter", "Failed calls to the model servers and Bing, by backend."),
+    "rag_cache_requests_total": ("counter", "Cache lookups, by cache and result (hit or miss)."),
+    "rag_chunks_embedded_total": ("counter", "Chunks embedded by the embedding server."),
+    "rag_request_duration_seconds": ("histogram", "Duration of whole requests, by pipeline."),
+    "rag_stage_duration_seconds": ("histogram", "Duration of each pipeline stage."),
+}
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SNAPSHOT_PREFIX = "metrics_"
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class MetricsRegistry:
+    """Counters and fixed-bucket histograms of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.token = f"{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self._counters = {}
+        # (name, labels) -> [count per bucket..., count above the last, sum]
+        self._histograms = {}
+        self._flusher = None
+        self._directory = None
+
+    def after_fork(self):
+        """Drops what the parent process recorded; the parent reports it."""
+        self._lock = threading.Lock()
+        self._reset()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._start_flusher()
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(BUCKETS)] += 1
+            histogram[-1] += value
+        self._start_flusher()
+
+    def snapshot(self):
+        """Returns the recorded values in a JSON-serializable form."""
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, list(labels), list(values)]
+                               for (name, labels), values in self._histograms.items()],
+            }
+
+    def flush(self, directory):
+        """Atomically writes this process's snapshot to directory."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{SNAPSHOT_PREFIX}{self.token}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def collect(self, directory=None):
+        """Returns the sum of the snapshots of all processes."""
+        snapshots = [self.snapshot()]
+        if directory and os.path.isdir(directory):
+            own_file = f"{SNAPSHOT_PREFIX}{self.token}.json"
+            for file_name in os.listdir(directory):
+                if not file_name.startswith(SNAPSHOT_PREFIX) or not file_name.endswith(".json"):
+                    continue
+                if file_name == own_file:
+                    continue
+                try:
+                    with open(os.path.join(directory, file_name), encoding="utf-8") as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Skipping metrics snapshot {file_name}: {e}")
+
+        counters = {}
+        histograms = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+        return counters, histograms
+
+    def _start_flusher(self):
+        if self._flusher is not None or not Config.METRICS_DIR:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._directory = Config.METRICS_DIR
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(Config.METRICS_FLUSH_SECONDS)
+            try:
+                self.flush(self._directory)
+            except OSError as e:
+                logging.error(f"Error writing metrics snapshot: {e}")
+
+
+registry = MetricsRegistry()
+os.register_at_fork(after_in_child=registry.after_fork)
+
+
+@atexit.register
+def _flush_at_exit():
+    if registry._flusher is not None:
+        try:
+            registry.flush(registry._directory)
+        except OSError:
+            pass
+
+
+def inc(name, amount=1, **labels):
+    """Adds amount to a counter."""
+    registry.inc(name, amount, **labels)
+
+
+def record_cache(cache, hits, misses):
+    """Counts cache lookups that hit and missed."""
+    if hits:
+        registry.inc("rag_cache_requests_total", hits, cache=cache, result="hit")
+    if misses:
+        registry.inc("rag_cache_requests_total", misses, cache=cache, result="miss")
+
+
+@contextmanager
+def stage_timer(stage):
+    """Times the enclosed block as a pipeline stage. Works as a decorator too."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe("rag_stage_duration_seconds", time.perf_counter() - start, stage=stage)
+
+
+@contextmanager
+def track_request(pipeline, expected=()):
+    """
+    Counts a request of a pipeline and times it. Exceptions other than the
+    expected ones count as errors. Works as a decorator too.
+    """
+    registry.inc("rag_requests_total", pipeline=pipeline)
+    start = time.perf_counter()
+    try:
+        yield
+    except expected:
+        raise
+    except Exception:
+        registry.inc("rag_errors_total", pipeline=pipeline)
+        raise
+    finally:
+        registry.observe("rag_request_duration_seconds", time.perf_counter() - start, pipeline=pipeline)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics():
+    """Returns all processes' metrics in the Prometheus text format."""
+    counters, histograms = registry.collect(Config.METRICS_DIR)
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', repr(bound))])} {cumulative}")
+            count = cumulative + values[len(BUCKETS)]
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(values[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
@@ -1,6 +1,17 @@
 from flask_mail import Message
 from backend.app import mail
+from backend.config import Config
 import logging
+import queue
+import threading
+
+# Notifications queued with queue_notification() are sent by a daemon thread,
+# so SMTP latency and failures never hold up the caller. The thread drains
+# whatever is queued (up to NOTIFICATION_BATCH_SIZE messages) and sends it
+# over a single SMTP connection.
+_outbox = queue.Queue(maxsize=Config.NOTIFICATION_QUEUE_SIZE)
+_sender_lock = threading.Lock()
+_sender = None
 
 def send_notification(subject, recipients, body):
     """Sends an email notification."""
@@ -10,3 +21,56 @@ def send_notification(subject, recipients, body):
         mail.send(msg)
     except Exception as e:
         logging.error(f"Error sending email: {e}")
+
+def send_notifications(notifications):
+    """
+    Sends (subject, recipients, body) notifications over one SMTP
+    connection. Returns the number of emails sent.
+    """
+    sent = 0
+    try:
+        with mail.connect() as conn:
+            for subject, recipients, body in notifications:
+                msg = Message(subject, recipients=recipients)
+                msg.body = body
+                conn.send(msg)
+                sent += 1
+    except Exception as e:
+        logging.error(f"Error sending email: {e} ({len(notifications) - sent} of {len(notifications)} not sent)")
+    return sent
+
+def queue_notification(app, subject, recipients, body):
+    """Queues an email for the background sender without waiting on SMTP."""
+    _start_sender(app)
+    try:
+        _outbox.put_nowait((subject, recipients, body))
+    except queue.Full:
+        logging.warning(f"Notification queue is full; dropping email '{subject}'")
+
+def flush_notifications():
+    """Blocks until every queued notification has been handled."""
+    _outbox.join()
+
+def _start_sender(app):
+    global _sender
+    with _sender_lock:
+        if _sender is None or not _sender.is_alive():
+            _sender = threading.Thread(
+                target=_sender_loop, args=(app,), name="notification-sender", daemon=True
+            )
+            _sender.start()
+
+def _sender_loop(app):
+    with app.app_context():
+        while True:
+            batch = [_outbox.get()]
+            while len(batch) < app.config['NOTIFICATION_BATCH_SIZE']:
+                try:
+                    batch.append(_outbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                send_notifications(batch)
+            finally:
+                for _ in batch:
+                    _outbox.task_done()
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import uuid
+import cProfile
+import logging
+import threading
+from collections import Counter
+from flask import g, request
+from backend.config import Config
+from backend.models import db, User
+
+# Opt-in profiling, written to PROFILE_DIR:
+#
+# - per request: with PROFILING_ENABLED, a request from a user listed in
+#   PROFILING_ADMINS that sends "X-Profile: sample" (or any value other than
+#   "cprofile") is profiled by a stack sampler and saved as folded stacks,
+#   the input format of flamegraph.pl and speedscope. "X-Profile: cprofile"
+#   runs the deterministic profiler instead and saves a pstats file. The
+#   response names the file in its X-Profile-File header;
+# - continuous: with PROFILING_CONTINUOUS, every thread of the process is
+#   sampled at PROFILING_CONTINUOUS_INTERVAL and the folded stacks collected
+#   are written every PROFILING_FLUSH_MINUTES.
+PROFILE_HEADER = "X-Profile"
+PROFILE_FILE_HEADER = "X-Profile-File"
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold_stack(frame):
+    """Returns a frame's stack as 'outermost;...;innermost'."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Samples the stacks of one thread, or of every other thread, at a fixed
+    interval from a daemon thread and counts the folded stacks seen.
+    """
+
+    def __init__(self, interval, thread_id=None, on_tick=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        # Called from the sampler thread after each sample
+        self.on_tick = on_tick
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.take()
+
+    def take(self):
+        """Returns the stacks counted so far and starts counting afresh."""
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+        return counts
+
+    def sample(self):
+        own_id = threading.get_ident()
+        frames = sys._current_frames()
+        if self.thread_id is not None:
+            frames = {self.thread_id: frames[self.thread_id]} if self.thread_id in frames else {}
+        stacks = [fold_stack(frame) for thread_id, frame in frames.items() if thread_id != own_id]
+        with self._lock:
+            self.counts.update(stacks)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if self.on_tick is not None:
+                self.on_tick()
+
+
+def write_folded(counts, path):
+    """Writes stack counts in the folded format ('stack count' per line)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for stack, count in counts.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp_path, path)
+
+
+def _profile_path(name, extension):
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(Config.PROFILE_DIR, f"{stamp}_{name}_{uuid.uuid4().hex[:6]}.{extension}")
+
+
+def _is_profiling_admin():
+    from backend.auth.routes import get_current_user_id
+    admins = {name.strip() for name in Config.PROFILING_ADMINS.split(",") if name.strip()}
+    if not admins:
+        return False
+    try:
+        user_id = get_current_user_id()
+    except IndexError:
+        # Malformed Authorization header
+        return False
+    if user_id is None:
+        return False
+    user = db.session.get(User, user_id)
+    return user is not None and user.username in admins
+
+
+def _start_request_profile():
+    mode = request.headers.get(PROFILE_HEADER)
+    if not Config.PROFILING_ENABLED or not mode or not _is_profiling_admin():
+        return
+    name = (request.endpoint or "request").replace(".", "_")
+    if mode.lower() == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        g.profile = ("cprofile", profiler, _profile_path(name, "prof"))
+    else:
+        sampler = StackSampler(Config.PROFILING_SAMPLE_INTERVAL, threading.get_ident()).start()
+        g.profile = ("sample", sampler, _profile_path(name, "folded"))
+
+
+def _finish_request_profile(response):
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+    kind, profiler, path = profile
+
+    def save():
+        # Runs once the response body has been sent, so streamed
+        # responses are profiled to the end
+        try:
+            if kind == "cprofile":
+                profiler.disable()
+                profiler.dump_stats(path)
+            else:
+                write_folded(profiler.stop(), path)
+            logging.info(f"Saved request profile to {path}")
+        except OSError as e:
+            logging.error(f"Error saving request profile: {e}")
+
+    response.call_on_close(save)
+    response.headers[PROFILE_FILE_HEADER] = os.path.basename(path)
+    return response
+
+
+def init_request_profiling(app):
+    """Registers the per-request profiling hooks on the app."""
+    app.before_request(_start_request_profile)
+    app.after_request(_finish_request_profile)
+
+
+_continuous = None
+_continuous_lock = threading.Lock()
+
+
+def start_continuous_profiling():
+    """
+    Starts sampling every thread of this process, writing the aggregated
+    stacks every PROFILING_FLUSH_MINUTES. Returns the sampler.
+    """
+    global _continuous
+    with _continuous_lock:
+        if _continuous is not None:
+            return _continuous
+        state = {"last_flush": time.monotonic()}
+
+        def flush_if_due():
+            if time.monotonic() - state["last_flush"] < Config.PROFILING_FLUSH_MINUTES * 60:
+                return
+            state["last_flush"] = time.monotonic()
+            counts = _continuous.take()
+            if counts:
+                try:
+                    write_folded(counts, _profile_path(f"continuous_{os.getpid()}", "folded"))
+                except OSError as e:
+                    logging.error(f"Error saving continuous profile: {e}")
+
+        _continuous = StackSampler(Config.PROFILING_CONTINUOUS_INTERVAL, on_tick=flush_if_due).start()
+        return _continuous
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from backend.config import Config
+from backend.services.embedding_cache import make_cache_key
+from backend.services.metrics import record_cache
+
+
+def make_score_key(model, query, text):
+    """Key for a relevance score: hashes of (model, query) and of the chunk text."""
+    return (make_cache_key(model, query), make_cache_key(model, text))
+
+
+class RerankScoreCache:
+    """
+    Process-wide LRU cache of reranker relevance scores keyed by
+    make_score_key(), so chunks already scored for a query are not sent
+    to the reranker again.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """Returns a dict mapping the keys found in the cache to their scores."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                score = self._scores.get(key)
+                if score is None:
+                    self.misses += 1
+                    continue
+                self._scores.move_to_end(key)
+                found[key] = score
+                self.hits += 1
+        record_cache("rerank", len(found), len(keys) - len(found))
+        return found
+
+    def put_many(self, scores):
+        """Stores a dict mapping keys to scores."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for key, score in scores.items():
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+    def clear(self):
+        """Drops all cached scores."""
+        with self._lock:
+            self._scores.clear()
+
+    def stats(self):
+        """Returns the cache counters and current occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._scores),
+                "max_entries": self.max_entries,
+            }
+
+
+rerank_cache = RerankScoreCache(Config.RERANK_CACHE_MAX_ENTRIES)
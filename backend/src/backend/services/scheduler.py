@@ -0,0 +1,93 @@
+import os
+import fcntl
+import time
+import logging
+import threading
+from apscheduler.schedulers.background import BackgroundScheduler
+
+# Scheduled jobs (feed aggregation and index compaction) must run in exactly
+# one process, however many gunicorn workers import the app. Each process
+# that wants to run them competes for an exclusive flock() on
+# SCHEDULER_LOCK_FILE; the holder is the leader and starts the scheduler.
+# The others retry every SCHEDULER_LEADER_RETRY_SECONDS, so when the leader
+# exits (the OS releases its lock) another process takes over. The lock
+# file must be on a filesystem shared by all the processes, i.e. one host.
+
+
+class LeaderLock:
+    """Non-blocking exclusive file lock held for the life of the process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=False):
+        """Takes the lock if it is free (or waits for it). Returns whether it is held."""
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(self.path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    @property
+    def held(self):
+        return self._file is not None
+
+
+def get_lock_path(app):
+    return app.config['SCHEDULER_LOCK_FILE'] or os.path.join(app.instance_path, 'scheduler.lock')
+
+
+def add_scheduled_jobs(scheduler, app):
+    """Adds the periodic background jobs to a scheduler."""
+    from backend.services.aggregation import run_aggregation_for_all_users
+    from backend.services.knowledge_base import compact_all_indexes
+    # Run job every 6 hours
+    scheduler.add_job(run_aggregation_for_all_users, 'interval', hours=6, args=[app],
+                      max_instances=1, coalesce=True, id='aggregation')
+    # Remove vectors of deleted documents and merge small index segments
+    scheduler.add_job(compact_all_indexes, 'interval', minutes=app.config['KB_COMPACTION_INTERVAL_MINUTES'],
+                      args=[app], max_instances=1, coalesce=True, id='compaction')
+
+
+def start_scheduler(app):
+    """
+    Starts the background scheduler in this process once it is the leader.
+    Returns the LeaderLock; the scheduler starts when lock.held turns true.
+    The lock is also kept in app.extensions, as closing its file (e.g. when
+    it is garbage-collected) would release it.
+    """
+    lock = LeaderLock(get_lock_path(app))
+    app.extensions['scheduler_leader_lock'] = lock
+
+    def start():
+        scheduler = BackgroundScheduler(daemon=True)
+        add_scheduled_jobs(scheduler, app)
+        scheduler.start()
+        logging.info(f"Process {os.getpid()} is the scheduler leader")
+
+    if lock.acquire():
+        start()
+        return lock
+
+    def wait_for_leadership():
+        while True:
+            time.sleep(app.config['SCHEDULER_LEADER_RETRY_SECONDS'])
+            if lock.acquire():
+                start()
+                return
+
+    threading.Thread(target=wait_for_leadership, name="scheduler-leader-election", daemon=True).start()
+    return lock
@@ -1,18 +1,25 @@
-from backend.services.embedding import LlamaServerEmbeddings
+from backend.services.embedding import LlamaServerEmbeddings, KnownQueryEmbeddings
 from typing import List
 import requests
 from backend.config import Config
-from langchain_community.vectorstores import FAISS
 from langchain.retrievers import ContextualCompressionRetriever
 from langchain.chains import RetrievalQA
+from langchain.chains.retrieval_qa.prompt import PROMPT as QA_PROMPT
 from backend.services.custom_llm import LlamaServerLLM
 from backend.services.custom_cross_encoder import LlamaServerCrossEncoder
+from backend.services.vector_store import load_user_vector_store
+from backend.services.hybrid_retriever import HybridRetriever
+from backend.services.knowledge_base import get_tombstoned_chunks, get_kb_version, get_user_faiss_index_path
+from backend.services.answer_cache import answer_cache
+from backend.services.http_client import request, request_deadline
+from backend.services.metrics import stage_timer, track_request
 from backend.models import Document
-from sklearn.feature_extraction.text import CountVectorizer
+from backend.services.term_stats import index_missing_documents, top_terms
 import os
 
 
 
+@stage_timer("web_search")
 def _bing_search(query: str) -> str:
     """Performs a web search using the Bing Search API and returns a summary."""
     if not Config.BING_API_KEY or not Config.BING_SEARCH_URL:
@@ -22,7 +29,10 @@ def _bing_search(query: str) -> str:
     params = {"q": query, "count": 3}
     
     try:
-        response = requests.get(Config.BING_SEARCH_URL, headers=headers, params=params)
+        response = request(
+            "bing", "GET", Config.BING_SEARCH_URL, headers=headers, params=params,
+            timeout=Config.BING_TIMEOUT, idempotent=True
+        )
         response.raise_for_status()
         search_results = response.json()
         
@@ -38,81 +48,188 @@ def _bing_search(query: str) -> str:
     except requests.RequestException as e:
         return f"Error during web search: {e}"
 
-def perform_search(user_id, query):
+def _has_index(user_id):
+    return os.path.exists(get_user_faiss_index_path(user_id))
+
+def _get_retriever(user_id, query_embeddings=None):
     """
-    Performs a search in the user's knowledge base using a RAG pipeline.
-    Falls back to web search if no local results are found.
+    Builds the retriever over a user's knowledge base: vector search (fused
+    with keyword search if enabled) followed by reranking. Returns None if the user has no usable index.
+    query_embeddings maps queries to embeddings already computed for them.
     """
-    index_path = os.path.join(Config.FAISS_INDEX_PATH, f"user_{user_id}")
-
-    if not os.path.exists(index_path):
-        return {"answer": _bing_search(query), "source": "Web Search", "source_documents": []}
+    if not _has_index(user_id):
+        return None
+    index_path = get_user_faiss_index_path(user_id)
 
     embeddings = LlamaServerEmbeddings()
+    if query_embeddings:
+        embeddings = KnownQueryEmbeddings(embeddings, query_embeddings)
     
     try:
-        vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+        with stage_timer("index_load"):
+            vector_store = load_user_vector_store(index_path, embeddings)
     except Exception as e:
         print(f"Error loading FAISS index: {e}")
-        return {"answer": _bing_search(query), "source": "Web Search", "source_documents": []}
+        return None
 
-    # 1. Create a base retriever
-    base_retriever = vector_store.as_retriever(search_kwargs={"k": 10})
+    if vector_store is None:
+        return None
+
+    # 1. Create a base retriever, skipping chunks of deleted documents
+    # that have not been compacted out of the index yet
+    search_kwargs = {"k": 10}
+    tombstones = get_tombstoned_chunks(user_id)
+    if tombstones:
+        search_kwargs["exclude_ids"] = {docstore_id for _, docstore_id in tombstones}
+    base_retriever = vector_store.as_retriever(search_kwargs=search_kwargs)
+    if Config.HYBRID_SEARCH_ENABLED:
+        # Fuse in keyword matches, keeping the reranker's input small
+        base_retriever = HybridRetriever(
+            vector_retriever=base_retriever,
+            user_id=user_id,
+            lexical_k=Config.SEARCH_LEXICAL_K,
+            k=Config.SEARCH_RERANK_CANDIDATES
+        )
 
     # 2. Create a reranker
     reranker = LlamaServerCrossEncoder()
-    compression_retriever = ContextualCompressionRetriever(
+    return ContextualCompressionRetriever(
         base_compressor=reranker, base_retriever=base_retriever
     )
+
+def _serialize_documents(docs):
+    return [
+        {
+            "page_content": doc.page_content,
+            "metadata": doc.metadata
+        } for doc in docs
+    ]
+
+def _lookup_answer(user_id, query):
+    """
+    Looks a query up in the answer cache. Returns (kb_version,
+    query_embeddings, result): result is None on a miss, and
+    query_embeddings maps the query to the embedding computed for the
+    lookup in semantic mode, for retrieval to reuse.
+    """
+    kb_version = get_kb_version(user_id)
+    result = answer_cache.get(user_id, kb_version, query)
+    embedding = None
+    if result is None and Config.ANSWER_CACHE_SEMANTIC:
+        embedding = LlamaServerEmbeddings().embed_query(query)
+        result = answer_cache.get_similar(
+            user_id, kb_version, embedding, Config.ANSWER_CACHE_SIMILARITY_THRESHOLD
+        )
+    return kb_version, {query: embedding} if embedding else None, result
+
+@track_request("search")
+def perform_search(user_id, query):
+    """
+    Performs a search in the user's knowledge base using a RAG pipeline.
+    Falls back to web search if no local results are found. Answers from
+    the knowledge base are cached until it changes or the TTL expires.
+    Calls to the model servers share a SEARCH_DEADLINE_SECONDS deadline.
+    """
+    with request_deadline(Config.SEARCH_DEADLINE_SECONDS) as deadline:
+        # Look the answer up before loading the index
+        compression_retriever = None
+        if _has_index(user_id):
+            kb_version, query_embeddings, cached = _lookup_answer(user_id, query)
+            if cached is not None:
+                return cached
+            compression_retriever = _get_retriever(user_id, query_embeddings)
+        if compression_retriever is None:
+            return {"answer": _bing_search(query), "source": "Web Search", "source_documents": []}
     
-    # 3. Create the RetrievalQA chain
-    llm = LlamaServerLLM()
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=compression_retriever,
-        return_source_documents=True,
-    )
+        # 3. Create the RetrievalQA chain
+        llm = LlamaServerLLM()
+        qa_chain = RetrievalQA.from_chain_type(
+            llm=llm,
+            chain_type="stuff",
+            retriever=compression_retriever,
+            return_source_documents=True,
+        )
     
-    result = qa_chain({"query": query})
+        result = qa_chain({"query": query})
+
+        if not result.get("source_documents"):
+            # Fallback to web search if no relevant documents are found
+            return {"answer": _bing_search(query), "source": "Web Search", "source_documents": []}
+
+        answer = {
+            "answer": result["result"],
+            "source": "Local Knowledge Base",
+            "source_documents": _serialize_documents(result["source_documents"])
+        }
+        if not deadline.degraded:
+            answer_cache.put(user_id, kb_version, query, answer, (query_embeddings or {}).get(query))
+        return answer
+
+def stream_search(user_id, query):
+    """
+    Streaming variant of perform_search. Yields (event, data) pairs: first
+    "sources" with the source and source documents, then "token" events
+    carrying the answer text as the LLM generates it, "degraded" if the
+    answer was cut short at the deadline or a backend call failed, then
+    "done".
+    Shares the answer cache and deadline with perform_search.
+    """
+    with track_request("search_stream"), request_deadline(Config.SEARCH_DEADLINE_SECONDS) as deadline:
+        docs = []
+        if _has_index(user_id):
+            kb_version, query_embeddings, cached = _lookup_answer(user_id, query)
+            if cached is not None:
+                yield "sources", {"source": cached["source"], "source_documents": cached["source_documents"]}
+                yield "token", {"text": cached["answer"]}
+                yield "done", {}
+                return
+            retriever = _get_retriever(user_id, query_embeddings)
+            if retriever is not None:
+                docs = retriever.invoke(query)
+
+        if not docs:
+            # Fallback to web search if no relevant documents are found
+            yield "sources", {"source": "Web Search", "source_documents": []}
+            yield "token", {"text": _bing_search(query)}
+            yield "done", {}
+            return
 
-    if not result.get("source_documents"):
-        # Fallback to web search if no relevant documents are found
-        return {"answer": _bing_search(query), "source": "Web Search", "source_documents": []}
+        source_documents = _serialize_documents(docs)
+        yield "sources", {"source": "Local Knowledge Base", "source_documents": source_documents}
 
-    return {
-        "answer": result["result"],
-        "source": "Local Knowledge Base",
-        "source_documents": [
-            {
-                "page_content": doc.page_content,
-                "metadata": doc.metadata
-            } for doc in result["source_documents"]
-        ]
-    }
+        # Same prompt as the "stuff" RetrievalQA chain used by perform_search
+        prompt = QA_PROMPT.format(context="\n\n".join(doc.page_content for doc in docs), question=query)
+        tokens = []
+        for text in LlamaServerLLM().stream(prompt):
+            tokens.append(text)
+            yield "token", {"text": text}
+        if deadline.degraded:
+            # Cut short at the deadline, or built from a failed backend call
+            yield "degraded", {}
+        else:
+            answer_cache.put(user_id, kb_version, query, {
+                "answer": "".join(tokens),
+                "source": "Local Knowledge Base",
+                "source_documents": source_documents
+            }, (query_embeddings or {}).get(query))
+        yield "done", {}
 
 
-def generate_keyword_report(user_id):
+@track_request("keyword_report")
+def generate_keyword_report(user_id, start_date=None, end_date=None, source=None, document_type=None):
     """
-    Generates a report of the top 10 keywords from a user's documents.
+    Generates a report of the top 10 keywords from a user's documents,
+    optionally restricted by upload date range, source prefix and type.
+    Reads the term counts maintained at ingest time.
     """
-    docs = Document.query.filter_by(user_id=user_id).all()
-    if not docs:
+    if not Document.query.filter_by(user_id=user_id).first():
         return {"error": "No documents found for this user."}
 
-    doc_contents = []
-    for doc in docs:
-        try:
-            with open(doc.file_path, 'r', encoding='utf-8') as f:
-                doc_contents.append(f.read())
-        except Exception as e:
-            print(f"Could not read file {doc.file_path}: {e}")
-            continue
-    
-    if not doc_contents:
+    index_missing_documents(user_id)
+    filtered = any(value is not None for value in (start_date, end_date, source, document_type))
+    keywords = top_terms(user_id, 10, start_date, end_date, source, document_type)
+
+    if not keywords and not filtered:
         return {"error": "Could not read any documents."}
 
-    vectorizer = CountVectorizer(stop_words='english', max_features=10)
-    vectorizer.fit_transform(doc_contents)
-    
-    return {"top_keywords": vectorizer.get_feature_names_out().tolist()}
+    return {"top_keywords": [term for term, _ in keywords]}
@@ -0,0 +1,103 @@
+from collections import Counter
+from sqlalchemy import func, text
+from sqlalchemy.dialects.sqlite import insert
+from sklearn.feature_extraction.text import CountVectorizer
+from backend.models import db, Document, DocumentTerm, UserTerm
+from backend.services.document_text import iter_document_texts
+
+# Term counts for the keyword report, maintained as documents come and go:
+# DocumentTerm holds the counts of each document and UserTerm their sum per
+# user, so the unfiltered report is a top-k read of UserTerm and filtered
+# reports aggregate DocumentTerm over the matching documents only.
+# Terms are extracted exactly as CountVectorizer(stop_words='english') does.
+_analyze = CountVectorizer(stop_words='english').build_analyzer()
+
+
+def count_terms(text):
+    """Returns a Counter of the terms in a text."""
+    return Counter(_analyze(text))
+
+
+def index_document_terms(user_id, document_id, text):
+    """Adds a document's term counts to the tables. The caller commits."""
+    _add_term_counts(user_id, document_id, count_terms(text))
+    Document.query.filter_by(id=document_id).update({"terms_indexed": True})
+
+
+def _add_term_counts(user_id, document_id, counts):
+    if not counts:
+        return
+    db.session.execute(insert(DocumentTerm), [
+        {"document_id": document_id, "term": term, "count": count}
+        for term, count in counts.items()
+    ])
+    stmt = insert(UserTerm)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[UserTerm.user_id, UserTerm.term],
+            set_={"count": UserTerm.count + stmt.excluded.count}
+        ),
+        [{"user_id": user_id, "term": term, "count": count} for term, count in counts.items()]
+    )
+
+
+def remove_document_terms(user_id, document_id):
+    """Subtracts a document's term counts from the tables. The caller commits."""
+    params = {"user_id": user_id, "document_id": document_id}
+    db.session.execute(text(
+        "UPDATE user_term SET count = count - ("
+        " SELECT dt.count FROM document_term dt"
+        " WHERE dt.document_id = :document_id AND dt.term = user_term.term)"
+        " WHERE user_id = :user_id AND term IN"
+        " (SELECT term FROM document_term WHERE document_id = :document_id)"
+    ), params)
+    db.session.execute(text("DELETE FROM user_term WHERE user_id = :user_id AND count <= 0"), params)
+    DocumentTerm.query.filter_by(document_id=document_id).delete()
+
+
+def index_missing_documents(user_id):
+    """
+    Counts the terms of a user's documents ingested before term counts were
+    kept. Each document is read once: those whose text yields no terms or
+    cannot be read are marked as indexed all the same.
+    """
+    unindexed = (Document.user_id == user_id) & ~Document.terms_indexed
+    # Counts recorded before the flag existed are kept
+    has_terms = db.session.query(DocumentTerm.document_id).filter(
+        DocumentTerm.document_id == Document.id
+    ).exists()
+    missing = [row[0] for row in db.session.query(Document.id).filter(unindexed, ~has_terms)]
+    if missing:
+        # Counted before any is written, as the texts are streamed
+        counted = [(document_id, count_terms(content))
+                   for document_id, content in iter_document_texts(user_id, missing)]
+        for document_id, counts in counted:
+            _add_term_counts(user_id, document_id, counts)
+    if Document.query.filter(unindexed).update({"terms_indexed": True}, synchronize_session=False):
+        db.session.commit()
+
+
+def top_terms(user_id, k, start_date=None, end_date=None, source=None, document_type=None):
+    """
+    Returns the k most frequent terms of a user's documents as (term, count)
+    pairs. Documents can be restricted by upload date range, source prefix
+    and document type.
+    """
+    if start_date is None and end_date is None and source is None and document_type is None:
+        return db.session.query(UserTerm.term, UserTerm.count).filter(
+            UserTerm.user_id == user_id
+        ).order_by(UserTerm.count.desc(), UserTerm.term.desc()).limit(k).all()
+
+    total = func.sum(DocumentTerm.count).label("total")
+    query = db.session.query(DocumentTerm.term, total).join(
+        Document, Document.id == DocumentTerm.document_id
+    ).filter(Document.user_id == user_id)
+    if start_date is not None:
+        query = query.filter(Document.uploaded_at >= start_date)
+    if end_date is not None:
+        query = query.filter(Document.uploaded_at <= end_date)
+    if source is not None:
+        query = query.filter(Document.source.startswith(source, autoescape=True))
+    if document_type is not None:
+        query = query.filter(Document.document_type == document_type)
+    return query.group_by(DocumentTerm.term).order_by(total.desc(), DocumentTerm.term.desc()).limit(k).all()
@@ -0,0 +1,688 @@
+import os
+import json
+import uuid
+import shutil
+import fcntl
+import logging
+from contextlib import contextmanager
+from typing import Any, List, Optional
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from backend.config import Config
+from backend.services.chunk_store import ChunkStore, has_chunk_store, write_chunk_store
+from backend.services.index_cache import index_cache
+from backend.services.metrics import stage_timer
+from backend.services.index_factory import (
+    FLAT, HNSW, IVFPQ, MIN_POINTS_PER_CENTROID, build_index, choose_index_type, configure_search, get_index_type,
+    is_lossy, reconstruct_vectors, remove_vectors, supports_removal
+)
+
+# A user's index directory holds immutable segments and a manifest listing
+# the live ones:
+#
+#   faiss_index/user_<id>/manifest.json
+#   faiss_index/user_<id>/seg_000000/index.faiss, chunks.dat, chunk_*.npy
+#   faiss_index/user_<id>/seg_000001/...
+#
+# Each segment is a FAISS index plus a chunk store (see chunk_store), both
+# loaded through memory maps so gunicorn workers share their pages. Segments
+# saved with FAISS.save_local (index.faiss, index.pkl) by earlier versions
+# are still read, and are converted when compaction rewrites them.
+#
+# Segments are written to a temporary directory and renamed into place, and
+# the manifest is replaced atomically, so a crash never leaves a reader with a
+# half-written index.
+#
+# The manifest also records the index type of the user's knowledge base (see
+# index_factory). New segments are small and flat; when the total number of
+# vectors crosses a type threshold, the next compaction rebuilds all segments
+# into one of the new type. Segments merged later are built with that type,
+# and large flat segments are folded into the main segment.
+#
+# Compactions are serialized by their own lock. The index lock is only taken
+# to swap the rebuilt segment into the manifest, so segments can be published
+# while a rebuild (possibly re-embedding chunks) is in progress.
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+COMPACT_LOCK_FILE = ".lock.compact"
+SEGMENT_PREFIX = "seg_"
+TEMP_PREFIX = ".tmp_"
+INDEX_FILE = "index.faiss"
+LEGACY_INDEX_FILES = (INDEX_FILE, "index.pkl")
+
+
+def _empty_manifest():
+    return {"segments": [], "next_segment": 0, "index_type": FLAT}
+
+
+def read_manifest(index_path):
+    """Reads the list of live segments of an index directory."""
+    try:
+        with open(os.path.join(index_path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return _empty_manifest()
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_manifest(index_path, manifest):
+    """Atomically replaces the manifest through write-to-temp-then-rename."""
+    tmp_path = os.path.join(index_path, f"{TEMP_PREFIX}{uuid.uuid4().hex}.json")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(index_path, MANIFEST_FILE))
+    _fsync_path(index_path)
+
+
+@contextmanager
+def _file_lock(index_path, lock_name, blocking=True):
+    """Yields whether the lock was taken, which is always unless blocking is false."""
+    os.makedirs(index_path, exist_ok=True)
+    with open(os.path.join(index_path, lock_name), "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def index_lock(index_path):
+    """
+    Exclusive lock on an index directory, held while segments or the manifest
+    are written. flock() locks conflict across processes and across separate
+    open() calls within a process, so this also serializes threads.
+    """
+    with _file_lock(index_path, LOCK_FILE):
+        yield
+
+
+def _save_temp_segment(index_path, vector_store):
+    """Saves a vector store to a new temporary directory of index_path and returns its path."""
+    tmp_path = os.path.join(index_path, f"{TEMP_PREFIX}{uuid.uuid4().hex}")
+    os.makedirs(tmp_path)
+    _save_segment(tmp_path, vector_store)
+    for file_name in os.listdir(tmp_path):
+        _fsync_path(os.path.join(tmp_path, file_name))
+    return tmp_path
+
+
+def _place_segment(index_path, tmp_path, manifest):
+    """
+    Renames a segment saved by _save_temp_segment() into place and returns
+    its name. The caller must hold the index lock and write the updated
+    manifest afterwards.
+    """
+    name = f"{SEGMENT_PREFIX}{manifest['next_segment']:06d}"
+    manifest["next_segment"] += 1
+    os.rename(tmp_path, os.path.join(index_path, name))
+    return name
+
+
+def _write_segment(index_path, vector_store, manifest):
+    """
+    Saves a vector store as a new segment and returns its name. The caller
+    must hold the index lock and write the updated manifest afterwards.
+    """
+    return _place_segment(index_path, _save_temp_segment(index_path, vector_store), manifest)
+
+
+def _save_segment(segment_path, vector_store):
+    """Saves a FAISS store's index and its chunks in index order."""
+    faiss.write_index(vector_store.index, os.path.join(segment_path, INDEX_FILE))
+    ids = [vector_store.index_to_docstore_id[i] for i in range(vector_store.index.ntotal)]
+    write_chunk_store(segment_path, ids, [vector_store.docstore.search(docstore_id) for docstore_id in ids])
+
+
+def _mmap_flags(index_file):
+    """
+    Returns the faiss IO flags that memory-map an index file: IVF indexes
+    map their inverted lists, the others their flat vector storage.
+    """
+    with open(index_file, "rb") as f:
+        fourcc = f.read(4)
+    if fourcc.startswith(b"Iw"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+def load_segment(segment_path, embeddings):
+    """
+    Loads a segment as a read-only FAISS store, memory-mapping the index and
+    the chunk store unless INDEX_MMAP_ENABLED is off.
+    """
+    if not has_chunk_store(segment_path):
+        vector_store = FAISS.load_local(segment_path, embeddings, allow_dangerous_deserialization=True)
+        configure_search(vector_store.index)
+        return vector_store
+
+    index_file = os.path.join(segment_path, INDEX_FILE)
+    if Config.INDEX_MMAP_ENABLED:
+        index = faiss.read_index(index_file, _mmap_flags(index_file))
+    else:
+        index = faiss.read_index(index_file)
+    docstore = ChunkStore(segment_path)
+    return FAISS(embeddings, configure_search(index), docstore, docstore.index_to_docstore_id)
+
+
+def _migrate_legacy_index(index_path):
+    """Moves an index saved directly in index_path into a first segment."""
+    with index_lock(index_path):
+        if os.path.exists(os.path.join(index_path, MANIFEST_FILE)):
+            return
+        if not os.path.exists(os.path.join(index_path, LEGACY_INDEX_FILES[0])):
+            return
+        manifest = _empty_manifest()
+        name = f"{SEGMENT_PREFIX}{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        tmp_path = os.path.join(index_path, f"{TEMP_PREFIX}{uuid.uuid4().hex}")
+        os.makedirs(tmp_path)
+        for file_name in LEGACY_INDEX_FILES:
+            os.rename(os.path.join(index_path, file_name), os.path.join(tmp_path, file_name))
+        os.rename(tmp_path, os.path.join(index_path, name))
+        manifest["segments"].append(name)
+        _write_manifest(index_path, manifest)
+        logging.info(f"Migrated FAISS index {index_path} to the segmented layout")
+
+
+def _needs_migration(index_path):
+    return (not os.path.exists(os.path.join(index_path, MANIFEST_FILE))
+            and os.path.exists(os.path.join(index_path, LEGACY_INDEX_FILES[0])))
+
+
+def _check_vectors(vectors, dimension=None):
+    """
+    Raises ValueError unless every vector is non-empty and of the same
+    dimension (dimension, if given). Returns the dimension.
+    """
+    dimensions = {len(vector) for vector in vectors}
+    if dimension is not None:
+        dimensions.add(dimension)
+    if 0 in dimensions or len(dimensions) > 1:
+        raise ValueError(f"Embeddings of mismatched or empty dimensions: {sorted(dimensions)}")
+    return dimensions.pop() if dimensions else None
+
+
+def _build_store(docs, ids, vectors, embeddings, index_type=None):
+    """
+    Wraps vectors of docs in a FAISS store with an index from the factory,
+    of index_type or of the type chosen for their number.
+    """
+    _check_vectors(vectors)
+    docs = [Document(id=docstore_id, page_content=doc.page_content, metadata=doc.metadata)
+            for docstore_id, doc in zip(ids, docs)]
+    return FAISS(
+        embeddings,
+        build_index(vectors, index_type),
+        InMemoryDocstore(dict(zip(ids, docs))),
+        dict(enumerate(ids))
+    )
+
+
+def _extend_store(segment_path, store, docs, ids, vectors, embeddings, deleted_ids=()):
+    """
+    Returns a FAISS store of a segment's chunks not in deleted_ids followed
+    by docs, whose vectors are added to a writable copy of the segment's
+    index. Its other vectors are kept as they are, without rebuilding or
+    re-embedding them. Deleted ids require an index that supports removal.
+    """
+    index = faiss.read_index(os.path.join(segment_path, INDEX_FILE))
+    positions = [i for i in range(store.index.ntotal) if store.index_to_docstore_id[i] in deleted_ids]
+    if positions:
+        remove_vectors(index, positions)
+    if vectors:
+        _check_vectors(vectors, index.d)
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    all_ids = [store.index_to_docstore_id[i] for i in range(store.index.ntotal)
+               if store.index_to_docstore_id[i] not in deleted_ids]
+    all_docs = [store.docstore.search(docstore_id) for docstore_id in all_ids]
+    all_ids.extend(ids)
+    all_docs.extend(Document(id=docstore_id, page_content=doc.page_content, metadata=doc.metadata)
+                    for docstore_id, doc in zip(ids, docs))
+    return FAISS(
+        embeddings,
+        index,
+        InMemoryDocstore(dict(zip(all_ids, all_docs))),
+        dict(enumerate(all_ids))
+    )
+
+
+def _merge_index_type(index_type, vector_count):
+    """
+    Returns the index type of a merged segment: the knowledge base's, unless
+    there are too few vectors to train IVF-PQ on, in which case the segment
+    stays flat until it is folded into the main segment.
+    """
+    if index_type == IVFPQ and vector_count < MIN_POINTS_PER_CENTROID * 16:
+        return FLAT
+    return index_type
+
+
+def build_segment(docs, ids, embeddings):
+    """
+    Embeds documents into an in-memory FAISS store that can be published
+    with publish_segment(). No lock is held while the embeddings are computed.
+    Raises ValueError if any document came back without an embedding.
+    """
+    vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+    return _build_store(docs, ids, vectors, embeddings)
+
+
+def publish_segment(index_path, vector_store):
+    """
+    Writes a vector store as a new segment and adds it to the manifest.
+    Raises ValueError if its vectors don't match the index's dimension.
+    """
+    if _needs_migration(index_path):
+        _migrate_legacy_index(index_path)
+    with index_lock(index_path):
+        manifest = read_manifest(index_path)
+        dimension = _index_dimension(index_path, manifest)
+        if dimension is not None and vector_store.index.d != dimension:
+            raise ValueError(f"Segment of dimension {vector_store.index.d} added to an index of {dimension}")
+        manifest["dimension"] = vector_store.index.d
+        name = _write_segment(index_path, vector_store, manifest)
+        manifest["segments"].append(name)
+        _write_manifest(index_path, manifest)
+    return name
+
+
+def _index_dimension(index_path, manifest):
+    """Returns the vector dimension of an index directory, or None if it has no segments."""
+    if "dimension" in manifest:
+        return manifest["dimension"]
+    # Manifests written before the dimension was recorded
+    for name in manifest["segments"]:
+        index_file = os.path.join(index_path, name, INDEX_FILE)
+        dimension = faiss.read_index(index_file, _mmap_flags(index_file)).d
+        if dimension:
+            return dimension
+    return None
+
+
+def append_segment(index_path, docs, ids, embeddings):
+    """Embeds documents into a new segment and publishes it in the manifest."""
+    return publish_segment(index_path, build_segment(docs, ids, embeddings))
+
+
+def _load_segment(segment_path, embeddings):
+    return index_cache.get(
+        segment_path,
+        segment_path,
+        lambda: load_segment(segment_path, embeddings)
+    )
+
+
+def load_user_vector_store(index_path, embeddings):
+    """
+    Returns a SegmentedVectorStore over the live segments of an index
+    directory, or None if it has none. Segments are immutable, so each one
+    is loaded at most once per process through the index cache.
+    """
+    if _needs_migration(index_path):
+        _migrate_legacy_index(index_path)
+
+    for attempt in range(2):
+        manifest = read_manifest(index_path)
+        try:
+            segments = [
+                _load_segment(os.path.join(index_path, name), embeddings)
+                for name in manifest["segments"]
+            ]
+            break
+        except Exception:
+            # A merge may have replaced a segment after we read the manifest.
+            if attempt:
+                raise
+    if not segments:
+        return None
+    return SegmentedVectorStore(segments, embeddings)
+
+
+def _segment_entries(store, embeddings, deleted_ids):
+    """
+    Returns (ids, docs, vectors) of the chunks of a segment not in
+    deleted_ids. Product-quantized vectors are re-embedded (mostly from the
+    embedding cache) rather than decoded, so rebuilds don't compound the
+    quantization error, and so are those of segments written without
+    embeddings (dimension 0) while the embedding server was down.
+    """
+    positions = [i for i in range(store.index.ntotal) if store.index_to_docstore_id[i] not in deleted_ids]
+    ids = [store.index_to_docstore_id[i] for i in positions]
+    docs = [store.docstore.search(docstore_id) for docstore_id in ids]
+    if not positions:
+        vectors = []
+    elif is_lossy(store.index) or not store.index.d:
+        vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+    else:
+        vectors = reconstruct_vectors(store.index)[positions]
+    return ids, docs, vectors
+
+
+def _fold_targets(stores, dirty, index_type, merge_threshold, merge_min_segments):
+    """
+    Returns (base, names): the segments to fold into the main segment (the
+    largest one of index_type), including it, and the main segment as base
+    if its index can be extended rather than rebuilt, i.e. it has no
+    deleted ids or they can be removed from it. Large segments are folded
+    once any of them is flat, as flat segments are searched by a linear
+    scan, or there are merge_min_segments of them.
+    """
+    typed = [name for name, store in stores.items() if get_index_type(store.index) == index_type]
+    main = max(typed, key=lambda name: stores[name].index.ntotal, default=None)
+    large = [name for name, store in stores.items()
+             if name != main and store.index.ntotal >= merge_threshold]
+    if len(large) < merge_min_segments and all(get_index_type(stores[name].index) != FLAT for name in large):
+        return None, []
+    if main is None:
+        return None, large
+    if main in dirty and not supports_removal(stores[main].index):
+        return None, large + [main]
+    return main, large + [main]
+
+
+def _removal_base(stores, dirty, index_type):
+    """
+    Returns the largest segment among dirty of index_type whose deleted ids
+    can be removed in place, or None.
+    """
+    removable = [name for name in dirty
+                 if get_index_type(stores[name].index) == index_type and supports_removal(stores[name].index)]
+    return max(removable, key=lambda name: stores[name].index.ntotal, default=None)
+
+
+def _must_rewrite(store, deleted_ids, tombstoned, hnsw_rebuild_ratio):
+    """
+    Returns whether a segment must be rewritten to drop deleted_ids. An HNSW
+    segment is only once hnsw_rebuild_ratio of its vectors are deleted, or
+    it holds an orphan, which has no tombstone for searches to exclude.
+    """
+    deleted = [i for i in store.index_to_docstore_id.values() if i in deleted_ids]
+    if not deleted:
+        return False
+    if get_index_type(store.index) != HNSW or not tombstoned.issuperset(deleted):
+        return True
+    return len(deleted) >= hnsw_rebuild_ratio * store.index.ntotal
+
+
+def compact_segments(index_path, embeddings, deleted_ids, merge_threshold, merge_min_segments,
+                     known_ids=None, hnsw_rebuild_ratio=0.0):
+    """
+    Rewrites segments to drop deleted_ids and merges small segments.
+
+    If given, known_ids() is called once the manifest has been read and
+    returns the docstore ids the index may hold; any other id is an orphan
+    (e.g. left by an ingest that crashed) and is dropped like a deleted one.
+    Segments holding any deleted id are rewritten, except HNSW segments
+    with less than hnsw_rebuild_ratio of their vectors deleted and no
+    orphans: HNSW can't remove vectors in place, so their deleted ids are
+    left for searches to exclude (see _must_rewrite). Segments with fewer
+    than merge_threshold vectors are merged once there are at least
+    merge_min_segments of them. Large segments are folded into the main
+    segment (see _fold_targets). All rewritten segments are combined into a
+    single new segment of the knowledge base's index type; deleted ids are
+    removed from IVF segments in place rather than rebuilding them. When the
+    knowledge base as a whole crosses an index type threshold, every
+    segment is rewritten, migrating it to the new type. Returns the number
+    of vectors removed.
+
+    The new segment is built without holding the index lock; segments
+    published in the meantime are kept.
+    """
+    if _needs_migration(index_path):
+        _migrate_legacy_index(index_path)
+
+    with _file_lock(index_path, COMPACT_LOCK_FILE):
+        return _compact(index_path, embeddings, set(deleted_ids), merge_threshold, merge_min_segments, known_ids,
+                        hnsw_rebuild_ratio=hnsw_rebuild_ratio)
+
+
+def merge_segments(index_path, embeddings, merge_threshold, merge_min_segments):
+    """
+    Merges an index's small segments once there are merge_min_segments of
+    them, as compaction does, so searches needn't go through every segment
+    published since the last compaction. Index type migrations and folds
+    are left to compaction. Does nothing while a compaction is running.
+    """
+    if len(read_manifest(index_path)["segments"]) < merge_min_segments:
+        return
+    with _file_lock(index_path, COMPACT_LOCK_FILE, blocking=False) as locked:
+        if locked:
+            _compact(index_path, embeddings, set(), merge_threshold, merge_min_segments, rebuild=False)
+
+
+def _compact(index_path, embeddings, deleted_ids, merge_threshold, merge_min_segments, known_ids=None,
+             rebuild=True, hnsw_rebuild_ratio=0.0):
+    """
+    Does the work of compact_segments(), or with rebuild false only merges
+    small segments. The caller holds the compaction lock.
+    """
+    # Only compaction removes segments, so these stay in place until the
+    # manifest is swapped below
+    manifest = read_manifest(index_path)
+    stores = {}
+    for name in manifest["segments"]:
+        stores[name] = load_segment(os.path.join(index_path, name), embeddings)
+    # The caller's deleted ids have tombstones that searches exclude; orphans don't
+    tombstoned = set(deleted_ids)
+    if known_ids is not None:
+        known = known_ids()
+        for store in stores.values():
+            deleted_ids.update(i for i in store.index_to_docstore_id.values() if i not in known)
+
+    dirty = [name for name, store in stores.items()
+             if _must_rewrite(store, deleted_ids, tombstoned, hnsw_rebuild_ratio)]
+    small = [name for name, store in stores.items() if store.index.ntotal < merge_threshold]
+    targets = set(dirty)
+    targets.update(name for name, store in stores.items() if not store.index.d)
+    if len(small) >= merge_min_segments:
+        targets.update(small)
+
+    live_vectors = sum(
+        sum(1 for i in store.index_to_docstore_id.values() if i not in deleted_ids)
+        for store in stores.values()
+    )
+    index_type = choose_index_type(live_vectors) if rebuild else manifest.get("index_type", FLAT)
+    base = None
+    if index_type != manifest.get("index_type", FLAT):
+        logging.info(f"Migrating {index_path} from {manifest.get('index_type', FLAT)} to {index_type}")
+        targets.update(stores)
+    elif rebuild and index_type != FLAT:
+        base, folded = _fold_targets(stores, dirty, index_type, merge_threshold, merge_min_segments)
+        targets.update(folded)
+    if base is None and index_type == manifest.get("index_type", FLAT):
+        base = _removal_base(stores, dirty, index_type)
+    if base is not None and deleted_ids.issuperset(stores[base].index_to_docstore_id.values()):
+        # Nothing of it is left to keep
+        base = None
+
+    removed = 0
+    merged = tmp_path = None
+    if targets:
+        target_names = [name for name in manifest["segments"] if name in targets]
+        ids, docs, vectors = [], [], []
+        for name in target_names:
+            if name == base:
+                continue
+            store = stores[name]
+            segment_ids, segment_docs, segment_vectors = _segment_entries(store, embeddings, deleted_ids)
+            removed += store.index.ntotal - len(segment_ids)
+            ids.extend(segment_ids)
+            docs.extend(segment_docs)
+            vectors.extend(segment_vectors)
+
+        if base is not None:
+            store = stores[base]
+            # An HNSW base keeps its deleted vectors, see _must_rewrite()
+            base_deleted = deleted_ids if supports_removal(store.index) else set()
+            removed += sum(1 for i in store.index_to_docstore_id.values() if i in base_deleted)
+            merged = _extend_store(os.path.join(index_path, base), store, docs, ids, vectors, embeddings,
+                                   base_deleted)
+        elif ids:
+            merged = _build_store(docs, ids, vectors, embeddings, _merge_index_type(index_type, len(ids)))
+        if merged is not None:
+            tmp_path = _save_temp_segment(index_path, merged)
+            logging.info(
+                f"Built {get_index_type(merged.index)} segment of {merged.index.ntotal} vectors in {index_path}"
+            )
+
+    with index_lock(index_path):
+        # Re-read for the segments published during the rebuild
+        manifest = read_manifest(index_path)
+        if targets:
+            segments = [name for name in manifest["segments"] if name not in targets]
+            if tmp_path is not None:
+                manifest["dimension"] = merged.index.d
+                segments.append(_place_segment(index_path, tmp_path, manifest))
+            manifest["segments"] = segments
+            manifest["index_type"] = index_type
+            _write_manifest(index_path, manifest)
+            for name in target_names:
+                shutil.rmtree(os.path.join(index_path, name), ignore_errors=True)
+                index_cache.invalidate(os.path.join(index_path, name))
+            logging.info(f"Rewrote {len(target_names)} segments of {index_path}, removed {removed} vectors")
+        _remove_orphans(index_path, manifest)
+    return removed
+
+
+def find_ids(index_path, embeddings, ids):
+    """Returns the docstore ids among ids that are in a live segment."""
+    ids = set(ids)
+    vector_store = load_user_vector_store(index_path, embeddings) if ids else None
+    if vector_store is None:
+        return set()
+    return {i for segment in vector_store.segments for i in segment.index_to_docstore_id.values() if i in ids}
+
+
+def _remove_orphans(index_path, manifest):
+    """Deletes segments and temp files left behind by interrupted writes."""
+    live = set(manifest["segments"])
+    for name in os.listdir(index_path):
+        if name.startswith(TEMP_PREFIX) or (name.startswith(SEGMENT_PREFIX) and name not in live):
+            path = os.path.join(index_path, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+class SegmentedVectorStore(VectorStore):
+    """
+    Read-only LangChain vector store that searches every segment of a user's
+    index and merges the hits by distance.
+    """
+
+    def __init__(self, segments: List[FAISS], embeddings: Embeddings):
+        self.segments = segments
+        self._embeddings = embeddings
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embeddings
+
+    @stage_timer("vector_search")
+    def search_ids(self, embedding, k=4, exclude_ids=None):
+        """
+        Returns (distance, segment, position) of the k chunks closest to an
+        embedding across segments, skipping docstore ids in exclude_ids.
+        Only the vectors and id maps are read, not the chunk texts.
+
+        A segment is searched for k hits, and again for twice as many while
+        excluded ids leave fewer than k, so a query costs about the same
+        however many tombstones await compaction elsewhere.
+        """
+        exclude_ids = exclude_ids or set()
+        query = np.array([embedding], dtype=np.float32)
+        hits = []
+        for segment in self.segments:
+            if not segment.index.ntotal:
+                continue
+            n = min(k, segment.index.ntotal)
+            while True:
+                distances, positions = segment.index.search(query, n)
+                segment_hits = [
+                    (float(distance), segment, int(position))
+                    for distance, position in zip(distances[0], positions[0])
+                    if position != -1 and not (
+                        exclude_ids and segment.index_to_docstore_id[int(position)] in exclude_ids
+                    )
+                ]
+                if len(segment_hits) >= k or n == segment.index.ntotal:
+                    break
+                n = min(2 * n, segment.index.ntotal)
+            hits.extend(segment_hits)
+        # FAISS segments use L2 distance, so lower scores are closer.
+        hits.sort(key=lambda hit: hit[0])
+        return hits[:k]
+
+    @staticmethod
+    def get_chunk(segment, position):
+        """Loads the chunk at a position of a segment."""
+        if isinstance(segment.docstore, ChunkStore):
+            return segment.docstore.get(position)
+        return segment.docstore.search(segment.index_to_docstore_id[position])
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Any] = None,
+        fetch_k: int = 20,
+        exclude_ids: Optional[set] = None,
+        **kwargs: Any,
+    ) -> List[tuple]:
+        """
+        Embeds the query once and returns the k closest chunks across
+        segments. Chunk texts are loaded for the final k only, unless a
+        metadata filter needs them for every candidate.
+        """
+        embedding = self._embeddings.embed_query(query)
+        if not embedding:
+            # The embedding server is unavailable; leave it to other retrievers
+            return []
+        if filter is None:
+            return [
+                (self.get_chunk(segment, position), distance)
+                for distance, segment, position in self.search_ids(embedding, k, exclude_ids)
+            ]
+
+        # Fetched in excess of the excluded ids that may be among the hits
+        exclude_ids = exclude_ids or set()
+        extra = len(exclude_ids)
+        results = []
+        for segment in self.segments:
+            results.extend(
+                (doc, score) for doc, score in segment.similarity_search_with_score_by_vector(
+                    embedding, k=k + extra, filter=filter, fetch_k=fetch_k + extra, **kwargs
+                ) if doc.id not in exclude_ids
+            )
+        results.sort(key=lambda pair: pair[1])
+        return results[:k]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def add_texts(self, texts, metadatas=None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("Segments are written with append_segment().")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs: Any):
+        raise NotImplementedError("Segments are written with append_segment().")
@@ -0,0 +1,64 @@
+import sys
+import logging
+import argparse
+from apscheduler.schedulers.blocking import BlockingScheduler
+from backend.app import create_app, configure_logging
+from backend.config import Config
+from backend.services.scheduler import LeaderLock, get_lock_path, add_scheduled_jobs
+
+# Runs the scheduled jobs outside the web servers, from the backend directory:
+#
+#   PYTHONPATH=src python -m backend.worker
+#
+# Start the web servers with SCHEDULER_ENABLED=False. Several workers can be
+# started for failover: they share SCHEDULER_LOCK_FILE and only the one
+# holding it runs the jobs.
+
+
+def run_jobs_once(app):
+    """Runs every scheduled job once and waits for the notifications they queued."""
+    from backend.services.aggregation import run_aggregation_for_all_users
+    from backend.services.knowledge_base import compact_all_indexes
+    from backend.services.notification import flush_notifications
+    run_aggregation_for_all_users(app)
+    compact_all_indexes(app)
+    # The sender is a daemon thread, which would die with the process
+    flush_notifications()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the scheduled background jobs.")
+    parser.add_argument("--once", action="store_true", help="run every job once and exit")
+    args = parser.parse_args(argv)
+
+    # Before anything logs, which would configure the root logger first
+    configure_logging()
+
+    config = Config()
+    # This process runs the jobs itself, below
+    config.SCHEDULER_ENABLED = False
+    # Queued uploads are processed by the web servers
+    config.INGESTION_WORKERS = 0
+    app = create_app(config)
+
+    lock = LeaderLock(get_lock_path(app))
+    if not lock.acquire():
+        logging.info("Waiting for the scheduler lock held by another process")
+        lock.acquire(blocking=True)
+
+    if args.once:
+        run_jobs_once(app)
+        return 0
+
+    scheduler = BlockingScheduler()
+    add_scheduled_jobs(scheduler, app)
+    logging.info("Running scheduled jobs")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
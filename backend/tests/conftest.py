@@ -1,4 +1,6 @@
 import pytest
+from typing import List
+from langchain_core.embeddings import Embeddings
 from backend.app import create_app
 from backend.models import db, User
 from backend.config import Config
@@ -6,6 +8,56 @@ from backend.config import Config
 test_config = Config()
 test_config.TESTING = True
 
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings so FAISS can be exercised without a server."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+@pytest.fixture
+def fake_embeddings():
+    """Embeddings that don't call the llama-server."""
+    return FakeEmbeddings()
+
+@pytest.fixture(autouse=True)
+def embedding_cache_path(tmp_path, monkeypatch):
+    """Give each test its own empty embedding cache."""
+    monkeypatch.setattr(Config, 'EMBEDDING_CACHE_PATH', str(tmp_path / 'embedding_cache.db'))
+
+@pytest.fixture(autouse=True)
+def faiss_index_path(tmp_path, monkeypatch):
+    """Keep FAISS indexes written by tests out of the working directory."""
+    monkeypatch.setattr(Config, 'FAISS_INDEX_PATH', str(tmp_path / 'faiss_index'))
+
+@pytest.fixture(autouse=True)
+def file_dirs(tmp_path, monkeypatch):
+    """Keep uploads and fetched articles written by tests out of the working directory."""
+    (tmp_path / 'uploads').mkdir(exist_ok=True)
+    monkeypatch.setattr('backend.routes.main.UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr('backend.services.aggregation.TEMP_DIR', str(tmp_path / 'temp_articles'))
+
+@pytest.fixture(autouse=True)
+def metrics_dir(monkeypatch):
+    """Don't write metrics snapshots; tests that need them pass a directory."""
+    monkeypatch.setattr(Config, 'METRICS_DIR', '')
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Start every test with all backends considered healthy."""
+    from backend.services.http_client import reset_breakers
+    reset_breakers()
+
+@pytest.fixture(autouse=True)
+def clear_answer_cache():
+    """Don't let answers or scores cached by one test leak into another."""
+    from backend.services.answer_cache import answer_cache
+    from backend.services.rerank_cache import rerank_cache
+    answer_cache.clear()
+    rerank_cache.clear()
+
 @pytest.fixture(scope='module')
 def app():
     """Create and configure a new app instance for each test module."""
@@ -15,6 +67,8 @@ def app():
     test_config.LLM_URL = "http://test-llm-url"
     test_config.EMBEDDING_URL = "http://test-embedding-url"
     test_config.RERANKING_URL = "http://test-reranking-url"
+    test_config.INGESTION_WORKERS = 0
+    test_config.SCHEDULER_ENABLED = False
     app = create_app(test_config)
     
     with app.app_context():
@@ -1,3 +1,4 @@
+import os
 from unittest.mock import patch, MagicMock
 from backend.services.aggregation import run_aggregation_for_all_users
 from backend.models import db, User, RssFeed
@@ -19,14 +20,194 @@ def test_run_aggregation(app):
     # Mock the services called by the aggregation function
     with patch('backend.services.aggregation.get_article_content') as mock_get_content, \
          patch('backend.services.aggregation.add_document_to_kb') as mock_add_doc, \
-         patch('backend.services.aggregation.send_notification') as mock_send_notification:
+         patch('backend.services.aggregation.queue_notification') as mock_queue_notification, \
+         patch.dict(app.config, {'ADMIN_EMAIL': 'admin@example.com'}):
         
         mock_get_content.return_value = "This is the article content."
+        mock_add_doc.return_value.id = 1
         
         run_aggregation_for_all_users(app)
 
         # Assert that the mocks were called
         assert mock_get_content.call_count > 0
         assert mock_add_doc.call_count > 0
-        assert mock_send_notification.call_count > 0
+        # A single digest covers every ingested article
+        mock_queue_notification.assert_called_once()
+        _, subject, recipients, body = mock_queue_notification.call_args.args
+        assert recipients == ['admin@example.com']
+        assert "agg_user" in body
 import os
+
+def test_build_digest_groups_by_user_and_truncates():
+    """Test that the digest lists links per user up to the item limit."""
+    from backend.services.aggregation import build_digest
+
+    ingested = [("alice", "http://a/1"), ("bob", "http://b/1"), ("alice", "http://a/2")]
+    subject, body = build_digest(ingested, max_items=2)
+
+    assert subject == "3 New Documents Added to Knowledge Base"
+    assert body.splitlines()[:3] == ["alice (2):", "  http://a/1", "  http://a/2"]
+    assert "bob (1):" in body
+    assert "http://b/1" not in body
+    assert body.rstrip().endswith("...and 1 more.")
+
+def test_host_limiter_caps_concurrency_per_host():
+    """Test that requests to one host are limited while other hosts proceed."""
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from backend.services.aggregation import HostLimiter
+
+    limiter = HostLimiter(max_per_host=2, min_interval=0)
+    active = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def fetch(url):
+        host = url.split('/')[2]
+        with limiter.limit(url):
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.02)
+            with lock:
+                active[host] -= 1
+
+    urls = [f"http://a.example/{i}" for i in range(8)] + [f"http://b.example/{i}" for i in range(8)]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(fetch, urls))
+
+    assert peak == {"a.example": 2, "b.example": 2}
+
+def test_run_aggregation_skips_overlapping_run(app):
+    """Test that a run starting while another is in progress is skipped."""
+    from backend.services import aggregation
+
+    with patch('backend.services.aggregation.feedparser.parse') as mock_parse:
+        aggregation._run_lock.acquire()
+        try:
+            run_aggregation_for_all_users(app)
+        finally:
+            aggregation._run_lock.release()
+
+    mock_parse.assert_not_called()
+
+def test_run_aggregation_skips_seen_entries(app):
+    """Test that entries ingested in an earlier run are not fetched again."""
+    with app.app_context():
+        # Only this test's feed should be polled
+        RssFeed.query.delete()
+        user = User(username="agg_user_incremental")
+        user.set_password("password")
+        db.session.add(user)
+        db.session.commit()
+        feed = RssFeed(user_id=user.id, url="http://feeds.example.com/rss")
+        db.session.add(feed)
+        db.session.commit()
+        feed_id = feed.id
+
+    rss = (
+        b'<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>'
+        b'<item><guid>guid-1</guid><link>http://www.example.com/a</link></item>'
+        b'<item><guid>guid-2</guid><link>http://www.example.com/b</link></item>'
+        b'</channel></rss>'
+    )
+    parsed = MagicMock(status_code=200, content=rss, headers={
+        "ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT", "Content-Type": "application/rss+xml"
+    })
+    not_modified = MagicMock(status_code=304, content=b"", headers={})
+
+    with patch('backend.services.aggregation.requests.get') as mock_get, \
+         patch('backend.services.aggregation.get_article_content', return_value="content") as mock_get_content, \
+         patch('backend.services.aggregation.add_document_to_kb') as mock_add_doc, \
+         patch('backend.services.aggregation.queue_notification'):
+        mock_add_doc.return_value.id = 1
+
+        mock_get.return_value = parsed
+        first = run_aggregation_for_all_users(app)
+        assert first["entries_ingested"] == 2
+        assert mock_get_content.call_count == 2
+        assert mock_get.call_args.kwargs["timeout"] == app.config['AGGREGATION_FETCH_TIMEOUT']
+
+        second = run_aggregation_for_all_users(app)
+        assert second["entries_skipped"] == 2
+        assert second["entries_ingested"] == 0
+        assert mock_get_content.call_count == 2
+        assert mock_get.call_args.kwargs["headers"] == {
+            "If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"
+        }
+
+        mock_get.return_value = not_modified
+        third = run_aggregation_for_all_users(app)
+        assert third["feeds_not_modified"] == 1
+
+    with app.app_context():
+        assert db.session.get(RssFeed, feed_id).etag == '"v1"'
+
+def test_run_aggregation_keeps_validators_until_entries_are_ingested(app):
+    """Test that a feed whose entries failed to ingest is polled again without validators."""
+    with app.app_context():
+        RssFeed.query.delete()
+        user = User(username="agg_user_validators")
+        user.set_password("password")
+        db.session.add(user)
+        db.session.commit()
+        feed = RssFeed(user_id=user.id, url="http://feeds.example.com/validators")
+        db.session.add(feed)
+        db.session.commit()
+        feed_id = feed.id
+
+    rss = (
+        b'<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>'
+        b'<item><guid>guid-v</guid><link>http://www.example.com/v</link></item>'
+        b'</channel></rss>'
+    )
+    response = MagicMock(status_code=200, content=rss, headers={"ETag": '"v2"'})
+
+    with patch('backend.services.aggregation.requests.get', return_value=response) as mock_get, \
+         patch('backend.services.aggregation.get_article_content', return_value="content"), \
+         patch('backend.services.aggregation.add_document_to_kb') as mock_add_doc, \
+         patch('backend.services.aggregation.queue_notification'):
+        mock_add_doc.side_effect = RuntimeError("embedding server down")
+        run_aggregation_for_all_users(app)
+        with app.app_context():
+            assert db.session.get(RssFeed, feed_id).etag is None
+
+        mock_add_doc.side_effect = None
+        mock_add_doc.return_value.id = 1
+        stats = run_aggregation_for_all_users(app)
+        assert mock_get.call_args.kwargs["headers"] == {}
+        assert stats["entries_ingested"] == 1
+
+    with app.app_context():
+        assert db.session.get(RssFeed, feed_id).etag == '"v2"'
+
+def test_run_aggregation_records_articles_without_text_as_seen(app):
+    """Test that an article with no extractable text is not fetched again."""
+    with app.app_context():
+        RssFeed.query.delete()
+        user = User(username="agg_user_empty")
+        user.set_password("password")
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(RssFeed(user_id=user.id, url="http://feeds.example.com/empty"))
+        db.session.commit()
+
+    rss = (
+        b'<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>'
+        b'<item><guid>guid-empty</guid><link>http://www.example.com/video</link></item>'
+        b'</channel></rss>'
+    )
+    parsed = MagicMock(status_code=200, content=rss, headers={"Content-Type": "application/rss+xml"})
+
+    with patch('backend.services.aggregation.requests.get', return_value=parsed), \
+         patch('backend.services.aggregation.get_article_content', return_value="") as mock_get_content, \
+         patch('backend.services.aggregation.add_document_to_kb') as mock_add_doc, \
+         patch('backend.services.aggregation.queue_notification'):
+        first = run_aggregation_for_all_users(app)
+        second = run_aggregation_for_all_users(app)
+
+    assert first["entries_empty"] == 1
+    assert second["entries_skipped"] == 1
+    assert mock_get_content.call_count == 1
+    mock_add_doc.assert_not_called()
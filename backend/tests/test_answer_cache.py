@@ -0,0 +1,57 @@
+from unittest.mock import patch
+from backend.services.answer_cache import AnswerCache, normalize_query
+
+
+def test_normalize_query():
+    """Test that case, whitespace and trailing punctuation are ignored."""
+    assert normalize_query("  What happened\twith X today?? ") == "what happened with x today"
+
+
+def test_answer_cache_is_keyed_by_user_and_version():
+    """Test that answers are only reused for the same user and KB version."""
+    cache = AnswerCache(max_entries=10, ttl_seconds=60)
+    cache.put(1, 0, "query", {"answer": "a"})
+
+    assert cache.get(1, 0, "Query?") == {"answer": "a"}
+    assert cache.get(1, 1, "query") is None
+    assert cache.get(2, 0, "query") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_answer_cache_expires_entries():
+    """Test that entries are not returned after their TTL."""
+    cache = AnswerCache(max_entries=10, ttl_seconds=60)
+    with patch('backend.services.answer_cache.time.monotonic', return_value=1000.0):
+        cache.put(1, 0, "query", {"answer": "a"}, embedding=[1.0, 0.0])
+    with patch('backend.services.answer_cache.time.monotonic', return_value=1061.0):
+        assert cache.get_similar(1, 0, [1.0, 0.0], 0.9) is None
+        assert cache.get(1, 0, "query") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_answer_cache_evicts_least_recently_used():
+    """Test that the cache holds at most max_entries answers."""
+    cache = AnswerCache(max_entries=2, ttl_seconds=60)
+    cache.put(1, 0, "a", "A")
+    cache.put(1, 0, "b", "B")
+    cache.get(1, 0, "a")
+    cache.put(1, 0, "c", "C")
+
+    assert cache.get(1, 0, "b") is None
+    assert cache.get(1, 0, "a") == "A"
+    assert cache.get(1, 0, "c") == "C"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_answer_cache_semantic_lookup():
+    """Test that a query with a similar embedding reuses the cached answer."""
+    cache = AnswerCache(max_entries=10, ttl_seconds=60)
+    cache.put(1, 0, "what happened with x", "X", embedding=[1.0, 0.0, 0.0])
+    cache.put(1, 0, "weather tomorrow", "W", embedding=[0.0, 1.0, 0.0])
+
+    assert cache.get_similar(1, 0, [0.99, 0.05, 0.0], 0.95) == "X"
+    assert cache.get_similar(1, 0, [0.7, 0.7, 0.0], 0.95) is None
+    assert cache.get_similar(1, 1, [1.0, 0.0, 0.0], 0.95) is None
+    assert cache.get_similar(1, 0, [], 0.95) is None
+    assert cache.stats()["semantic_hits"] == 1
@@ -0,0 +1,39 @@
+from unittest.mock import patch
+from langchain_core.documents import Document
+from backend.config import Config
+from backend.services.embedding import LlamaServerEmbeddings
+from backend.services.custom_cross_encoder import LlamaServerCrossEncoder
+from backend.services.custom_llm import LlamaServerLLM
+from benchmarks.fake_llama_server import FakeLlamaServer, ANSWER
+from benchmarks.run import compare
+
+
+def test_fake_llama_server_serves_backend_clients():
+    """Test that the benchmark llama-server stand-in speaks the backend's protocols."""
+    with FakeLlamaServer(dimension=16) as server, \
+            patch.object(Config, 'EMBEDDING_URL', f"{server.url}/embeddings"), \
+            patch.object(Config, 'RERANKING_URL', f"{server.url}/rerank"), \
+            patch.object(Config, 'LLM_URL', f"{server.url}/chat/completions"), \
+            patch.object(Config, 'EMBEDDING_CACHE_PATH', ''):
+        embeddings = LlamaServerEmbeddings()
+        vectors = embeddings.embed_documents(["oil prices rise", "oil prices rise", "chip demand"])
+        assert len(vectors[0]) == 16
+        assert vectors[0] == vectors[1] != vectors[2]
+        assert embeddings.embed_query("oil prices rise") == vectors[0]
+
+        docs = [Document(page_content="chip demand"), Document(page_content="oil prices rise")]
+        ranked = LlamaServerCrossEncoder().compress_documents(docs, "oil prices")
+        assert ranked[0].page_content == "oil prices rise"
+
+        llm = LlamaServerLLM()
+        assert llm.invoke("question") == ANSWER
+        assert "".join(llm.stream("question")).strip() == ANSWER
+
+
+def test_compare_reports_regressions(capsys):
+    """Test that results slower than the baseline beyond the tolerance are flagged."""
+    baseline = {"results": {"search[n=10]": {"seconds": 1.0}, "load[n=10]": {"seconds": 1.0}}}
+    results = {"search[n=10]": {"seconds": 1.5}, "load[n=10]": {"seconds": 1.1}}
+
+    assert compare(results, baseline, tolerance=0.2) == ["search[n=10]"]
+    assert "REGRESSION" in capsys.readouterr().out
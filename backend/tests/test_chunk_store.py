@@ -0,0 +1,27 @@
+from langchain_core.documents import Document
+from backend.services.chunk_store import ChunkStore, write_chunk_store
+
+
+def test_chunk_store_round_trip(tmp_path):
+    """Test that chunks are read back by position and by docstore id."""
+    ids = ["c", "a", "b"]
+    docs = [Document(page_content=f"text {i}", metadata={"document_id": n}) for n, i in enumerate(ids)]
+    write_chunk_store(str(tmp_path), ids, docs)
+
+    store = ChunkStore(str(tmp_path))
+
+    assert len(store) == 3
+    assert dict(store.index_to_docstore_id) == {0: "c", 1: "a", 2: "b"}
+    assert store.get(2) == Document(id="b", page_content="text b", metadata={"document_id": 2})
+    for position, docstore_id in enumerate(ids):
+        assert store.position(docstore_id) == position
+        assert store.search(docstore_id).page_content == f"text {docstore_id}"
+    assert store.search("missing") == "ID missing not found."
+
+
+def test_empty_chunk_store(tmp_path):
+    """Test that a chunk store without chunks can be opened."""
+    write_chunk_store(str(tmp_path), [], [])
+    store = ChunkStore(str(tmp_path))
+    assert len(store) == 0
+    assert store.position("a") is None
@@ -1,41 +1,69 @@
-import os
 from unittest.mock import patch
+import pytest
 from backend.services.clustering import generate_cluster_report
-from backend.models import db, Document, User
+from backend.services.knowledge_base import add_document_to_kb, delete_document_from_kb
+from backend.models import db, User, ClusterState
 
-def test_generate_cluster_report(app):
-    """Test the cluster report generation service."""
-    with app.app_context():
-        # Setup a user and some documents
-        user = User(username="cluster_user", password_hash="test")
+TOPICS = [
+    "This is a document about python and data science.",
+    "This document discusses machine learning and python.",
+    "Central banks raised interest rates again this quarter amid inflation worries.",
+    "Inflation and interest rates weigh on central bank policy outlook.",
+]
+
+
+@pytest.fixture
+def cluster_user(app, fake_embeddings, tmp_path):
+    with app.app_context(), \
+         patch('backend.services.knowledge_base.LlamaServerEmbeddings', return_value=fake_embeddings), \
+         patch('backend.services.clustering.LlamaServerEmbeddings', return_value=fake_embeddings):
+        user = User(username=f"cluster_user_{tmp_path.name}", password_hash="test")
         db.session.add(user)
         db.session.commit()
+        yield user
+
+
+def _add(user, tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return add_document_to_kb(user.id, str(path), "txt")
+
+
+def test_generate_cluster_report(cluster_user, tmp_path):
+    """Test the cluster report generation service."""
+    for i, text in enumerate(TOPICS):
+        _add(cluster_user, tmp_path, f"doc{i}.txt", text)
+
+    report = generate_cluster_report(cluster_user.id, n_clusters=2)
+
+    assert set(report) == {"Cluster 1", "Cluster 2"}
+    assert any("python" in terms for terms in report.values())
+    state = db.session.get(ClusterState, cluster_user.id)
+    assert state.fitted_count == 4
 
-        # Create dummy files
-        os.makedirs("test_docs", exist_ok=True)
-        doc1_path = "test_docs/doc1.txt"
-        doc2_path = "test_docs/doc2.txt"
-        with open(doc1_path, "w") as f:
-            f.write("This is a document about python and data science.")
-        with open(doc2_path, "w") as f:
-            f.write("This document discusses machine learning and python.")
-
-        doc1 = Document(user_id=user.id, file_path=doc1_path, document_type="txt")
-        doc2 = Document(user_id=user.id, file_path=doc2_path, document_type="txt")
-        db.session.add_all([doc1, doc2])
-        db.session.commit()
 
-        # Generate the report
-        report = generate_cluster_report(user.id, n_clusters=2)
-        
-        assert "Cluster 1" in report
-        assert "Cluster 2" in report
-        assert "python" in report["Cluster 1"] or "python" in report["Cluster 2"]
+def test_cluster_report_is_cached_and_updated_incrementally(cluster_user, tmp_path):
+    """Test that reports are cached per KB version and new documents are partial-fitted."""
+    for i, text in enumerate(TOPICS):
+        _add(cluster_user, tmp_path, f"doc{i}.txt", text)
+    first = generate_cluster_report(cluster_user.id, n_clusters=2)
+
+    with patch('backend.services.clustering.get_document_embeddings') as mock_embeddings:
+        assert generate_cluster_report(cluster_user.id, n_clusters=2) == first
+    mock_embeddings.assert_not_called()
+
+    new_doc = _add(cluster_user, tmp_path, "doc_new.txt", "Python notebooks for data science teams.")
+    with patch('backend.services.clustering.MiniBatchKMeans') as mock_kmeans:
+        generate_cluster_report(cluster_user.id, n_clusters=2)
+    mock_kmeans.assert_not_called()
+    state = db.session.get(ClusterState, cluster_user.id)
+    assert str(new_doc.id) in state.labels
+    assert state.fitted_count == 4
+
+    delete_document_from_kb(new_doc.id)
+    generate_cluster_report(cluster_user.id, n_clusters=2)
+    assert str(new_doc.id) not in db.session.get(ClusterState, cluster_user.id).labels
 
-        # Clean up dummy files
-        os.remove(doc1_path)
-        os.remove(doc2_path)
-        os.rmdir("test_docs")
 
 def test_generate_cluster_report_not_enough_documents(app):
     """Test cluster report generation with insufficient documents."""
@@ -47,3 +75,40 @@ def test_generate_cluster_report_not_enough_documents(app):
         report = generate_cluster_report(user.id, n_clusters=5)
         assert "error" in report
         assert "Not enough documents" in report["error"]
+
+
+def test_document_embeddings_skip_chunk_texts(cluster_user, tmp_path):
+    """Test that chunks are mapped to documents without reading their texts."""
+    from backend.services.clustering import get_document_embeddings
+    docs = [_add(cluster_user, tmp_path, f"doc{i}.txt", text) for i, text in enumerate(TOPICS[:3])]
+    delete_document_from_kb(docs[2].id)
+
+    with patch('backend.services.chunk_store.ChunkStore.search', side_effect=AssertionError):
+        document_ids, vectors = get_document_embeddings(cluster_user.id)
+
+    assert document_ids == [docs[0].id, docs[1].id]
+    assert vectors.shape[0] == 2
+
+
+def test_document_embeddings_are_chunk_means(cluster_user, tmp_path, fake_embeddings):
+    """Test that each document's embedding is the mean of its chunk vectors across segments."""
+    import numpy as np
+    from backend.services.clustering import get_document_embeddings
+    from backend.services.knowledge_base import get_user_faiss_index_path
+    from backend.services.vector_store import load_user_vector_store
+    long_doc = _add(cluster_user, tmp_path, "long.txt", " ".join(TOPICS * 20))
+    short_doc = _add(cluster_user, tmp_path, "short.txt", TOPICS[2])
+
+    document_ids, vectors = get_document_embeddings(cluster_user.id)
+
+    vector_store = load_user_vector_store(get_user_faiss_index_path(cluster_user.id), fake_embeddings)
+    chunks = {doc_id: [] for doc_id in document_ids}
+    for segment in vector_store.segments:
+        for docstore_id in segment.index_to_docstore_id.values():
+            chunk = segment.docstore.search(docstore_id)
+            chunks[chunk.metadata["document_id"]].append(
+                fake_embeddings.embed_query(chunk.page_content)
+            )
+    assert document_ids == [long_doc.id, short_doc.id]
+    assert len(chunks[long_doc.id]) > 1
+    np.testing.assert_allclose(vectors, [np.mean(chunks[d], axis=0) for d in document_ids], rtol=1e-5)
@@ -1,8 +1,9 @@
 from unittest.mock import patch
-from backend.services.custom_cross_encoder import LlamaServerCrossEncoder
+from backend.services.custom_cross_encoder import LlamaServerCrossEncoder, truncate_to_tokens
+from backend.config import Config
 from langchain_core.documents import Document
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_llama_server_cross_encoder(mock_post):
     """Test the compress_documents method of the LlamaServerCrossEncoder."""
     mock_post.return_value.raise_for_status.return_value = None
@@ -26,3 +27,57 @@ def test_llama_server_cross_encoder(mock_post):
     assert reranked_docs[0].page_content == "doc2" # index 1
     assert reranked_docs[1].page_content == "doc1" # index 0
     mock_post.assert_called_once()
+    assert mock_post.call_args.kwargs["timeout"] == Config.RERANKING_TIMEOUT
+
+@patch('requests.Session.post')
+def test_llama_server_cross_encoder_only_scores_cache_misses(mock_post):
+    """Test that cached scores are reused and only new chunks are sent."""
+    encoder = LlamaServerCrossEncoder()
+    mock_post.return_value.json.return_value = {
+        'results': [{'index': 0, 'relevance_score': 0.2}, {'index': 1, 'relevance_score': 0.8}]
+    }
+    encoder.compress_documents([Document(page_content="a"), Document(page_content="b")], "query")
+
+    mock_post.return_value.json.return_value = {'results': [{'index': 0, 'relevance_score': 0.5}]}
+    docs = [Document(page_content="a"), Document(page_content="c"), Document(page_content="b")]
+    reranked_docs = encoder.compress_documents(docs, "query")
+
+    assert [doc.page_content for doc in reranked_docs] == ["b", "c", "a"]
+    assert mock_post.call_args.kwargs["json"]["documents"] == ["c"]
+
+    encoder.compress_documents(docs, "query")
+    assert mock_post.call_count == 2
+
+@patch('requests.Session.post')
+def test_llama_server_cross_encoder_truncates_and_keeps_top_n(mock_post):
+    """Test that candidates are truncated and the result is cut to RERANK_TOP_N."""
+    mock_post.return_value.json.return_value = {
+        'results': [{'index': i, 'relevance_score': i / 10} for i in range(3)]
+    }
+    docs = [Document(page_content=f"doc{i} " + "word " * 100) for i in range(3)]
+
+    with patch.object(Config, 'RERANK_MAX_TOKENS', 10), patch.object(Config, 'RERANK_TOP_N', 2):
+        reranked_docs = LlamaServerCrossEncoder().compress_documents(docs, "query")
+
+    assert [doc.page_content[:4] for doc in reranked_docs] == ["doc2", "doc1"]
+    assert all(len(text) <= 40 for text in mock_post.call_args.kwargs["json"]["documents"])
+
+def test_truncate_to_tokens():
+    """Test that truncation keeps short texts and cuts long ones at a word boundary."""
+    assert truncate_to_tokens("short text", 10) == "short text"
+    assert truncate_to_tokens("alpha beta gamma delta", 3) == "alpha beta"
+
+@patch('requests.Session.post')
+def test_llama_server_cross_encoder_error_degrades_the_result(mock_post):
+    """Test that falling back to the unranked documents marks the result degraded."""
+    import requests
+    from backend.services.http_client import request_deadline
+    mock_post.return_value.status_code = 400
+    mock_post.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError("400 Bad Request")
+    docs = [Document(page_content="doc1"), Document(page_content="doc2")]
+
+    with request_deadline(30) as deadline:
+        reranked_docs = LlamaServerCrossEncoder().compress_documents(docs, "test query")
+
+    assert [doc.page_content for doc in reranked_docs] == ["doc1", "doc2"]
+    assert deadline.degraded
@@ -1,7 +1,9 @@
+import json
 from unittest.mock import patch
 from backend.services.custom_llm import LlamaServerLLM
+from backend.config import Config
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_llama_server_llm_call(mock_post):
     """Test the _call method of the LlamaServerLLM."""
     mock_post.return_value.raise_for_status.return_value = None
@@ -16,3 +18,63 @@ def test_llama_server_llm_call(mock_post):
     assert response == "Test response"
     mock_post.assert_called_once()
     # Further assertions can be made on the payload of the request
+
+@patch('requests.Session.post')
+def test_llama_server_llm_call_error_degrades_the_answer(mock_post):
+    """Test that an error response is answered as text but marks the result degraded."""
+    import requests
+    from backend.services.http_client import request_deadline
+    mock_post.return_value.status_code = 400
+    mock_post.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError("400 Bad Request")
+
+    with request_deadline(30) as deadline:
+        response = LlamaServerLLM()._call("Test prompt")
+
+    assert response.startswith("Error calling Llama server")
+    assert deadline.degraded
+
+def test_think_filter_handles_tags_split_across_chunks():
+    """Test that <think> spans are removed even when tags are split up."""
+    from backend.services.custom_llm import ThinkFilter
+
+    think_filter = ThinkFilter()
+    pieces = ["<thi", "nk>Let me", " reason.</th", "ink>\n\nThe ans", "wer is <", "b>42</b>."]
+    text = "".join(think_filter.feed(piece) for piece in pieces) + think_filter.flush()
+
+    assert text == "The answer is <b>42</b>."
+
+@patch('requests.Session.post')
+def test_llama_server_llm_stream(mock_post):
+    """Test that _stream yields answer tokens without the <think> span."""
+    deltas = ["<think>", "hmm", "</think>", "\n\nHello", " world"]
+    lines = [b": keep-alive", b""]
+    lines += [f'data: {{"choices": [{{"delta": {{"content": {json.dumps(d)}}}}}]}}'.encode() for d in deltas]
+    lines += [b'data: {"choices": [{"delta": {}, "finish_reason": "stop"}]}', b"data: [DONE]"]
+    response = mock_post.return_value.__enter__.return_value
+    response.iter_lines.return_value = lines
+
+    llm = LlamaServerLLM()
+    with patch.object(Config, 'LLM_URL', 'http://test-llm-url'):
+        tokens = list(llm.stream("Test prompt"))
+
+    assert tokens == ["Hello", " world"]
+    assert mock_post.call_args.kwargs["json"]["stream"] is True
+    assert mock_post.call_args.kwargs["stream"] is True
+
+@patch('requests.Session.post')
+def test_llama_server_llm_stream_stops_at_the_deadline(mock_post):
+    """Test that a stream still going at the request deadline is cut short and marked degraded."""
+    from backend.services.http_client import request_deadline
+
+    def lines():
+        for delta in ["Hello", " slow", " world"]:
+            yield f'data: {{"choices": [{{"delta": {{"content": {json.dumps(delta)}}}}}]}}'.encode()
+            deadline.expires_at = 0
+    response = mock_post.return_value.__enter__.return_value
+    response.iter_lines.return_value = lines()
+
+    with patch.object(Config, 'LLM_URL', 'http://test-llm-url'), request_deadline(30) as deadline:
+        tokens = list(LlamaServerLLM().stream("Test prompt"))
+
+    assert tokens == ["Hello"]
+    assert deadline.degraded
@@ -0,0 +1,150 @@
+from unittest.mock import patch
+import pytest
+from backend.models import db, User, IngestionJob
+from backend.services.dedup import (
+    simhash,
+    hamming_distance,
+    find_near_duplicate,
+    record_fingerprint,
+    delete_fingerprint,
+)
+from backend.services.knowledge_base import add_document_to_kb, DuplicateDocumentError
+
+STORY = " ".join([
+    "The central bank raised interest rates by a quarter point on Tuesday,",
+    "citing persistent inflation in services and a tight labour market.",
+    "Officials signalled that further increases remain possible if price",
+    "pressures do not ease over the coming months. Markets had largely",
+    "expected the move and stocks closed slightly higher, while the currency",
+    "strengthened against the dollar. The decision was the third increase this",
+    "year and takes the benchmark rate to its highest level in over a decade.",
+    "Economists said household budgets would come under further strain as",
+    "mortgage payments rise, although wage growth has picked up in recent",
+    "quarters. The governor told reporters that the committee was united in",
+    "its view that inflation expectations had to be anchored, and that the",
+    "bank would act decisively if needed. Business groups warned that higher",
+    "borrowing costs could weigh on investment and hiring, particularly among",
+    "small firms that rely on bank credit. The next policy meeting is",
+    "scheduled for early next month, when updated forecasts will be published.",
+])
+SYNDICATED = STORY.replace("on Tuesday", "on Tuesday afternoon").replace("slightly", "modestly")
+UNRELATED = " ".join([
+    "The home team won the championship final after extra time, with the",
+    "striker scoring twice in front of a sold out stadium as fans celebrated",
+    "late into the night across the city centre and the old harbour. The",
+    "coach praised the resilience of his young squad, which had trailed for",
+    "most of the second half before an equaliser in stoppage time. Thousands",
+    "of supporters are expected to line the streets for a parade on Sunday,",
+    "and the club said the trophy would be displayed at the museum next week.",
+])
+
+
+def test_simhash_near_duplicates_are_close():
+    """Test that small wording changes keep fingerprints within a few bits."""
+    assert hamming_distance(simhash(STORY), simhash(SYNDICATED)) <= 3
+    assert hamming_distance(simhash(STORY), simhash(UNRELATED)) > 3
+
+
+def test_simhash_short_text():
+    """Test that texts too short to fingerprint are ignored."""
+    assert simhash("breaking news") is None
+
+
+def test_find_near_duplicate(app):
+    """Test fingerprint lookup through the band indexes."""
+    with app.app_context():
+        user = User(username="dedup_user", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        record_fingerprint(user.id, 101, simhash(STORY))
+        db.session.commit()
+
+        assert find_near_duplicate(user.id, simhash(SYNDICATED)) == 101
+        assert find_near_duplicate(user.id, simhash(UNRELATED)) is None
+        assert find_near_duplicate(user.id + 1, simhash(STORY)) is None
+
+        delete_fingerprint(101)
+        db.session.commit()
+        assert find_near_duplicate(user.id, simhash(STORY)) is None
+
+
+def test_find_near_duplicate_matches_brute_force(app):
+    """Test that band lookups find exactly what a scan of all fingerprints finds."""
+    import random
+    rng = random.Random(0)
+    with app.app_context():
+        user = User(username="dedup_user_many", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        stored = {1000 + document_id: rng.getrandbits(64) for document_id in range(2000)}
+        for document_id, fingerprint in stored.items():
+            record_fingerprint(user.id, document_id, fingerprint)
+        db.session.commit()
+
+        # Stored fingerprints with up to three bits flipped, and random ones
+        probes = []
+        for fingerprint in rng.sample(sorted(stored.values()), 50):
+            for bit in rng.sample(range(64), rng.randint(0, 3)):
+                fingerprint ^= 1 << bit
+            probes.append(fingerprint)
+        probes += [rng.getrandbits(64) for _ in range(50)]
+
+        for probe in probes:
+            expected = {document_id for document_id, fingerprint in stored.items()
+                        if hamming_distance(probe, fingerprint) <= 3}
+            found = find_near_duplicate(user.id, probe)
+            assert (found in expected) if expected else found is None
+
+
+def test_add_document_rejects_near_duplicate(app, tmp_path, fake_embeddings):
+    """Test that a near-duplicate is detected before any embedding happens."""
+    with app.app_context(), \
+         patch('backend.services.knowledge_base.LlamaServerEmbeddings', return_value=fake_embeddings):
+        user = User(username="dedup_kb_user", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        first = tmp_path / "first.txt"
+        first.write_text(STORY)
+        second = tmp_path / "second.txt"
+        second.write_text(SYNDICATED)
+
+        doc = add_document_to_kb(user.id, str(first), "txt")
+
+        with patch('backend.services.knowledge_base.build_segment') as mock_build, \
+             pytest.raises(DuplicateDocumentError) as excinfo:
+            add_document_to_kb(user.id, str(second), "txt")
+        assert excinfo.value.document_id == doc.id
+        mock_build.assert_not_called()
+        # The rejected file is deleted, but not one a document still uses
+        assert not second.exists()
+        with pytest.raises(DuplicateDocumentError):
+            add_document_to_kb(user.id, str(first), "txt")
+        assert first.exists()
+
+
+def test_rejected_duplicate_keeps_files_of_pending_jobs(app, tmp_path, fake_embeddings):
+    """Test that a rejected near-duplicate's file is kept while another job is yet to read it."""
+    with app.app_context(), \
+         patch('backend.services.knowledge_base.LlamaServerEmbeddings', return_value=fake_embeddings):
+        user = User(username="dedup_job_user", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        first = tmp_path / "first.txt"
+        first.write_text(STORY)
+        second = tmp_path / "second.txt"
+        second.write_text(SYNDICATED)
+        add_document_to_kb(user.id, str(first), "txt")
+        job = IngestionJob(user_id=user.id, file_path=str(second), document_type="txt", status="queued")
+        db.session.add(job)
+        db.session.commit()
+
+        with pytest.raises(DuplicateDocumentError):
+            add_document_to_kb(user.id, str(second), "txt")
+        assert second.exists()
+
+        # The job's own ingest doesn't keep the file
+        job.status = "running"
+        db.session.commit()
+        with pytest.raises(DuplicateDocumentError):
+            add_document_to_kb(user.id, str(second), "txt", job_id=job.id)
+        assert not second.exists()
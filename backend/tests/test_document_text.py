@@ -0,0 +1,50 @@
+import os
+from unittest.mock import patch
+from backend.models import db, User, Document, DocumentText
+from backend.services.knowledge_base import add_document_to_kb, delete_document_from_kb
+from backend.services.document_text import normalize_text, get_document_text, iter_document_texts
+from backend.services.search import generate_keyword_report
+
+
+def test_normalize_text():
+    """Test that line endings, trailing spaces and blank lines are normalized."""
+    assert normalize_text("  Title \r\n\r\n\r\n\r\nBody\ttext  \rEnd\n") == "Title\n\nBody\ttext\nEnd"
+
+
+def test_text_is_stored_at_ingest_and_used_by_reports(app, tmp_path, fake_embeddings):
+    """Test that reports work from the stored text once the file is gone."""
+    with app.app_context(), \
+         patch('backend.services.knowledge_base.LlamaServerEmbeddings', return_value=fake_embeddings):
+        user = User(username="document_text_user", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        path = tmp_path / "report.txt"
+        path.write_text("Semiconductor tariffs dominate semiconductor news.\r\n")
+
+        doc = add_document_to_kb(user.id, str(path), "txt")
+        os.remove(path)
+
+        assert get_document_text(doc.id) == "Semiconductor tariffs dominate semiconductor news."
+        stored = db.session.get(DocumentText, doc.id)
+        assert stored.size == len("Semiconductor tariffs dominate semiconductor news.")
+        assert "semiconductor" in generate_keyword_report(user.id)["top_keywords"]
+
+        delete_document_from_kb(doc.id)
+        assert get_document_text(doc.id) is None
+
+
+def test_iter_document_texts_falls_back_to_text_files(app, tmp_path):
+    """Test that documents ingested before texts were stored are read from disk."""
+    with app.app_context():
+        user = User(username="legacy_text_user", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        path = tmp_path / "legacy.txt"
+        path.write_text("legacy content")
+        db.session.add_all([
+            Document(user_id=user.id, file_path=str(path), document_type="txt"),
+            Document(user_id=user.id, file_path=str(tmp_path / "missing.pdf"), document_type="pdf"),
+        ])
+        db.session.commit()
+
+        assert [text for _, text in iter_document_texts(user.id)] == ["legacy content"]
@@ -3,12 +3,10 @@ from io import BytesIO
 from unittest.mock import patch
 
 @patch('os.path.exists', return_value=False)
-@patch('backend.services.knowledge_base.FAISS.from_documents')
-@patch('backend.services.knowledge_base.FAISS.load_local')
-@patch('backend.services.knowledge_base.LlamaServerEmbeddings')
-def test_upload_document_success(mock_embeddings, mock_load, mock_faiss, mock_exists, client, auth_token):
+@patch('backend.services.knowledge_base.publish_segment')
+@patch('backend.services.knowledge_base.build_segment')
+def test_upload_document_success(mock_build, mock_publish, mock_exists, client, auth_token):
     """Test successful document upload."""
-    mock_embeddings.return_value.embed_documents.return_value = [[0.1] * 768]
     data = {
         'file': (BytesIO(b'this is a test txt file'), 'test.txt'),
         'source': 'local',
@@ -17,8 +15,17 @@ def test_upload_document_success(mock_embeddings, mock_load, mock_faiss, mock_ex
     headers = {'Authorization': f'Bearer {auth_token}'}
     response = client.post('/api/documents', data=data, headers=headers, content_type='multipart/form-data')
     
-    assert response.status_code == 201
-    assert response.get_json()['msg'] == "File uploaded and processed successfully"
+    # Without ingestion workers the upload is processed before responding
+    assert response.status_code == 200
+    assert response.get_json()['msg'] == "File uploaded and processed"
+    assert response.get_json()['status'] == "done"
+
+    job_resp = client.get(f"/api/jobs/{response.get_json()['job_id']}", headers=headers)
+    assert job_resp.status_code == 200
+    assert job_resp.get_json()['status'] == "done"
+    assert job_resp.get_json()['document_id'] is not None
+    assert "file_path" not in job_resp.get_json()
+    assert mock_publish.call_args.args[1] is mock_build.return_value
 
 def test_upload_unsupported_file_type(client, auth_token):
     """Test uploading a file with an unsupported extension."""
@@ -32,12 +39,10 @@ def test_upload_unsupported_file_type(client, auth_token):
     assert response.get_json()['msg'] == "File type not allowed"
 
 @patch('os.path.exists', return_value=False)
-@patch('backend.services.knowledge_base.FAISS.from_documents')
-@patch('backend.services.knowledge_base.FAISS.load_local')
-@patch('backend.services.knowledge_base.LlamaServerEmbeddings')
-def test_get_documents(mock_embeddings, mock_load, mock_faiss, mock_exists, client, auth_token):
+@patch('backend.services.knowledge_base.publish_segment')
+@patch('backend.services.knowledge_base.build_segment')
+def test_get_documents(mock_build, mock_publish, mock_exists, client, auth_token):
     """Test retrieving a list of documents for a user."""
-    mock_embeddings.return_value.embed_documents.return_value = [[0.1] * 768]
     # First, upload a document
     client.post('/api/documents', data={
         'file': (BytesIO(b'content'), 'test.txt')
@@ -53,12 +58,10 @@ def test_get_documents(mock_embeddings, mock_load, mock_faiss, mock_exists, clie
     assert response.get_json()[0]['document_type'] == 'txt'
 
 @patch('os.path.exists', return_value=False)
-@patch('backend.services.knowledge_base.FAISS.from_documents')
-@patch('backend.services.knowledge_base.FAISS.load_local')
-@patch('backend.services.knowledge_base.LlamaServerEmbeddings')
-def test_delete_document(mock_embeddings, mock_load, mock_faiss, mock_exists, client, auth_token):
+@patch('backend.services.knowledge_base.publish_segment')
+@patch('backend.services.knowledge_base.build_segment')
+def test_delete_document(mock_build, mock_publish, mock_exists, client, auth_token):
     """Test deleting a document."""
-    mock_embeddings.return_value.embed_documents.return_value = [[0.1] * 768]
     # Upload a document to get an ID
     upload_resp = client.post('/api/documents', data={
         'file': (BytesIO(b'content'), 'delete_me.txt')
@@ -79,12 +82,10 @@ def test_delete_document(mock_embeddings, mock_load, mock_faiss, mock_exists, cl
     assert len(list_after_delete.get_json()) == 0
 
 @patch('os.path.exists', return_value=False)
-@patch('backend.services.knowledge_base.FAISS.from_documents')
-@patch('backend.services.knowledge_base.FAISS.load_local')
-@patch('backend.services.knowledge_base.LlamaServerEmbeddings')
-def test_update_document(mock_embeddings, mock_load, mock_faiss, mock_exists, client, auth_token):
+@patch('backend.services.knowledge_base.publish_segment')
+@patch('backend.services.knowledge_base.build_segment')
+def test_update_document(mock_build, mock_publish, mock_exists, client, auth_token):
     """Test updating a document's metadata."""
-    mock_embeddings.return_value.embed_documents.return_value = [[0.1] * 768]
     headers = {'Authorization': f'Bearer {auth_token}'}
     
     # Upload a document
@@ -112,12 +113,10 @@ def test_update_document(mock_embeddings, mock_load, mock_faiss, mock_exists, cl
     assert updated_doc['tags'] == 'updated_tags'
 
 @patch('os.path.exists', return_value=False)
-@patch('backend.services.knowledge_base.FAISS.from_documents')
-@patch('backend.services.knowledge_base.FAISS.load_local')
-@patch('backend.services.knowledge_base.LlamaServerEmbeddings')
-def test_get_documents_with_filters(mock_embeddings, mock_load, mock_faiss, mock_exists, client, auth_token):
+@patch('backend.services.knowledge_base.publish_segment')
+@patch('backend.services.knowledge_base.build_segment')
+def test_get_documents_with_filters(mock_build, mock_publish, mock_exists, client, auth_token):
     """Test filtering documents by type and date."""
-    mock_embeddings.return_value.embed_documents.return_value = [[0.1] * 768]
     headers = {'Authorization': f'Bearer {auth_token}'}
 
     # Upload a few documents
@@ -145,12 +144,10 @@ def test_get_documents_with_filters(mock_embeddings, mock_load, mock_faiss, mock
     assert len(response_date.get_json()) == 2
 
 @patch('os.path.exists', return_value=False)
-@patch('backend.services.knowledge_base.FAISS.from_documents')
-@patch('backend.services.knowledge_base.FAISS.load_local')
-@patch('backend.services.knowledge_base.LlamaServerEmbeddings')
-def test_batch_delete_documents(mock_embeddings, mock_load, mock_faiss, mock_exists, client, auth_token):
+@patch('backend.services.knowledge_base.publish_segment')
+@patch('backend.services.knowledge_base.build_segment')
+def test_batch_delete_documents(mock_build, mock_publish, mock_exists, client, auth_token):
     """Test deleting multiple documents in a batch."""
-    mock_embeddings.return_value.embed_documents.return_value = [[0.1] * 768]
     headers = {'Authorization': f'Bearer {auth_token}'}
 
     # Upload documents
@@ -0,0 +1,77 @@
+from backend.services.embedding_cache import EmbeddingCache, get_embedding_cache
+
+
+def test_embedding_cache_roundtrip(tmp_path):
+    """Test that stored embeddings are returned and counted as hits."""
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=10)
+    cache.put_many("model", [("hello", [0.5, 0.25]), ("world", [1.0, 2.0])])
+
+    found = cache.get_many("model", ["hello", "missing"])
+
+    assert found == {"hello": [0.5, 0.25]}
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["entries"] == 2
+
+
+def test_embedding_cache_is_keyed_by_model(tmp_path):
+    """Test that the same text embedded by another model is a miss."""
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=10)
+    cache.put_many("model-a", [("hello", [0.5])])
+
+    assert cache.get_many("model-b", ["hello"]) == {}
+
+
+def test_embedding_cache_skips_failed_embeddings(tmp_path):
+    """Test that empty vectors from a failed request are not cached."""
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=10)
+    cache.put_many("model", [("hello", [])])
+
+    assert cache.stats()["entries"] == 0
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    """Test that the cache is trimmed to max_entries, oldest first."""
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.put_many("model", [("a", [1.0])])
+    cache.put_many("model", [("b", [2.0])])
+    cache.get_many("model", ["a"])
+    cache.put_many("model", [("c", [3.0])])
+
+    found = cache.get_many("model", ["a", "b", "c"])
+
+    assert set(found) == {"a", "c"}
+    assert cache.stats()["entries"] == 2
+
+
+def test_embedding_cache_counts_rows_without_scanning(tmp_path):
+    """Test that rewrites don't grow the kept count and rows of an existing cache are counted."""
+    import sqlite3
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE embeddings (key TEXT PRIMARY KEY, model TEXT NOT NULL,"
+        " vector BLOB NOT NULL, last_access REAL NOT NULL)"
+    )
+    conn.executemany("INSERT INTO embeddings VALUES (?, ?, ?, ?)",
+                     [(str(i), "model", bytes(4), float(i)) for i in range(3)])
+    conn.commit()
+    conn.close()
+
+    cache = EmbeddingCache(path, max_entries=4)
+    assert cache.stats()["entries"] == 3
+    cache.put_many("model", [("a", [1.0])])
+    cache.put_many("model", [("a", [2.0])])
+    assert cache.stats()["entries"] == 4
+    assert cache.get_many("model", ["a"]) == {"a": [2.0]}
+    cache.put_many("model", [("b", [3.0])])
+    assert cache.stats()["entries"] == 4
+
+
+def test_get_embedding_cache_disabled(monkeypatch):
+    """Test that an empty cache path disables the cache."""
+    from backend.config import Config
+    monkeypatch.setattr(Config, "EMBEDDING_CACHE_PATH", "")
+    assert get_embedding_cache() is None
@@ -0,0 +1,122 @@
+from unittest.mock import patch, MagicMock
+import pytest
+import requests
+from backend.config import Config
+from backend.services.http_client import (
+    request, request_deadline, get_breaker, CircuitOpenError, DeadlineExceeded
+)
+
+
+def _response(status_code):
+    response = MagicMock()
+    response.status_code = status_code
+    return response
+
+
+@patch('backend.services.http_client.time.sleep')
+@patch('requests.Session.post')
+def test_request_retries_idempotent_calls(mock_post, mock_sleep):
+    """Test that idempotent calls are retried on 5xx responses and connection errors."""
+    mock_post.side_effect = [_response(503), requests.exceptions.ConnectionError(), _response(200)]
+
+    response = request("embedding", "POST", "http://embed", json={}, timeout=5, idempotent=True)
+
+    assert response.status_code == 200
+    assert mock_post.call_count == 3
+    assert mock_sleep.call_count == 2
+    assert get_breaker("embedding").state == "closed"
+
+
+@patch('requests.Session.post')
+def test_request_does_not_retry_other_calls(mock_post):
+    """Test that non-idempotent calls are sent once."""
+    mock_post.side_effect = requests.exceptions.Timeout()
+
+    with pytest.raises(requests.exceptions.Timeout):
+        request("llm", "POST", "http://llm", json={}, timeout=5)
+    assert mock_post.call_count == 1
+
+
+@patch('backend.services.http_client.time.monotonic')
+@patch('requests.Session.post')
+def test_circuit_breaker_fails_fast_and_probes(mock_post, mock_monotonic):
+    """Test that an open circuit skips the backend until a probe succeeds."""
+    mock_monotonic.return_value = 1000.0
+    mock_post.side_effect = requests.exceptions.ConnectionError()
+    for _ in range(Config.CIRCUIT_FAILURE_THRESHOLD):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            request("llm", "POST", "http://llm", timeout=5)
+
+    with pytest.raises(CircuitOpenError):
+        request("llm", "POST", "http://llm", timeout=5)
+    assert mock_post.call_count == Config.CIRCUIT_FAILURE_THRESHOLD
+
+    mock_monotonic.return_value = 1000.0 + Config.CIRCUIT_RESET_SECONDS
+    mock_post.side_effect = None
+    mock_post.return_value = _response(200)
+    assert request("llm", "POST", "http://llm", timeout=5).status_code == 200
+    assert get_breaker("llm").state == "closed"
+
+
+@patch('requests.Session.post')
+def test_request_deadline_caps_timeouts(mock_post):
+    """Test that calls get at most the remaining time of the deadline."""
+    mock_post.return_value = _response(200)
+
+    with request_deadline(2) as deadline:
+        request("reranker", "POST", "http://rerank", timeout=30)
+        assert mock_post.call_args.kwargs["timeout"] <= 2
+
+        deadline.expires_at = 0
+        with pytest.raises(DeadlineExceeded):
+            request("reranker", "POST", "http://rerank", timeout=30)
+        assert deadline.degraded
+    assert mock_post.call_count == 1
+
+
+def _open_circuit(mock_post, backend):
+    mock_post.side_effect = requests.exceptions.ConnectionError()
+    for _ in range(Config.CIRCUIT_FAILURE_THRESHOLD):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            request(backend, "POST", f"http://{backend}", timeout=5)
+    assert get_breaker(backend).state == "open"
+
+
+@patch('backend.services.http_client.time.monotonic')
+@patch('requests.Session.post')
+def test_expired_deadline_does_not_take_the_probe(mock_post, mock_monotonic):
+    """Test that a call past its deadline leaves the probe to a later call."""
+    mock_monotonic.return_value = 1000.0
+    _open_circuit(mock_post, "llm")
+    mock_monotonic.return_value = 1000.0 + Config.CIRCUIT_RESET_SECONDS
+
+    with request_deadline(2) as deadline:
+        deadline.expires_at = 0
+        with pytest.raises(DeadlineExceeded):
+            request("llm", "POST", "http://llm", timeout=5)
+    assert get_breaker("llm").state == "open"
+
+    mock_post.side_effect = None
+    mock_post.return_value = _response(200)
+    assert request("llm", "POST", "http://llm", timeout=5).status_code == 200
+    assert get_breaker("llm").state == "closed"
+
+
+@patch('backend.services.http_client.time.monotonic')
+@patch('requests.Session.post')
+def test_failed_probe_reopens_the_circuit(mock_post, mock_monotonic):
+    """Test that a probe failing with any other request error reopens the circuit."""
+    mock_monotonic.return_value = 1000.0
+    _open_circuit(mock_post, "llm")
+    mock_monotonic.return_value = 1000.0 + Config.CIRCUIT_RESET_SECONDS
+
+    mock_post.side_effect = requests.exceptions.ChunkedEncodingError()
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        request("llm", "POST", "http://llm", timeout=5)
+    assert get_breaker("llm").state == "open"
+
+    mock_monotonic.return_value = 1000.0 + 2 * Config.CIRCUIT_RESET_SECONDS
+    mock_post.side_effect = None
+    mock_post.return_value = _response(200)
+    assert request("llm", "POST", "http://llm", timeout=5).status_code == 200
+    assert get_breaker("llm").state == "closed"
@@ -0,0 +1,34 @@
+from unittest.mock import patch, MagicMock
+from langchain_core.documents import Document
+from backend.services.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+
+
+def _doc(doc_id):
+    return Document(id=doc_id, page_content=f"text {doc_id}")
+
+
+def test_reciprocal_rank_fusion_favors_documents_in_both_lists():
+    """Test that documents ranked by both retrievers come first."""
+    vector = [_doc("a"), _doc("b"), _doc("c")]
+    lexical = [_doc("d"), _doc("c"), _doc("a")]
+
+    fused = reciprocal_rank_fusion([vector, lexical])
+
+    assert [doc.id for doc in fused] == ["a", "c", "d", "b"]
+
+
+@patch('backend.services.hybrid_retriever.get_chunks')
+@patch('backend.services.hybrid_retriever.search_chunk_ids')
+def test_hybrid_retriever_limits_candidates(mock_search_chunk_ids, mock_get_chunks):
+    """Test that the fused candidates are capped at k and only new keyword hits are loaded."""
+    vector_retriever = MagicMock()
+    vector_retriever.invoke.return_value = [_doc("a"), _doc("b"), _doc("c")]
+    mock_search_chunk_ids.return_value = ["TSLA", "b", "XOM"]
+    mock_get_chunks.side_effect = lambda ids: [_doc(doc_id) for doc_id in ids]
+
+    retriever = HybridRetriever(vector_retriever=vector_retriever, user_id=7, lexical_k=5, k=3)
+    docs = retriever.invoke("TSLA deliveries")
+
+    assert [doc.id for doc in docs] == ["b", "a", "TSLA"]
+    mock_search_chunk_ids.assert_called_once_with(7, "TSLA deliveries", 5)
+    mock_get_chunks.assert_called_once_with(["TSLA"])
@@ -0,0 +1,91 @@
+import os
+from unittest.mock import MagicMock
+from backend.services.index_cache import IndexCache
+
+
+def _write_index(index_path, content=b"vectors"):
+    os.makedirs(index_path, exist_ok=True)
+    for name in ("index.faiss", "index.pkl"):
+        with open(os.path.join(index_path, name), "wb") as f:
+            f.write(content)
+
+
+def test_index_cache_hit_and_miss(tmp_path):
+    """Test that a second lookup for the same index is served from the cache."""
+    index_path = str(tmp_path / "user_1")
+    _write_index(index_path)
+    cache = IndexCache(max_entries=4, max_bytes=1024)
+    loader = MagicMock(return_value="store")
+
+    assert cache.get(1, index_path, loader) == "store"
+    assert cache.get(1, index_path, loader) == "store"
+
+    loader.assert_called_once()
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_index_cache_reloads_when_index_changes(tmp_path):
+    """Test that rewriting an index on disk causes a reload."""
+    index_path = str(tmp_path / "user_1")
+    _write_index(index_path)
+    cache = IndexCache(max_entries=4, max_bytes=1024)
+    cache.get(1, index_path, lambda: "old")
+
+    _write_index(index_path, b"more vectors")
+
+    assert cache.get(1, index_path, lambda: "new") == "new"
+    assert cache.stats()["misses"] == 2
+
+
+def test_index_cache_invalidate(tmp_path):
+    """Test that invalidate drops the cached entry."""
+    index_path = str(tmp_path / "user_1")
+    _write_index(index_path)
+    cache = IndexCache(max_entries=4, max_bytes=1024)
+    cache.get(1, index_path, lambda: "store")
+
+    cache.invalidate(1)
+
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_index_cache_evicts_least_recently_used(tmp_path):
+    """Test LRU eviction by entry count and by total bytes."""
+    paths = {}
+    for user_id in (1, 2, 3):
+        paths[user_id] = str(tmp_path / f"user_{user_id}")
+        _write_index(paths[user_id], b"x" * 10)
+
+    cache = IndexCache(max_entries=2, max_bytes=1024)
+    cache.get(1, paths[1], lambda: "one")
+    cache.get(2, paths[2], lambda: "two")
+    cache.get(1, paths[1], lambda: "one")
+    cache.get(3, paths[3], lambda: "three")
+
+    loader = MagicMock(return_value="two")
+    cache.get(2, paths[2], loader)
+    loader.assert_called_once()
+    assert cache.stats()["evictions"] == 2
+
+    small_cache = IndexCache(max_entries=10, max_bytes=50)
+    small_cache.get(1, paths[1], lambda: "one")
+    small_cache.get(2, paths[2], lambda: "two")
+    small_cache.get(3, paths[3], lambda: "three")
+    assert small_cache.stats()["entries"] == 2
+    assert small_cache.stats()["bytes"] <= 50
+
+
+def test_index_cache_skips_missing_index(tmp_path):
+    """Test that an index with no files on disk is loaded but not cached."""
+    cache = IndexCache(max_entries=4, max_bytes=1024)
+    loader = MagicMock(return_value="store")
+
+    cache.get(1, str(tmp_path / "missing"), loader)
+    cache.get(1, str(tmp_path / "missing"), loader)
+
+    assert loader.call_count == 2
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,50 @@
+import faiss
+import numpy as np
+from backend.config import Config
+from backend.services.index_factory import (
+    build_index,
+    choose_index_type,
+    configure_search,
+    get_index_type,
+    reconstruct_vectors,
+)
+
+
+def _vectors(n, dimension=8):
+    return np.random.default_rng(1).random((n, dimension), dtype=np.float32)
+
+
+def test_choose_index_type_by_size(monkeypatch):
+    """Test that the index type follows the configured size thresholds."""
+    monkeypatch.setattr(Config, 'INDEX_HNSW_THRESHOLD', 100)
+    monkeypatch.setattr(Config, 'INDEX_IVFPQ_THRESHOLD', 1000)
+    assert choose_index_type(99) == "flat"
+    assert choose_index_type(100) == "hnsw"
+    assert choose_index_type(1000) == "ivfpq"
+
+
+def test_build_index_types_find_nearest_vector():
+    """Test that every index type returns the query vector as its nearest neighbour."""
+    vectors = _vectors(2000)
+    for index_type in ("flat", "hnsw", "ivfpq"):
+        index = configure_search(build_index(vectors, index_type))
+        assert get_index_type(index) == index_type
+        assert index.ntotal == 2000
+        _, positions = index.search(vectors[:5], 1)
+        assert (positions[:, 0] == np.arange(5)).mean() >= 0.8
+
+
+def test_configure_search_applies_config(monkeypatch):
+    """Test that efSearch and nprobe come from the config."""
+    monkeypatch.setattr(Config, 'INDEX_HNSW_EF_SEARCH', 99)
+    monkeypatch.setattr(Config, 'INDEX_IVF_NPROBE', 3)
+    vectors = _vectors(2000)
+    assert configure_search(build_index(vectors, "hnsw")).hnsw.efSearch == 99
+    assert configure_search(build_index(vectors, "ivfpq")).nprobe == 3
+
+
+def test_reconstruct_vectors_of_ivfpq_index():
+    """Test that vectors can be read back from a product-quantized index."""
+    vectors = _vectors(2000)
+    index = faiss.deserialize_index(faiss.serialize_index(build_index(vectors, "ivfpq")))
+    assert reconstruct_vectors(index).shape == vectors.shape
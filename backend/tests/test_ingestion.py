@@ -0,0 +1,108 @@
+import datetime
+from io import BytesIO
+from unittest.mock import patch
+from backend.models import db, User, IngestionJob
+from backend.services.document_text import get_document_text
+from backend.services.ingestion import (
+    enqueue_ingestion,
+    process_next_job,
+    run_queued_job,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+)
+
+
+def _make_user(name):
+    user = User(username=name, password_hash="test")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def test_process_next_job_records_progress(app, tmp_path, fake_embeddings):
+    """Test that a worker drains the queue and reports chunk progress."""
+    with app.app_context(), \
+         patch('backend.services.knowledge_base.LlamaServerEmbeddings', return_value=fake_embeddings):
+        user = _make_user("ingest_user")
+        path = tmp_path / "article.txt"
+        path.write_text("word " * 1000)
+        job = enqueue_ingestion(user.id, str(path), "txt", "local", "news")
+
+        assert process_next_job(app)
+        assert not process_next_job(app)
+
+        db.session.refresh(job)
+        assert job.status == JOB_DONE
+        assert job.chunks_total > 1
+        assert job.chunks_embedded == job.chunks_total
+        assert job.document_id is not None
+
+
+def test_failed_job_records_error(app, tmp_path):
+    """Test that an exception during ingestion marks the job as failed."""
+    with app.app_context():
+        user = _make_user("ingest_user_failed")
+        job = enqueue_ingestion(user.id, str(tmp_path / "missing.txt"), "txt")
+
+        assert not run_queued_job(job.id)
+
+        db.session.refresh(job)
+        assert job.status == JOB_FAILED
+        assert job.error
+
+
+def test_stale_running_job_is_requeued(app, tmp_path, fake_embeddings):
+    """Test that a job left running by a crashed worker is picked up again."""
+    with app.app_context(), \
+         patch('backend.services.knowledge_base.LlamaServerEmbeddings', return_value=fake_embeddings):
+        user = _make_user("ingest_user_stale")
+        path = tmp_path / "article.txt"
+        path.write_text("some text")
+        job = enqueue_ingestion(user.id, str(path), "txt")
+        job.status = JOB_RUNNING
+        job.attempts = 1
+        job.updated_at = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+        db.session.commit()
+
+        assert process_next_job(app)
+
+        db.session.refresh(job)
+        assert job.status == JOB_DONE
+        assert job.attempts == 2
+
+
+def test_job_status_endpoint_is_per_user(client, auth_token):
+    """Test that users cannot see other users' jobs."""
+    other = _make_user("someone_else")
+    job = IngestionJob(user_id=other.id, file_path="x.txt", document_type="txt", status=JOB_QUEUED)
+    db.session.add(job)
+    db.session.commit()
+
+    headers = {'Authorization': f'Bearer {auth_token}'}
+    response = client.get(f'/api/jobs/{job.id}', headers=headers)
+
+    assert response.status_code == 404
+
+
+def test_queued_uploads_of_the_same_name_keep_their_files(app, client, auth_token, fake_embeddings, monkeypatch):
+    """Test that two queued uploads named alike are each ingested with their own content."""
+    monkeypatch.setitem(app.config, 'INGESTION_WORKERS', 1)
+    headers = {'Authorization': f'Bearer {auth_token}'}
+    contents = ["apples and pears grow in the orchard", "the harbour freezes over every winter"]
+    job_ids = []
+    for content in contents:
+        response = client.post('/api/documents', data={'file': (BytesIO(content.encode()), 'news.txt')},
+                               headers=headers, content_type='multipart/form-data')
+        assert response.status_code == 202
+        job_ids.append(response.get_json()['job_id'])
+
+    with patch('backend.services.knowledge_base.LlamaServerEmbeddings', return_value=fake_embeddings):
+        assert process_next_job(app)
+        assert process_next_job(app)
+
+    jobs = [db.session.get(IngestionJob, job_id) for job_id in job_ids]
+    assert [job.status for job in jobs] == [JOB_DONE, JOB_DONE]
+    assert jobs[0].file_path != jobs[1].file_path
+    assert [get_document_text(job.document_id) for job in jobs] == contents
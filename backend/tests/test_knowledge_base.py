@@ -0,0 +1,195 @@
+from unittest.mock import patch
+import pytest
+from backend.models import db, User, Document, DocumentChunk
+from backend.services.knowledge_base import (
+    add_document_to_kb,
+    delete_document_from_kb,
+    get_tombstoned_chunks,
+    compact_user_index,
+    get_user_faiss_index_path,
+    get_kb_version,
+)
+from backend.services.vector_store import load_user_vector_store
+from backend.services.lexical_index import search_chunks
+
+
+@pytest.fixture
+def kb_user(app, tmp_path, fake_embeddings):
+    with app.app_context(), \
+         patch('backend.services.knowledge_base.LlamaServerEmbeddings', return_value=fake_embeddings):
+        user = User(username=f"kb_user_{tmp_path.name}", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        yield user
+
+
+def _write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content)
+    return str(path)
+
+
+def test_add_document_records_chunks(kb_user, tmp_path, fake_embeddings):
+    """Test that ingesting a document records its docstore ids."""
+    doc = add_document_to_kb(kb_user.id, _write(tmp_path, "a.txt", "alpha " * 400), "txt")
+
+    chunks = DocumentChunk.query.filter_by(document_id=doc.id).all()
+    assert len(chunks) > 1
+
+    vector_store = load_user_vector_store(get_user_faiss_index_path(kb_user.id), fake_embeddings)
+    segment = vector_store.segments[0]
+    indexed_ids = set(segment.index_to_docstore_id.values())
+    assert {chunk.docstore_id for chunk in chunks} == indexed_ids
+    assert all(segment.docstore.search(chunk.docstore_id).metadata["document_id"] == doc.id
+               for chunk in chunks)
+
+
+def test_delete_and_compact_removes_vectors(kb_user, tmp_path, fake_embeddings):
+    """Test that deletion tombstones chunks and compaction removes their vectors."""
+    doc_a = add_document_to_kb(kb_user.id, _write(tmp_path, "a.txt", "alpha text"), "txt")
+    doc_b = add_document_to_kb(kb_user.id, _write(tmp_path, "b.txt", "beta text"), "txt")
+    doc_a_id = doc_a.id
+
+    assert delete_document_from_kb(doc_a_id)
+    assert db.session.get(Document, doc_a_id) is None
+    assert [document_id for document_id, _ in get_tombstoned_chunks(kb_user.id)] == [doc_a_id]
+
+    assert compact_user_index(kb_user.id) == 1
+    assert get_tombstoned_chunks(kb_user.id) == []
+
+    vector_store = load_user_vector_store(get_user_faiss_index_path(kb_user.id), fake_embeddings)
+    assert sum(segment.index.ntotal for segment in vector_store.segments) == 1
+    remaining = vector_store.similarity_search("alpha text", k=5)
+    assert [d.metadata["document_id"] for d in remaining] == [doc_b.id]
+
+
+def test_add_document_merges_small_segments(kb_user, tmp_path, fake_embeddings):
+    """Test that ingesting merges the small segments once there are enough of them."""
+    from backend.config import Config
+    from backend.services.vector_store import read_manifest
+    index_path = get_user_faiss_index_path(kb_user.id)
+    with patch.object(Config, 'KB_SEGMENT_MERGE_MIN_SEGMENTS', 3):
+        docs = [add_document_to_kb(kb_user.id, _write(tmp_path, f"{i}.txt", f"text {i}"), "txt") for i in range(2)]
+        assert len(read_manifest(index_path)["segments"]) == 2
+        docs.append(add_document_to_kb(kb_user.id, _write(tmp_path, "2.txt", "text 2"), "txt"))
+
+    assert len(read_manifest(index_path)["segments"]) == 1
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert sorted(d.metadata["document_id"] for d in vector_store.similarity_search("text", k=5)) == [
+        doc.id for doc in docs
+    ]
+
+
+def test_kb_version_changes_on_add_and_delete(kb_user, tmp_path):
+    """Test that adding and deleting documents bumps the KB version."""
+    assert get_kb_version(kb_user.id) == 0
+
+    doc = add_document_to_kb(kb_user.id, _write(tmp_path, "a.txt", "alpha text"), "txt")
+    assert get_kb_version(kb_user.id) == 1
+
+    delete_document_from_kb(doc.id)
+    assert get_kb_version(kb_user.id) == 2
+
+
+def test_keyword_index_follows_documents(kb_user, app, tmp_path):
+    """Test that chunks are keyword-searchable until their document is deleted."""
+    doc = add_document_to_kb(kb_user.id, _write(tmp_path, "a.txt", "Shares of NVDA rose after earnings."), "txt")
+    add_document_to_kb(kb_user.id, _write(tmp_path, "b.txt", "The weather was mild."), "txt")
+
+    hits = search_chunks(kb_user.id, "NVDA outlook?", k=5)
+    assert [hit.metadata["document_id"] for hit in hits] == [doc.id]
+    assert hits[0].id == DocumentChunk.query.filter_by(document_id=doc.id).one().docstore_id
+    assert search_chunks(kb_user.id + 1, "NVDA", k=5) == []
+    # FTS5 syntax in the query is treated as plain text
+    assert search_chunks(kb_user.id, 'NVDA" OR user_key:*', k=5)[0].metadata["document_id"] == doc.id
+
+    delete_document_from_kb(doc.id)
+    assert search_chunks(kb_user.id, "NVDA", k=5) == []
+
+
+def test_failed_ingest_leaves_no_live_vectors(kb_user, tmp_path, fake_embeddings):
+    """Test that vectors published by a failed ingest are tombstoned and compacted away."""
+    with patch('backend.services.knowledge_base.store_document_text', side_effect=RuntimeError("boom")):
+        with pytest.raises(RuntimeError):
+            add_document_to_kb(kb_user.id, _write(tmp_path, "a.txt", "alpha text"), "txt")
+    failed_ids = [row.document_id for row in DocumentChunk.query.filter_by(user_id=kb_user.id)]
+    assert Document.query.filter_by(user_id=kb_user.id).count() == 0
+    assert [document_id for document_id, _ in get_tombstoned_chunks(kb_user.id)] == failed_ids
+
+    doc = add_document_to_kb(kb_user.id, _write(tmp_path, "b.txt", "beta text"), "txt")
+    assert doc.id not in failed_ids
+
+    assert compact_user_index(kb_user.id) == 1
+    assert DocumentChunk.query.filter_by(user_id=kb_user.id, deleted=True).count() == 0
+    vector_store = load_user_vector_store(get_user_faiss_index_path(kb_user.id), fake_embeddings)
+    assert [d.metadata["document_id"] for d in vector_store.similarity_search("alpha text", k=5)] == [doc.id]
+
+
+def test_compaction_removes_vectors_without_chunk_rows(kb_user, tmp_path, fake_embeddings):
+    """Test that vectors whose docstore id has no DocumentChunk row are dropped."""
+    from langchain_core.documents import Document as LangchainDocument
+    from backend.services.vector_store import append_segment
+    doc = add_document_to_kb(kb_user.id, _write(tmp_path, "a.txt", "alpha text"), "txt")
+    index_path = get_user_faiss_index_path(kb_user.id)
+    append_segment(index_path, [LangchainDocument(page_content="orphan")], ["orphan"], fake_embeddings)
+
+    assert compact_user_index(kb_user.id) == 1
+
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert [d.metadata["document_id"] for d in vector_store.similarity_search("orphan", k=5)] == [doc.id]
+
+
+def test_compaction_discards_crashed_ingests(kb_user, tmp_path):
+    """Test that documents left pending by a crashed ingest are discarded, live ones kept."""
+    import datetime
+    doc = add_document_to_kb(kb_user.id, _write(tmp_path, "a.txt", "alpha text"), "txt")
+    crashed = Document(user_id=kb_user.id, file_path="b.txt", document_type="txt",
+                       uploaded_at=datetime.datetime(2000, 1, 1))
+    db.session.add(crashed)
+    db.session.flush()
+    db.session.add(DocumentChunk(user_id=kb_user.id, document_id=crashed.id, docstore_id="crashed", deleted=True))
+    db.session.add(DocumentChunk(user_id=kb_user.id, document_id=doc.id, docstore_id="stale", deleted=True))
+    doc.uploaded_at = datetime.datetime(2000, 1, 1)
+    db.session.commit()
+    crashed_id = crashed.id
+
+    compact_user_index(kb_user.id)
+
+    assert db.session.get(Document, crashed_id) is None
+    assert db.session.get(Document, doc.id) is not None
+
+
+def test_compaction_keeps_vectors_of_earlier_versions(kb_user, tmp_path, fake_embeddings):
+    """Test that an index written before chunks were recorded is adopted, not swept as orphans."""
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document as LangchainDocument
+    path = _write(tmp_path, "legacy.txt", "legacy text")
+    doc = Document(user_id=kb_user.id, file_path=path, document_type="txt")
+    db.session.add(doc)
+    kb_user.chunks_recorded = False
+    db.session.commit()
+    index_path = get_user_faiss_index_path(kb_user.id)
+    chunks = [LangchainDocument(page_content=f"legacy chunk {i}", metadata={"source": path}) for i in range(3)]
+    # Chunks of a document deleted before the upgrade
+    chunks += [LangchainDocument(page_content=f"gone chunk {i}", metadata={"source": "gone.txt"}) for i in range(2)]
+    FAISS.from_documents(chunks, fake_embeddings).save_local(index_path)
+
+    assert compact_user_index(kb_user.id) == 0
+
+    assert DocumentChunk.query.filter_by(document_id=doc.id, deleted=False).count() == 3
+    assert DocumentChunk.query.filter_by(user_id=kb_user.id, document_id=0).count() == 2
+    assert load_user_vector_store(index_path, fake_embeddings).segments[0].index.ntotal == 5
+    # The chunks are in the keyword index too
+    hits = search_chunks(kb_user.id, "legacy gone", 10)
+    assert sorted(d.page_content for d in hits) == [f"gone chunk {i}" for i in range(2)] + [
+        f"legacy chunk {i}" for i in range(3)
+    ]
+    assert {d.metadata.get("document_id") for d in hits} == {doc.id, None}
+
+    delete_document_from_kb(doc.id)
+    assert [d.page_content for d in search_chunks(kb_user.id, "legacy", 10)] == []
+    assert compact_user_index(kb_user.id) == 3
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert sorted(d.page_content for d in vector_store.similarity_search("chunk", k=5)) == [
+        "gone chunk 0", "gone chunk 1"
+    ]
@@ -0,0 +1,70 @@
+import pytest
+from unittest.mock import patch
+from backend.config import Config
+from backend.services.metrics import MetricsRegistry, render_metrics, stage_timer, track_request
+
+
+def test_registry_sums_snapshots_of_all_processes(tmp_path):
+    """Test that counters and histograms written by other workers are added up."""
+    worker = MetricsRegistry()
+    worker.inc("rag_requests_total", pipeline="search")
+    worker.observe("rag_stage_duration_seconds", 0.2, stage="rerank")
+    worker.flush(str(tmp_path))
+
+    scraper = MetricsRegistry()
+    scraper.inc("rag_requests_total", 2, pipeline="search")
+    scraper.observe("rag_stage_duration_seconds", 3.0, stage="rerank")
+    # The serving worker's own snapshot is replaced by its live values
+    scraper.flush(str(tmp_path))
+    scraper.inc("rag_requests_total", pipeline="search")
+
+    counters, histograms = scraper.collect(str(tmp_path))
+
+    assert counters[("rag_requests_total", (("pipeline", "search"),))] == 4
+    rerank = histograms[("rag_stage_duration_seconds", (("stage", "rerank"),))]
+    assert sum(rerank[:-1]) == 2
+    assert rerank[-1] == pytest.approx(3.2)
+
+
+def test_render_metrics_prometheus_format(tmp_path):
+    """Test the exposition format of counters and histograms."""
+    registry = MetricsRegistry()
+    with patch('backend.services.metrics.registry', registry), \
+            patch.object(Config, 'METRICS_DIR', str(tmp_path)):
+        with stage_timer("llm_generation"):
+            pass
+        with pytest.raises(RuntimeError):
+            with track_request("search"):
+                raise RuntimeError("boom")
+        text = render_metrics()
+
+    assert "# TYPE rag_requests_total counter" in text
+    assert 'rag_requests_total{pipeline="search"} 1' in text
+    assert 'rag_errors_total{pipeline="search"} 1' in text
+    assert 'rag_stage_duration_seconds_bucket{stage="llm_generation",le="0.005"} 1' in text
+    assert 'rag_stage_duration_seconds_bucket{stage="llm_generation",le="+Inf"} 1' in text
+    assert 'rag_stage_duration_seconds_count{stage="llm_generation"} 1' in text
+
+
+def test_expected_exceptions_are_not_errors():
+    """Test that expected outcomes raised as exceptions don't count as errors."""
+    registry = MetricsRegistry()
+    with patch('backend.services.metrics.registry', registry):
+        with pytest.raises(KeyError):
+            with track_request("ingest", expected=(KeyError,)):
+                raise KeyError("duplicate")
+    counters, _ = registry.collect()
+    assert ("rag_errors_total", (("pipeline", "ingest"),)) not in counters
+
+
+def test_metrics_endpoint(client):
+    """Test that /api/metrics serves the metrics and honours METRICS_TOKEN."""
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert b"# TYPE rag_stage_duration_seconds histogram" in response.data
+
+    with patch.object(Config, 'METRICS_TOKEN', 'secret'):
+        assert client.get('/api/metrics').status_code == 401
+        response = client.get('/api/metrics', headers={"Authorization": "Bearer secret"})
+        assert response.status_code == 200
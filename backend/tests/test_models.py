@@ -0,0 +1,58 @@
+from sqlalchemy import text
+from backend.models import db, User, RssFeed, upgrade_schema
+
+
+def test_upgrade_schema_adds_missing_columns(app):
+    """Test that columns missing from tables created by earlier versions are added."""
+    with app.app_context():
+        db.session.add(User(username="before_upgrade", password_hash="-"))
+        db.session.commit()
+        db.session.execute(text("ALTER TABLE rss_feed DROP COLUMN etag"))
+        db.session.execute(text('ALTER TABLE "user" DROP COLUMN kb_version'))
+        db.session.execute(text('ALTER TABLE "user" DROP COLUMN chunks_recorded'))
+        db.session.commit()
+
+        upgrade_schema()
+        # Running it again is harmless
+        upgrade_schema()
+
+        assert RssFeed.query.filter(RssFeed.etag.is_(None)).count() == RssFeed.query.count()
+        user = User.query.filter_by(username="before_upgrade").one()
+        assert user.kb_version == 0
+        # Users of earlier versions get their chunks recorded
+        assert user.chunks_recorded is False
+        new_user = User(username="after_upgrade", password_hash="-")
+        db.session.add(new_user)
+        db.session.commit()
+        assert new_user.chunks_recorded is True
+
+
+def test_upgrade_schema_stops_document_id_reuse(app):
+    """Test that a document table created without AUTOINCREMENT is rebuilt with it."""
+    from backend.models import Document, DocumentChunk, User
+    with app.app_context():
+        db.session.execute(text("DROP TABLE document"))
+        db.session.execute(text(
+            "CREATE TABLE document (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "file_path VARCHAR(256) NOT NULL, document_type VARCHAR(50) NOT NULL, source VARCHAR(256), "
+            "tags VARCHAR(256), uploaded_at DATETIME)"
+        ))
+        db.session.commit()
+        user = User(username="upgrade_user", password_hash="-")
+        db.session.add(user)
+        db.session.commit()
+        db.session.execute(text(
+            "INSERT INTO document (id, user_id, file_path, document_type) VALUES (3, :user_id, 'a.txt', 'txt')"
+        ), {"user_id": user.id})
+        # Tombstone of a deleted document with a higher id
+        db.session.add(DocumentChunk(user_id=user.id, document_id=7, docstore_id="upgrade", deleted=True))
+        db.session.commit()
+
+        upgrade_schema()
+
+        assert db.session.get(Document, 3).file_path == "a.txt"
+        assert db.session.get(Document, 3).terms_indexed is False
+        doc = Document(user_id=user.id, file_path="b.txt", document_type="txt")
+        db.session.add(doc)
+        db.session.commit()
+        assert doc.id == 8
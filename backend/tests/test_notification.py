@@ -1,5 +1,11 @@
+import socketserver
+import threading
+import pytest
 from unittest.mock import patch
-from backend.services.notification import send_notification
+from backend.services import notification
+from backend.services.notification import (
+    send_notification, send_notifications, queue_notification, flush_notifications
+)
 from flask_mail import Message
 
 def test_send_notification(app):
@@ -20,3 +26,85 @@ def test_send_notification(app):
             assert sent_message.subject == subject
             assert sent_message.recipients == recipients
             assert sent_message.body == body
+
+class _DebugSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages from smtplib."""
+
+    def handle(self):
+        self.server.connections += 1
+        self.wfile.write(b"220 localhost\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().upper()
+            if command.startswith(b"DATA"):
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                data = []
+                for data_line in iter(self.rfile.readline, b".\r\n"):
+                    data.append(data_line)
+                self.server.messages.append(b"".join(data))
+                self.wfile.write(b"250 OK\r\n")
+            elif command.startswith(b"QUIT"):
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+@pytest.fixture
+def smtp_server(app, monkeypatch):
+    """A local SMTP stand-in that the app's mail extension sends to."""
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _DebugSMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    state = app.extensions["mail"]
+    monkeypatch.setattr(state, "server", "127.0.0.1")
+    monkeypatch.setattr(state, "port", server.server_address[1])
+    monkeypatch.setattr(state, "use_tls", False)
+    monkeypatch.setattr(state, "username", None)
+    monkeypatch.setattr(state, "default_sender", "noreply@example.com")
+    monkeypatch.setattr(state, "suppress", False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_send_notifications_reuses_one_connection(app, smtp_server):
+    """Test that a batch of emails is sent over a single SMTP connection."""
+    with app.app_context():
+        sent = send_notifications([
+            (f"Subject {i}", ["admin@example.com"], f"Body {i}") for i in range(5)
+        ])
+
+    assert sent == 5
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == 5
+
+def test_queue_notification_sends_in_background(app, smtp_server):
+    """Test that queued emails are sent by the background sender."""
+    for i in range(3):
+        queue_notification(app, f"Subject {i}", ["admin@example.com"], f"Body {i}")
+    flush_notifications()
+
+    assert len(smtp_server.messages) == 3
+    assert b"Subject: Subject 0" in smtp_server.messages[0]
+
+def test_queue_notification_survives_smtp_failure(app, smtp_server, monkeypatch):
+    """Test that an unreachable SMTP server doesn't reach the caller or stop the sender."""
+    state = app.extensions["mail"]
+    port = state.port
+    monkeypatch.setattr(state, "port", 1)
+
+    queue_notification(app, "Lost", ["admin@example.com"], "Body")
+    flush_notifications()
+    assert notification._sender.is_alive()
+
+    monkeypatch.setattr(state, "port", port)
+    queue_notification(app, "Delivered", ["admin@example.com"], "Body")
+    flush_notifications()
+
+    assert len(smtp_server.messages) == 1
+    assert b"Subject: Delivered" in smtp_server.messages[0]
@@ -0,0 +1,52 @@
+import os
+import time
+import threading
+from unittest.mock import patch
+from backend.config import Config
+from backend.services.profiling import StackSampler, write_folded
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_stack_sampler_counts_a_threads_stacks(tmp_path):
+    """Test that samples of a thread's stack are folded and counted."""
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,))
+    worker.start()
+    sampler = StackSampler(0.001, worker.ident).start()
+    time.sleep(0.05)
+    counts = sampler.stop()
+    stop.set()
+    worker.join()
+
+    assert counts
+    assert all("_busy_loop (test_profiling.py" in stack for stack in counts)
+    path = str(tmp_path / "profile.folded")
+    write_folded(counts, path)
+    with open(path, encoding="utf-8") as f:
+        stack, count = f.readline().rsplit(" ", 1)
+    assert int(count) == max(counts.values())
+
+
+def test_request_profile_for_admins_only(client, auth_token, tmp_path):
+    """Test that X-Profile profiles requests of profiling admins and saves the profile."""
+    headers = {"Authorization": f"Bearer {auth_token}", "X-Profile": "sample"}
+    with patch.object(Config, 'PROFILING_ENABLED', True), \
+            patch.object(Config, 'PROFILE_DIR', str(tmp_path)):
+        with patch.object(Config, 'PROFILING_ADMINS', 'someone_else'):
+            response = client.get('/api/documents', headers=headers)
+            assert "X-Profile-File" not in response.headers
+
+        with patch.object(Config, 'PROFILING_ADMINS', 'admin, testuser'):
+            response = client.get('/api/documents', headers=headers)
+            response.close()
+            assert response.status_code == 200
+            assert os.path.exists(tmp_path / response.headers["X-Profile-File"])
+
+            response = client.get('/api/documents', headers=dict(headers, **{"X-Profile": "cprofile"}))
+            response.close()
+            assert response.headers["X-Profile-File"].endswith(".prof")
+            assert os.path.exists(tmp_path / response.headers["X-Profile-File"])
@@ -18,3 +18,18 @@ def test_keyword_report_no_documents(client, auth_token):
     # Assuming the test user is created via auth_token fixture and has id=1
     report = generate_keyword_report(user_id=1)
     assert "error" in report
+
+@patch('backend.routes.main.generate_keyword_report')
+def test_keyword_report_endpoint_filters(mock_generate_report, client, auth_token):
+    """Test that the keyword report filters are passed to the service."""
+    from datetime import datetime
+    mock_generate_report.return_value = {"top_keywords": []}
+
+    headers = {'Authorization': f'Bearer {auth_token}'}
+    response = client.get('/api/report/keywords?start_date=2024-01-01&type=pdf&source=https://a', headers=headers)
+
+    assert response.status_code == 200
+    assert mock_generate_report.call_args.kwargs == {
+        "start_date": datetime(2024, 1, 1), "end_date": None, "source": "https://a", "document_type": "pdf"
+    }
+    assert client.get('/api/report/keywords?end_date=yesterday', headers=headers).status_code == 400
@@ -0,0 +1,102 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+from backend.services.scheduler import LeaderLock, start_scheduler
+from backend.worker import main as worker_main
+
+
+def _fake_app(tmp_path):
+    return SimpleNamespace(
+        instance_path=str(tmp_path),
+        extensions={},
+        config={
+            'SCHEDULER_LOCK_FILE': '',
+            'SCHEDULER_LEADER_RETRY_SECONDS': 0.01,
+            'KB_COMPACTION_INTERVAL_MINUTES': 30,
+        },
+    )
+
+
+def test_leader_lock_is_exclusive(tmp_path):
+    """Test that only one holder gets the lock until it is released."""
+    path = str(tmp_path / "locks" / "scheduler.lock")
+    first, second = LeaderLock(path), LeaderLock(path)
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert not second.held
+
+    first.release()
+    assert second.acquire()
+    assert second.held
+    second.release()
+
+
+@patch('backend.services.scheduler.BackgroundScheduler')
+def test_start_scheduler_in_leader_only(mock_scheduler, tmp_path):
+    """Test that one process starts the scheduler and another takes over when it exits."""
+    app = _fake_app(tmp_path)
+
+    leader = start_scheduler(app)
+    assert leader.held
+    assert mock_scheduler.return_value.start.call_count == 1
+    job_ids = {call.kwargs['id'] for call in mock_scheduler.return_value.add_job.call_args_list}
+    assert job_ids == {'aggregation', 'compaction'}
+
+    follower = start_scheduler(app)
+    time.sleep(0.05)
+    assert not follower.held
+    assert mock_scheduler.return_value.start.call_count == 1
+
+    leader.release()
+    deadline = time.monotonic() + 2
+    while not follower.held and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert follower.held
+    assert mock_scheduler.return_value.start.call_count == 2
+    follower.release()
+
+
+@patch('backend.services.scheduler.BackgroundScheduler')
+def test_create_app_keeps_the_leader_lock(mock_scheduler, tmp_path):
+    """Test that the leader keeps its lock after create_app() returns and garbage is collected."""
+    import gc
+    import fcntl
+    from backend.app import create_app
+    from backend.config import Config
+    config = Config()
+    config.TESTING = True
+    config.INGESTION_WORKERS = 0
+    config.SCHEDULER_ENABLED = True
+    config.SCHEDULER_LOCK_FILE = str(tmp_path / "scheduler.lock")
+
+    app = create_app(config)
+    gc.collect()
+
+    assert mock_scheduler.return_value.start.call_count == 1
+    with open(config.SCHEDULER_LOCK_FILE, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            acquired = True
+        except BlockingIOError:
+            acquired = False
+    app.extensions['scheduler_leader_lock'].release()
+    assert not acquired
+
+
+@patch('backend.services.notification.flush_notifications')
+@patch('backend.services.knowledge_base.compact_all_indexes')
+@patch('backend.services.aggregation.run_aggregation_for_all_users')
+def test_worker_once_runs_every_job(mock_aggregation, mock_compaction, mock_flush, tmp_path, monkeypatch):
+    """Test that `backend.worker --once` runs the jobs a single time in its own app and sends their emails."""
+    from backend.config import Config
+    monkeypatch.setattr(Config, 'SCHEDULER_LOCK_FILE', str(tmp_path / "scheduler.lock"))
+    monkeypatch.setattr(Config, 'TESTING', True, raising=False)
+
+    assert worker_main(["--once"]) == 0
+
+    app = mock_aggregation.call_args.args[0]
+    assert app.config['SCHEDULER_ENABLED'] is False
+    mock_compaction.assert_called_once_with(app)
+    mock_flush.assert_called_once_with()
@@ -26,3 +26,23 @@ def test_search_fallback_to_bing(mock_exists, mock_bing_search, client, auth_tok
     assert result['answer'] == "Answer from Bing."
     mock_exists.assert_called()
     mock_bing_search.assert_called_once()
+
+@patch('backend.routes.main.stream_search')
+def test_search_stream_endpoint(mock_stream_search, client, auth_token):
+    """Test that the streaming search endpoint sends server-sent events."""
+    def events(user_id, query):
+        yield "sources", {"source": "Local Knowledge Base", "source_documents": []}
+        yield "token", {"text": "Hello"}
+        raise RuntimeError("LLM went away")
+    mock_stream_search.side_effect = events
+
+    headers = {'Authorization': f'Bearer {auth_token}'}
+    response = client.post('/api/search/stream', json={'query': 'test query'}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.get_data(as_text=True) == (
+        'event: sources\ndata: {"source": "Local Knowledge Base", "source_documents": []}\n\n'
+        'event: token\ndata: {"text": "Hello"}\n\n'
+        'event: error\ndata: {"error": "The search failed"}\n\n'
+    )
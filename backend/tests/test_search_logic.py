@@ -12,9 +12,9 @@ def test_perform_search_no_index_fallback_to_bing(mock_exists, mock_bing):
     mock_bing.assert_called_once_with("test query")
 
 @patch('langchain.chains.RetrievalQA.from_chain_type')
-@patch('backend.services.search.FAISS.load_local')
+@patch('backend.services.search.load_user_vector_store')
 @patch('os.path.exists', return_value=True)
-def test_perform_search_with_local_kb(mock_exists, mock_load_local, mock_from_chain_type):
+def test_perform_search_with_local_kb(mock_exists, mock_load_local, mock_from_chain_type, app):
     """Test that perform_search uses the local RAG pipeline."""
     from langchain_core.runnables import Runnable
     # Mock the vector store and retriever
@@ -31,7 +31,8 @@ def test_perform_search_with_local_kb(mock_exists, mock_load_local, mock_from_ch
     }
     mock_from_chain_type.return_value = mock_qa_chain
 
-    result = perform_search(user_id=1, query="test query")
+    with app.app_context():
+        result = perform_search(user_id=1, query="test query")
 
     assert result['answer'] == "Local KB answer"
     assert result['source'] == "Local Knowledge Base"
@@ -45,7 +46,7 @@ def test_bing_search_not_configured():
         result = _bing_search("test query")
         assert result == "Web search is not configured."
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_bing_search_request_exception(mock_get):
     """Test _bing_search when the web request fails."""
     import requests
@@ -54,7 +55,7 @@ def test_bing_search_request_exception(mock_get):
     assert "Error during web search" in result
 
 @patch('backend.services.search.LlamaServerLLM')
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_bing_search_success(mock_get, mock_llm):
     """Test _bing_search successful path."""
     mock_get.return_value.raise_for_status.return_value = None
@@ -68,3 +69,114 @@ def test_bing_search_success(mock_get, mock_llm):
     result = _bing_search("test query")
     assert result == "Summarized result"
     mock_llm.return_value._call.assert_called_once()
+
+@patch('backend.services.search.LlamaServerLLM')
+@patch('backend.services.search._get_retriever')
+@patch('backend.services.search._has_index', return_value=True)
+def test_stream_search_sends_sources_before_tokens(mock_has_index, mock_get_retriever, mock_llm, app):
+    """Test that stream_search yields the sources, then the answer tokens."""
+    from langchain_core.documents import Document
+    from backend.services.search import stream_search
+
+    mock_get_retriever.return_value.invoke.return_value = [
+        Document(page_content="doc1", metadata={"document_id": 1})
+    ]
+    mock_llm.return_value.stream.return_value = iter(["Local", " answer"])
+
+    events = list(stream_search(user_id=1, query="test query"))
+
+    assert events == [
+        ("sources", {"source": "Local Knowledge Base",
+                     "source_documents": [{"page_content": "doc1", "metadata": {"document_id": 1}}]}),
+        ("token", {"text": "Local"}),
+        ("token", {"text": " answer"}),
+        ("done", {}),
+    ]
+    prompt = mock_llm.return_value.stream.call_args.args[0]
+    assert "doc1" in prompt and "test query" in prompt
+
+@patch('backend.services.search.answer_cache')
+@patch('backend.services.search.LlamaServerLLM')
+@patch('backend.services.search._get_retriever')
+@patch('backend.services.search._has_index', return_value=True)
+def test_stream_search_reports_a_degraded_answer(mock_has_index, mock_get_retriever, mock_llm, mock_cache, app):
+    """Test that an answer cut short at the deadline is flagged and not cached."""
+    from langchain_core.documents import Document
+    from backend.services.http_client import mark_degraded
+    from backend.services.search import stream_search
+
+    def tokens(prompt):
+        yield "Partial"
+        mark_degraded()
+    mock_cache.get.return_value = None
+    mock_get_retriever.return_value.invoke.return_value = [Document(page_content="doc1")]
+    mock_llm.return_value.stream.side_effect = tokens
+
+    events = list(stream_search(user_id=1, query="test query"))
+
+    assert events[1:] == [("token", {"text": "Partial"}), ("degraded", {}), ("done", {})]
+    mock_cache.put.assert_not_called()
+
+@patch('backend.services.search._bing_search', return_value="Bing result")
+@patch('os.path.exists', return_value=False)
+def test_stream_search_falls_back_to_bing(mock_exists, mock_bing):
+    """Test that stream_search falls back to web search without a local index."""
+    from backend.services.search import stream_search
+
+    events = list(stream_search(user_id=1, query="test query"))
+
+    assert events[0] == ("sources", {"source": "Web Search", "source_documents": []})
+    assert events[1:] == [("token", {"text": "Bing result"}), ("done", {})]
+
+@patch('langchain.chains.RetrievalQA.from_chain_type')
+@patch('backend.services.search._get_retriever')
+@patch('backend.services.search._has_index', return_value=True)
+def test_perform_search_caches_answers_per_kb_version(mock_has_index, mock_get_retriever, mock_from_chain_type, app):
+    """Test that a repeated query is answered from the cache until the KB changes."""
+    from backend.models import db, User
+    from backend.services.knowledge_base import bump_kb_version
+
+    user = User(username="answer_cache_user", password_hash="test")
+    db.session.add(user)
+    db.session.commit()
+
+    mock_qa_chain = MagicMock()
+    mock_qa_chain.return_value = {
+        "result": "Local KB answer",
+        "source_documents": [MagicMock(page_content="doc1", metadata={})]
+    }
+    mock_from_chain_type.return_value = mock_qa_chain
+
+    first = perform_search(user.id, "What happened with X today?")
+    second = perform_search(user.id, "  what happened with x today ")
+    assert second == first
+    assert mock_qa_chain.call_count == 1
+    # Cache hits don't load the index
+    assert mock_get_retriever.call_count == 1
+
+    bump_kb_version(user.id)
+    db.session.commit()
+    perform_search(user.id, "What happened with X today?")
+    assert mock_qa_chain.call_count == 2
+
+@patch('langchain.chains.RetrievalQA.from_chain_type')
+@patch('backend.services.search.LlamaServerEmbeddings')
+@patch('backend.services.search._get_retriever')
+@patch('backend.services.search._has_index', return_value=True)
+def test_perform_search_reuses_the_lookup_embedding(mock_has_index, mock_get_retriever, mock_embeddings,
+                                                   mock_from_chain_type, app):
+    """Test that in semantic mode the query embedded for the cache lookup is reused for retrieval."""
+    from backend.models import db, User
+    from backend.config import Config
+
+    user = User(username="semantic_cache_user", password_hash="test")
+    db.session.add(user)
+    db.session.commit()
+    mock_embeddings.return_value.embed_query.return_value = [1.0, 0.0]
+    mock_from_chain_type.return_value.return_value = {"result": "answer", "source_documents": []}
+
+    with patch.object(Config, 'ANSWER_CACHE_SEMANTIC', True):
+        perform_search(user.id, "query")
+
+    mock_embeddings.return_value.embed_query.assert_called_once_with("query")
+    mock_get_retriever.assert_called_once_with(user.id, {"query": [1.0, 0.0]})
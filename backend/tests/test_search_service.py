@@ -1,7 +1,8 @@
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from backend.services.embedding import LlamaServerEmbeddings
+from backend.config import Config
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_llama_server_embed_documents(mock_post):
     """Test the embed_documents method of the LlamaServerEmbeddings."""
     mock_post.return_value.raise_for_status.return_value = None
@@ -19,7 +20,7 @@ def test_llama_server_embed_documents(mock_post):
     assert result == [[0.1, 0.2], [0.3, 0.4]]
     mock_post.assert_called_once()
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_llama_server_embed_query(mock_post):
     """Test the embed_query method of the LlamaServerEmbeddings."""
     mock_post.return_value.raise_for_status.return_value = None
@@ -33,3 +34,54 @@ def test_llama_server_embed_query(mock_post):
 
     assert result == [0.5, 0.6]
     mock_post.assert_called_once()
+
+@patch('requests.Session.post')
+def test_llama_server_embed_documents_uses_cache(mock_post):
+    """Test that only texts missing from the embedding cache are sent to the server."""
+    mock_post.return_value.raise_for_status.return_value = None
+    mock_post.return_value.json.return_value = {
+        'data': [{'embedding': [0.5, 0.25]}]
+    }
+
+    embeddings = LlamaServerEmbeddings()
+    embeddings.embed_documents(["text1"])
+
+    mock_post.return_value.json.return_value = {
+        'data': [{'embedding': [0.75, 1.5]}]
+    }
+    result = embeddings.embed_documents(["text1", "text2", "text1"])
+
+    assert result == [[0.5, 0.25], [0.75, 1.5], [0.5, 0.25]]
+    assert mock_post.call_count == 2
+    assert mock_post.call_args.kwargs['json']['input'] == ["text2"]
+
+@patch('requests.Session.post')
+def test_llama_server_embed_documents_batches(mock_post):
+    """Test that large inputs are split into batches and reassembled in order."""
+    def fake_post(url, json, timeout):
+        response = MagicMock()
+        response.raise_for_status.return_value = None
+        response.json.return_value = {
+            'data': [{'index': i, 'embedding': [float(len(text))]} for i, text in enumerate(json['input'])]
+        }
+        return response
+    mock_post.side_effect = fake_post
+
+    texts = ["a" * n for n in range(1, 8)]
+    with patch.object(Config, 'EMBEDDING_BATCH_SIZE', 3):
+        result = LlamaServerEmbeddings().embed_documents(texts)
+
+    assert result == [[float(n)] for n in range(1, 8)]
+    assert mock_post.call_count == 3
+    assert all(len(call.kwargs['json']['input']) <= 3 for call in mock_post.call_args_list)
+
+@patch('requests.Session.post')
+def test_llama_server_embed_documents_raise_errors(mock_post):
+    """Test that failed batches come back empty unless raise_errors is set."""
+    import pytest
+    import requests
+    mock_post.side_effect = requests.exceptions.ConnectionError("down")
+
+    assert LlamaServerEmbeddings().embed_documents(["text1"]) == [[]]
+    with pytest.raises(requests.exceptions.ConnectionError):
+        LlamaServerEmbeddings(raise_errors=True).embed_documents(["text1"])
@@ -0,0 +1,96 @@
+import datetime
+from unittest.mock import patch
+from backend.models import db, User, Document, UserTerm
+from backend.services.document_text import iter_document_texts
+from backend.services.term_stats import (
+    count_terms, index_document_terms, remove_document_terms, index_missing_documents, top_terms
+)
+
+
+def _add_document(user, text, **kwargs):
+    doc = Document(user_id=user.id, file_path="unused.txt", document_type=kwargs.pop("document_type", "txt"), **kwargs)
+    db.session.add(doc)
+    db.session.flush()
+    index_document_terms(user.id, doc.id, text)
+    db.session.commit()
+    return doc
+
+
+def test_count_terms_matches_count_vectorizer():
+    """Test that terms are lowercased words of 2+ characters without stop words."""
+    assert count_terms("The Fed and the ECB: rates, rates, a rate.") == {"fed": 1, "ecb": 1, "rates": 2, "rate": 1}
+
+
+def test_top_terms_follow_ingest_and_delete(app):
+    """Test that the per-user counts are updated incrementally."""
+    with app.app_context():
+        user = User(username="term_stats_user", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        doc_a = _add_document(user, "nvidia chips chips chips")
+        _add_document(user, "nvidia earnings nvidia")
+
+        assert top_terms(user.id, 2) == [("nvidia", 3), ("chips", 3)]
+
+        remove_document_terms(user.id, doc_a.id)
+        db.session.commit()
+        assert top_terms(user.id, 5) == [("nvidia", 2), ("earnings", 1)]
+        assert UserTerm.query.filter_by(user_id=user.id, term="chips").first() is None
+
+
+def test_top_terms_filters(app):
+    """Test that date, source and type filters restrict the counted documents."""
+    with app.app_context():
+        user = User(username="term_filter_user", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        _add_document(user, "tariffs tariffs", source="https://news.example.com/a",
+                      uploaded_at=datetime.datetime(2024, 1, 1))
+        _add_document(user, "budget", source="https://other.example.org/b", document_type="pdf",
+                      uploaded_at=datetime.datetime(2024, 6, 1))
+
+        assert top_terms(user.id, 5, source="https://news.example.com") == [("tariffs", 2)]
+        assert top_terms(user.id, 5, document_type="pdf") == [("budget", 1)]
+        assert top_terms(user.id, 5, start_date=datetime.datetime(2024, 3, 1)) == [("budget", 1)]
+        assert top_terms(user.id, 5, end_date=datetime.datetime(2024, 3, 1)) == [("tariffs", 2)]
+        assert top_terms(user.id, 5, source="https://news.example.com/%") == []
+
+
+def test_index_missing_documents(app, tmp_path):
+    """Test that documents without term counts are counted from their text."""
+    with app.app_context():
+        user = User(username="term_backfill_user", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        path = tmp_path / "legacy.txt"
+        path.write_text("legacy legacy archive")
+        db.session.add(Document(user_id=user.id, file_path=str(path), document_type="txt"))
+        db.session.commit()
+
+        index_missing_documents(user.id)
+        index_missing_documents(user.id)
+
+        assert top_terms(user.id, 5) == [("legacy", 2), ("archive", 1)]
+
+
+def test_index_missing_documents_reads_each_document_once(app, tmp_path):
+    """Test that documents without terms or readable text are not read on every report."""
+    with app.app_context():
+        user = User(username="term_once_user", password_hash="test")
+        db.session.add(user)
+        db.session.commit()
+        empty = tmp_path / "empty.txt"
+        empty.write_text("the and of")
+        binary = tmp_path / "legacy.pdf"
+        binary.write_bytes(b"%PDF-1.4 \xff\xfe\x00")
+        db.session.add(Document(user_id=user.id, file_path=str(empty), document_type="txt"))
+        db.session.add(Document(user_id=user.id, file_path=str(binary), document_type="pdf"))
+        db.session.commit()
+
+        with patch('backend.services.term_stats.iter_document_texts', wraps=iter_document_texts) as mock_iter:
+            index_missing_documents(user.id)
+            index_missing_documents(user.id)
+
+        assert mock_iter.call_count == 1
+        assert Document.query.filter_by(user_id=user.id, terms_indexed=False).count() == 0
+        assert top_terms(user.id, 5) == []
@@ -0,0 +1,362 @@
+import os
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+from backend.services.vector_store import (
+    append_segment,
+    compact_segments,
+    load_user_vector_store,
+    merge_segments,
+    read_manifest,
+)
+
+
+def _docs(*texts):
+    return [Document(page_content=text, metadata={"text": text}) for text in texts]
+
+
+def test_append_segment_creates_segments(tmp_path, fake_embeddings):
+    """Test that each append writes a new segment listed in the manifest."""
+    index_path = str(tmp_path / "user_1")
+    append_segment(index_path, _docs("alpha"), ["a"], fake_embeddings)
+    append_segment(index_path, _docs("beta", "gamma"), ["b", "c"], fake_embeddings)
+
+    manifest = read_manifest(index_path)
+    assert manifest["segments"] == ["seg_000000", "seg_000001"]
+    assert not [name for name in os.listdir(index_path) if name.startswith(".tmp_")]
+
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert len(vector_store.segments) == 2
+    results = vector_store.similarity_search("gamma", k=3)
+    assert results[0].page_content == "gamma"
+    assert {doc.page_content for doc in results} == {"alpha", "beta", "gamma"}
+
+
+def test_load_user_vector_store_empty(tmp_path, fake_embeddings):
+    """Test that an index directory without segments loads as None."""
+    assert load_user_vector_store(str(tmp_path / "user_1"), fake_embeddings) is None
+
+
+def test_compact_segments_merges_small_segments(tmp_path, fake_embeddings):
+    """Test that small segments are merged and deleted ids are dropped."""
+    index_path = str(tmp_path / "user_1")
+    for i, text in enumerate(["one", "two", "three"]):
+        append_segment(index_path, _docs(text), [str(i)], fake_embeddings)
+
+    removed = compact_segments(index_path, fake_embeddings, {"1"}, merge_threshold=10, merge_min_segments=3)
+
+    assert removed == 1
+    manifest = read_manifest(index_path)
+    assert manifest["segments"] == ["seg_000003"]
+    assert sorted(name for name in os.listdir(index_path) if name.startswith("seg_")) == ["seg_000003"]
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert sorted(vector_store.segments[0].index_to_docstore_id.values()) == ["0", "2"]
+
+
+def test_merge_segments_merges_small_segments(tmp_path, fake_embeddings):
+    """Test that small segments are merged once there are enough, unless a compaction runs."""
+    import fcntl
+    from backend.services import vector_store as vs
+    index_path = str(tmp_path / "user_1")
+    for i, text in enumerate(["one", "two"]):
+        append_segment(index_path, _docs(text), [str(i)], fake_embeddings)
+
+    merge_segments(index_path, fake_embeddings, merge_threshold=10, merge_min_segments=3)
+    assert read_manifest(index_path)["segments"] == ["seg_000000", "seg_000001"]
+
+    append_segment(index_path, _docs("three"), ["2"], fake_embeddings)
+    with open(os.path.join(index_path, vs.COMPACT_LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        merge_segments(index_path, fake_embeddings, merge_threshold=10, merge_min_segments=3)
+    assert len(read_manifest(index_path)["segments"]) == 3
+
+    merge_segments(index_path, fake_embeddings, merge_threshold=10, merge_min_segments=3)
+    assert read_manifest(index_path)["segments"] == ["seg_000003"]
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert sorted(vector_store.segments[0].index_to_docstore_id.values()) == ["0", "1", "2"]
+
+
+def test_compact_segments_only_rewrites_dirty_segments(tmp_path, fake_embeddings):
+    """Test that below the merge threshold only segments with deletes are rewritten."""
+    index_path = str(tmp_path / "user_1")
+    append_segment(index_path, _docs("one"), ["0"], fake_embeddings)
+    append_segment(index_path, _docs("two", "three"), ["1", "2"], fake_embeddings)
+
+    compact_segments(index_path, fake_embeddings, {"2"}, merge_threshold=10, merge_min_segments=8)
+
+    assert read_manifest(index_path)["segments"] == ["seg_000000", "seg_000002"]
+
+
+def test_compact_segments_removes_interrupted_writes(tmp_path, fake_embeddings):
+    """Test that segments never published in the manifest are cleaned up."""
+    index_path = str(tmp_path / "user_1")
+    append_segment(index_path, _docs("one"), ["0"], fake_embeddings)
+    os.makedirs(os.path.join(index_path, ".tmp_crashed"))
+    os.makedirs(os.path.join(index_path, "seg_000009"))
+
+    compact_segments(index_path, fake_embeddings, set(), merge_threshold=10, merge_min_segments=8)
+
+    assert sorted(name for name in os.listdir(index_path) if not name.startswith(".lock")) == [
+        "manifest.json", "seg_000000"
+    ]
+
+
+def test_legacy_index_is_migrated(tmp_path, fake_embeddings):
+    """Test that an index saved with save_local is adopted as the first segment."""
+    index_path = str(tmp_path / "user_1")
+    FAISS.from_documents(_docs("legacy"), fake_embeddings, ids=["x"]).save_local(index_path)
+
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+
+    assert read_manifest(index_path)["segments"] == ["seg_000000"]
+    assert vector_store.similarity_search("legacy", k=1)[0].page_content == "legacy"
+    append_segment(index_path, _docs("new"), ["y"], fake_embeddings)
+    assert read_manifest(index_path)["segments"] == ["seg_000000", "seg_000001"]
+
+    # Compaction converts the pickled segment to a chunk store
+    compact_segments(index_path, fake_embeddings, set(), merge_threshold=10, merge_min_segments=2)
+    assert read_manifest(index_path)["segments"] == ["seg_000002"]
+    assert "index.pkl" not in os.listdir(os.path.join(index_path, "seg_000002"))
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert [doc.id for doc in vector_store.similarity_search("legacy", k=2)] == ["x", "y"]
+
+
+def test_compact_segments_migrates_index_type(tmp_path, fake_embeddings, monkeypatch):
+    """Test that crossing a size threshold rebuilds all segments as the new index type."""
+    from backend.config import Config
+    index_path = str(tmp_path / "user_1")
+    texts = [f"chunk {i} " + "x" * i for i in range(60)]
+    for i in range(0, 60, 20):
+        append_segment(index_path, _docs(*texts[i:i + 20]), [str(j) for j in range(i, i + 20)], fake_embeddings)
+    monkeypatch.setattr(Config, 'INDEX_HNSW_THRESHOLD', 50)
+    monkeypatch.setattr(Config, 'INDEX_IVFPQ_THRESHOLD', 1000)
+
+    compact_segments(index_path, fake_embeddings, set(), merge_threshold=10, merge_min_segments=8)
+
+    manifest = read_manifest(index_path)
+    assert manifest["index_type"] == "hnsw"
+    assert manifest["segments"] == ["seg_000003"]
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert type(vector_store.segments[0].index).__name__ == "IndexHNSWFlat"
+    assert vector_store.similarity_search(texts[30], k=1)[0].page_content == texts[30]
+
+    # Dropping back below the threshold migrates to a flat index again
+    compact_segments(index_path, fake_embeddings, {str(i) for i in range(20)},
+                     merge_threshold=10, merge_min_segments=8)
+    manifest = read_manifest(index_path)
+    assert manifest["index_type"] == "flat"
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert vector_store.segments[0].index.ntotal == 40
+    assert type(vector_store.segments[0].index).__name__ == "IndexFlatL2"
+
+
+def _hnsw_index(index_path, fake_embeddings, monkeypatch, texts):
+    """Builds a single-segment HNSW index of texts, with ids 0..n-1."""
+    from backend.config import Config
+    monkeypatch.setattr(Config, 'INDEX_HNSW_THRESHOLD', 50)
+    monkeypatch.setattr(Config, 'INDEX_IVFPQ_THRESHOLD', 1000)
+    append_segment(index_path, _docs(*texts), [str(i) for i in range(len(texts))], fake_embeddings)
+    compact_segments(index_path, fake_embeddings, set(), merge_threshold=10, merge_min_segments=8)
+    assert read_manifest(index_path)["index_type"] == "hnsw"
+
+
+def test_compact_segments_merges_with_index_type(tmp_path, fake_embeddings, monkeypatch):
+    """Test that merged segments get the knowledge base's index type, not their own size's."""
+    index_path = str(tmp_path / "user_1")
+    _hnsw_index(index_path, fake_embeddings, monkeypatch, [f"chunk {i}" for i in range(60)])
+    for i in range(60, 63):
+        append_segment(index_path, _docs(f"chunk {i}"), [str(i)], fake_embeddings)
+
+    compact_segments(index_path, fake_embeddings, set(), merge_threshold=10, merge_min_segments=3)
+
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert [type(segment.index).__name__ for segment in vector_store.segments] == ["IndexHNSWFlat"] * 2
+    assert vector_store.segments[1].index.ntotal == 3
+
+
+def test_compact_segments_defers_hnsw_deletions(tmp_path, fake_embeddings, monkeypatch):
+    """Test that an HNSW segment is rebuilt only once enough of it is deleted, or it holds orphans."""
+    index_path = str(tmp_path / "user_1")
+    _hnsw_index(index_path, fake_embeddings, monkeypatch, [f"chunk {i}" for i in range(60)])
+    segments = read_manifest(index_path)["segments"]
+    all_ids = {str(i) for i in range(60)}
+
+    assert compact_segments(index_path, fake_embeddings, {"1", "2"}, merge_threshold=10, merge_min_segments=8,
+                            hnsw_rebuild_ratio=0.1) == 0
+    assert read_manifest(index_path)["segments"] == segments
+
+    # "3" has no chunk row, so no tombstone for searches to exclude
+    assert compact_segments(index_path, fake_embeddings, {"1", "2"}, merge_threshold=10, merge_min_segments=8,
+                            known_ids=lambda: all_ids - {"3"}, hnsw_rebuild_ratio=0.1) == 3
+    segments = read_manifest(index_path)["segments"]
+
+    deleted = {str(i) for i in range(10, 15)}
+    assert compact_segments(index_path, fake_embeddings, deleted, merge_threshold=10, merge_min_segments=8,
+                            hnsw_rebuild_ratio=0.1) == 0
+    assert read_manifest(index_path)["segments"] == segments
+    deleted.add("15")
+    assert compact_segments(index_path, fake_embeddings, deleted, merge_threshold=10, merge_min_segments=8,
+                            hnsw_rebuild_ratio=0.1) == 6
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert type(vector_store.segments[0].index).__name__ == "IndexHNSWFlat"
+    assert vector_store.segments[0].index.ntotal == 51
+
+
+def test_compact_segments_folds_large_flat_segments(tmp_path, fake_embeddings, monkeypatch):
+    """Test that large flat segments are added to the main segment without rebuilding it."""
+    from unittest.mock import patch
+    index_path = str(tmp_path / "user_1")
+    texts = [f"chunk {i} " + "x" * i for i in range(75)]
+    _hnsw_index(index_path, fake_embeddings, monkeypatch, texts[:60])
+    append_segment(index_path, _docs(*texts[60:]), [str(i) for i in range(60, 75)], fake_embeddings)
+
+    with patch('backend.services.vector_store.build_index') as mock_build:
+        compact_segments(index_path, fake_embeddings, set(), merge_threshold=10, merge_min_segments=8)
+    mock_build.assert_not_called()
+
+    manifest = read_manifest(index_path)
+    assert len(manifest["segments"]) == 1
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert type(vector_store.segments[0].index).__name__ == "IndexHNSWFlat"
+    assert vector_store.segments[0].index.ntotal == 75
+    assert vector_store.similarity_search(texts[70], k=1)[0].page_content == texts[70]
+
+
+def test_compact_segments_removes_ids_from_ivf_segments(tmp_path, fake_embeddings, monkeypatch):
+    """Test that deleted vectors are removed from an IVF-PQ segment without rebuilding or re-embedding it."""
+    from unittest.mock import patch
+    from backend.config import Config
+    index_path = str(tmp_path / "user_1")
+    texts = [f"chunk {i} " + "x" * i for i in range(700)]
+    monkeypatch.setattr(Config, 'INDEX_HNSW_THRESHOLD', 50)
+    monkeypatch.setattr(Config, 'INDEX_IVFPQ_THRESHOLD', 600)
+    append_segment(index_path, _docs(*texts), [str(i) for i in range(700)], fake_embeddings)
+    compact_segments(index_path, fake_embeddings, set(), merge_threshold=10, merge_min_segments=8)
+    assert read_manifest(index_path)["index_type"] == "ivfpq"
+    before = load_user_vector_store(index_path, fake_embeddings).segments[0]
+    before.index.nprobe = before.index.nlist
+    query = np.array([fake_embeddings.embed_query(texts[250])], dtype=np.float32)
+    _, positions = before.index.search(query, 20)
+    deleted = {"3", "250", "699"}
+    expected = [before.index_to_docstore_id[i] for i in positions[0]
+                if before.index_to_docstore_id[i] not in deleted]
+
+    with patch('backend.services.vector_store.build_index') as mock_build, \
+         patch.object(fake_embeddings, 'embed_documents') as mock_embed:
+        assert compact_segments(index_path, fake_embeddings, deleted,
+                                merge_threshold=10, merge_min_segments=8) == 3
+    mock_build.assert_not_called()
+    mock_embed.assert_not_called()
+
+    segments = load_user_vector_store(index_path, fake_embeddings).segments
+    assert len(segments) == 1
+    after = segments[0]
+    assert type(after.index).__name__ == "IndexIVFPQ"
+    assert after.index.ntotal == 697
+    assert sorted(after.index_to_docstore_id.values(), key=int) == [
+        str(i) for i in range(700) if str(i) not in deleted
+    ]
+    # The remaining vectors are found under their own chunks
+    after.index.nprobe = after.index.nlist
+    _, positions = after.index.search(query, len(expected))
+    assert [after.index_to_docstore_id[i] for i in positions[0]] == expected
+
+
+def test_compact_segments_publishes_during_rebuild(tmp_path, fake_embeddings):
+    """Test that the index lock is free while a segment is rebuilt, and new segments are kept."""
+    import fcntl
+    from unittest.mock import patch
+    from backend.services import vector_store as vs
+    index_path = str(tmp_path / "user_1")
+    append_segment(index_path, _docs("one", "two"), ["0", "1"], fake_embeddings)
+
+    def segment_entries(*args, **kwargs):
+        with open(os.path.join(index_path, vs.LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        append_segment(index_path, _docs("three"), ["2"], fake_embeddings)
+        return original(*args, **kwargs)
+
+    original = vs._segment_entries
+    with patch.object(vs, '_segment_entries', side_effect=segment_entries):
+        compact_segments(index_path, fake_embeddings, {"1"}, merge_threshold=10, merge_min_segments=8)
+
+    assert read_manifest(index_path)["segments"] == ["seg_000001", "seg_000002"]
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    assert sorted(i for segment in vector_store.segments for i in segment.index_to_docstore_id.values()) == [
+        "0", "2"
+    ]
+
+
+def test_similarity_search_loads_only_final_chunks(tmp_path, fake_embeddings):
+    """Test that chunk texts are loaded for the top k hits only, skipping excluded ids."""
+    from unittest.mock import patch
+    from backend.services.vector_store import SegmentedVectorStore
+    index_path = str(tmp_path / "user_1")
+    append_segment(index_path, _docs("one", "two"), ["0", "1"], fake_embeddings)
+    append_segment(index_path, _docs("three", "four"), ["2", "3"], fake_embeddings)
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+
+    with patch.object(SegmentedVectorStore, 'get_chunk', wraps=SegmentedVectorStore.get_chunk) as get_chunk:
+        results = vector_store.similarity_search("two", k=2, exclude_ids={"1"})
+
+    assert get_chunk.call_count == 2
+    assert [doc.id for doc in results] == ["3", "2"]
+
+
+def test_filtered_similarity_search_skips_excluded_ids(tmp_path, fake_embeddings):
+    """Test that a metadata-filtered search also skips excluded ids."""
+    index_path = str(tmp_path / "user_1")
+    docs = [Document(page_content=text, metadata={"source": "a"}) for text in ("one", "two", "three")]
+    append_segment(index_path, docs, ["0", "1", "2"], fake_embeddings)
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+
+    results = vector_store.similarity_search("two", k=2, filter={"source": "a"}, exclude_ids={"1"})
+
+    assert len(results) == 2
+    assert "1" not in [doc.id for doc in results]
+
+
+def test_search_ids_fetches_more_only_from_segments_with_excluded_hits(tmp_path, fake_embeddings):
+    """Test that excluded ids widen the search of their own segment only, in rounds."""
+    from unittest.mock import MagicMock
+    index_path = str(tmp_path / "user_1")
+    append_segment(index_path, _docs(*("x" * i for i in range(1, 21))), [str(i) for i in range(1, 21)],
+                   fake_embeddings)
+    append_segment(index_path, _docs("y" * 30, "y" * 40), ["30", "40"], fake_embeddings)
+    vector_store = load_user_vector_store(index_path, fake_embeddings)
+    searches = []
+    for segment in vector_store.segments:
+        index = segment.index
+        segment.index = MagicMock(ntotal=index.ntotal)
+        segment.index.search.side_effect = lambda query, n, index=index: searches.append(
+            (index.ntotal, n)) or index.search(query, n)
+
+    # The five chunks closest to the query are excluded
+    hits = vector_store.search_ids(fake_embeddings.embed_query("x" * 5), k=2,
+                                   exclude_ids={"5", "1", "9", "13", "18", "999"})
+
+    assert {segment.index_to_docstore_id[position] for _, segment, position in hits} == {"14", "10"}
+    assert searches == [(20, 2), (20, 4), (20, 8), (2, 2)]
+
+
+def test_segments_without_embeddings_are_rejected(tmp_path, fake_embeddings):
+    """Test that empty vectors or a new dimension never reach the manifest."""
+    import pytest
+    from unittest.mock import MagicMock
+    from backend.services.vector_store import build_segment, publish_segment
+    index_path = str(tmp_path / "user_1")
+    append_segment(index_path, _docs("one"), ["0"], fake_embeddings)
+
+    down = MagicMock()
+    down.embed_documents.return_value = [[]]
+    with pytest.raises(ValueError):
+        build_segment(_docs("two"), ["1"], down)
+
+    wider = MagicMock()
+    wider.embed_documents.return_value = [[1.0, 2.0, 3.0, 4.0]]
+    with pytest.raises(ValueError):
+        publish_segment(index_path, build_segment(_docs("two"), ["1"], wider))
+
+    assert read_manifest(index_path)["segments"] == ["seg_000000"]
+    assert load_user_vector_store(index_path, fake_embeddings).similarity_search("one", k=1)[0].page_content == "one"